@@ -1,156 +1,308 @@
 import pandas as pd
 import numpy as np
+from functools import reduce
 
-def analyze_client_recommendations(input_file='final_result.csv', output_file='assumptions.csv'):
+from schema import TIME_FEATURE_COLUMNS, COHORT_FEATURE_COLUMNS
+from reader import read_csv_file, write_csv
+from report import as_reporter
+
+# Category groups used by the recommendation rules
+TRAVEL_CATEGORIES = ['Путешествия', 'Отели', 'Такси']
+HOME_CATEGORIES = ['Едим дома', 'Смотрим дома', 'Играем дома']
+JEWELRY_CATEGORIES = ['Ювелирные украшения', 'Ювелирные']
+
+# avg_monthly_balance_KZT band edges: savings deposit / accumulation deposit / gold bars
+BALANCE_BANDS = (400000, 750000, 1200000)
+
+# Spending above this qualifies for the premium card regardless of balance
+PREMIUM_SPENDING_CUTOFF = 10000000
+
+# A balance ranked above this percentile of the client's (city, status, age band)
+# cohort, i.e. in its top decile, also qualifies for the premium card, whatever
+# its absolute size. Strictly above: in a cohort of 10 only the top client qualifies
+PREMIUM_COHORT_PERCENTILE = 90
+
+# Currency exchanges within the last 30 days (fx_events_30d from time_features.py)
+# that qualify for the exchange product even below the 3-month FX threshold
+RECENT_FX_EVENTS = 2
+
+# Offered when no rule fires
+DEFAULT_PRODUCT = 'Стандартные продукты'
+
+# Products the rules can recommend, in the order they are listed in assumption_products
+PRODUCTS = [
+    'Карта для путешествий',
+    'Кредитная карта',
+    'Кредит наличными',
+    'Инвестиции',
+    'Депозит сберегательный',
+    'Депозит накопительный',
+    'Золотые слитки',
+    'Депозит Мультивалютный',
+    'Обмен валют',
+    'Премиальная карта'
+]
+
+# Columns of the score matrix: every rule product plus the default
+RANKED_PRODUCTS = PRODUCTS + [DEFAULT_PRODUCT]
+
+# Score of a product when its rule fires; the best-scoring alternative is offered.
+# Descending in list order, so the pick matches the first listed alternative.
+PRODUCT_WEIGHTS = {
+    'Карта для путешествий': 10,
+    'Кредитная карта': 9,
+    'Кредит наличными': 8,
+    'Инвестиции': 7,
+    'Депозит сберегательный': 6,
+    'Депозит накопительный': 5,
+    'Золотые слитки': 4,
+    'Депозит Мультивалютный': 3,
+    'Обмен валют': 2,
+    'Премиальная карта': 1,
+    DEFAULT_PRODUCT: 0.5
+}
+
+# Offered when the only recommended product is the one the client already has
+FALLBACK_PRODUCT = 'Кредит наличными'
+
+# Number of ranked alternatives written per client
+TOP_ALTERNATIVES = 3
+
+def client_features(df):
+    """
+    Reduce the joined feature table to one row of rule inputs per client.
+    
+    A client's categories are weighted by abs(total) of the rows they appear
+    in; the 5 heaviest (ties in column order) count as the client's top 5.
+    
+    Args:
+        df (pd.DataFrame): Contents of final_result.csv
+    
+    Returns:
+        pd.DataFrame: Per-client rule inputs, sorted by client_code
+    """
+    
+    df = df.reset_index(drop=True)
+    
+    # Balance, flags and name come from the client's first row
+    first_rows = df.drop_duplicates('client_code', keep='first').set_index('client_code').sort_index()
+    # Time-window and cohort features (per client, so any row will do) when the joiner added them
+    extra_columns = [col for col in TIME_FEATURE_COLUMNS[1:] + COHORT_FEATURE_COLUMNS[1:] if col in df.columns]
+    features = first_rows[['name', 'avg_monthly_balance_KZT', 'loan_p_o', 'have_fx', 'currency_count'] + extra_columns].copy()
+    features['spending'] = df['total'].abs().groupby(df['client_code']).sum()
+    
+    # Primary product: most frequent, first seen wins ties
+    product_counts = df.groupby(['client_code', 'product'], sort=False).size().reset_index(name='count')
+    product_counts = product_counts.sort_values(['client_code', 'count'], ascending=[True, False], kind='stable')
+    features['product'] = product_counts.drop_duplicates('client_code').set_index('client_code')['product']
+    
+    # Long format: one row per (row, category column), weighted by abs(total)
+    category_columns = [f'category_{i}' for i in range(1, 6) if f'category_{i}' in df.columns]
+    categories = df[['client_code'] + category_columns].melt(id_vars='client_code', var_name='column', value_name='category',
+                                                             ignore_index=False)
+    categories['weight'] = df['total'].abs().reindex(categories.index).to_numpy()
+    categories['position'] = categories.index * len(category_columns) + categories['column'].map(
+        {col: i for i, col in enumerate(category_columns)})
+    categories = categories.dropna(subset=['category'])
+    
+    totals = categories.groupby(['client_code', 'category'], sort=False).agg(
+        weight=('weight', 'sum'), position=('position', 'min')).reset_index()
+    totals = totals.sort_values(['client_code', 'weight', 'position'], ascending=[True, False, True], kind='stable')
+    top_5 = totals[totals.groupby('client_code').cumcount() < 5]
+    
+    def count_in(frame, group):
+        return frame['category'].isin(group).groupby(frame['client_code']).sum()
+    
+    features['travel_count'] = count_in(top_5, TRAVEL_CATEGORIES)
+    features['home_count'] = count_in(top_5, HOME_CATEGORIES)
+    # Jewelry counts anywhere in the client's categories, not only the top 5
+    features['has_jewelry'] = count_in(totals, JEWELRY_CATEGORIES) > 0
+    
+    features[['travel_count', 'home_count']] = features[['travel_count', 'home_count']].fillna(0)
+    features['has_jewelry'] = features['has_jewelry'].fillna(False).astype(bool)
+    
+    return features.reset_index()
+
+def product_rules(travel_count, home_count, has_jewelry, loan_p_o, have_fx, currency_count, balance, spending,
+                  balance_bands=BALANCE_BANDS, spending_cutoff=PREMIUM_SPENDING_CUTOFF, balance_percentile=None,
+                  cohort_percentile=PREMIUM_COHORT_PERCENTILE, fx_events_30d=None,
+                  recent_fx_events=RECENT_FX_EVENTS):
+    """
+    Evaluate every recommendation rule at once.
+    
+    All arguments are arrays (or scalars) that broadcast against each other,
+    so the same rules serve one client table or a whole grid of scenarios.
+    balance_percentile is the balance rank within the client's cohort from
+    cohorts.py; None (or NaN for a client) leaves the cohort rule out.
+    fx_events_30d is the recent FX count from time_features.py, with the
+    same None/NaN handling for the recent-exchange rule.
+    
+    Returns:
+        dict: Product -> boolean array, in PRODUCTS order
+    """
+    
+    low_band, mid_band, high_band = balance_bands
+    have_fx = np.asarray(have_fx) == 1
+    
+    savings_band = (balance > low_band) & (balance <= mid_band)
+    accumulation_band = (balance > mid_band) & (balance <= high_band)
+    
+    # NaN compares False, so unranked clients only get the absolute rules
+    top_of_cohort = False
+    if balance_percentile is not None:
+        top_of_cohort = np.asarray(balance_percentile, dtype=float) > cohort_percentile
+    
+    recent_fx = False
+    if fx_events_30d is not None:
+        recent_fx = np.asarray(fx_events_30d, dtype=float) >= recent_fx_events
+    
+    return {
+        'Карта для путешествий': np.asarray(travel_count) >= 2,
+        'Кредитная карта': np.asarray(home_count) >= 2,
+        'Кредит наличными': np.asarray(loan_p_o) == 1,
+        'Инвестиции': savings_band | accumulation_band,
+        'Депозит сберегательный': savings_band,
+        'Депозит накопительный': accumulation_band,
+        'Золотые слитки': (balance > high_band) | has_jewelry,
+        'Депозит Мультивалютный': have_fx | (np.asarray(currency_count) > 1),
+        'Обмен валют': have_fx | recent_fx,
+        'Премиальная карта': (balance > mid_band) | (spending > spending_cutoff) | top_of_cohort
+    }
+
+def score_matrix(rules, weights=None):
+    """
+    Clients x products score matrix from fired rules.
+    
+    Args:
+        rules (dict): Output of product_rules for N clients
+        weights (dict): Product -> weight (default: PRODUCT_WEIGHTS)
+    
+    Returns:
+        np.ndarray: N x len(RANKED_PRODUCTS) scores, 0 where a rule did not fire
+    """
+    
+    if weights is None:
+        weights = PRODUCT_WEIGHTS
+    
+    fired = np.column_stack([rules[product] for product in PRODUCTS])
+    # The default product only scores when nothing else fired
+    fired = np.column_stack([fired, ~fired.any(axis=1)])
+    
+    return fired * np.array([weights[product] for product in RANKED_PRODUCTS], dtype=float)
+
+def rank_alternatives(scores, current_products, top_n=TOP_ALTERNATIVES):
+    """
+    Best alternatives per client: a masked argmax that never offers the
+    product the client already has.
+    
+    Args:
+        scores (np.ndarray): Output of score_matrix
+        current_products (array-like): Each client's current product
+        top_n (int): Number of alternatives to return
+    
+    Returns:
+        tuple: (N x top_n product names, N x top_n scores); slots without a
+               scoring alternative hold '' and 0
+    """
+    
+    names = np.array(RANKED_PRODUCTS, dtype=object)
+    is_current = np.asarray(current_products, dtype=object)[:, None] == names[None, :]
+    masked = np.where(is_current, 0, scores)
+    
+    # Stable sort: equal scores keep the order of RANKED_PRODUCTS
+    order = np.argsort(-masked, axis=1, kind='stable')[:, :top_n]
+    top_scores = np.take_along_axis(masked, order, axis=1)
+    top_names = np.where(top_scores > 0, names[order], '')
+    
+    return top_names, top_scores
+
+def analyze_client_recommendations(input_file='final_result.csv', output_file='assumptions.csv', df=None, reporter=None):
     """
     Analyzes client data and generates product recommendations based on specified rules.
+    
+    The rules are evaluated for all clients at once into a score matrix; the
+    output lists the recommended products, the best alternative to the
+    client's current product and the top alternatives with their scores.
+    
+    Args:
+        input_file (str): Joined feature table from joiner.py
+        output_file (str): Output CSV; None only returns the recommendations
+        df (pd.DataFrame): The feature table itself, instead of input_file
+        reporter (Reporter): Where messages go (default: console)
+    
+    Returns:
+        pd.DataFrame: One row per client with the fired products, the recommended
+            product and the top alternatives with their scores
     """
     
+    reporter = as_reporter(reporter)
+    
     # Read the CSV file
-    df = pd.read_csv(input_file)
+    if df is None:
+        df = read_csv_file(input_file)
     
-    # Initialize results list
-    results = []
+    features = client_features(df)
+    balance = features['avg_monthly_balance_KZT'].to_numpy(dtype=float)
     
-    # Group by client to analyze each client's data
-    grouped = df.groupby('client_code')
+    rules = product_rules(
+        features['travel_count'].to_numpy(),
+        features['home_count'].to_numpy(),
+        features['has_jewelry'].to_numpy(),
+        features['loan_p_o'].to_numpy(),
+        features['have_fx'].to_numpy(),
+        features['currency_count'].to_numpy(),
+        balance,
+        features['spending'].to_numpy(),
+        balance_percentile=features['balance_percentile'].to_numpy() if 'balance_percentile' in features.columns else None,
+        fx_events_30d=features['fx_events_30d'].to_numpy() if 'fx_events_30d' in features.columns else None
+    )
+    scores = score_matrix(rules)
+    top_names, top_scores = rank_alternatives(scores, features['product'].to_numpy())
     
-    for client_code, client_data in grouped:
-        # Get client name (assuming it's consistent for each client)
-        client_name = client_data.iloc[0]['name']
-        
-        # Get unique values for the client
-        avg_monthly_balance = client_data.iloc[0]['avg_monthly_balance_KZT']
-        loan_p_o = client_data.iloc[0]['loan_p_o']
-        have_fx = client_data.iloc[0]['have_fx']
-        currency_count = client_data.iloc[0]['currency_count']
-        
-        # Initialize recommendations list for this client
-        recommendations = []
-        
-        # Analyze top 5 categories by total amount
-        category_totals = {}
-        
-        # Process categories for each row
-        for _, row in client_data.iterrows():
-            # Check all category columns (category_1 to category_5)
-            for i in range(1, 6):
-                cat_col = f'category_{i}'
-                if cat_col in row and pd.notna(row[cat_col]):
-                    category = row[cat_col]
-                    if category not in category_totals:
-                        category_totals[category] = 0
-                    category_totals[category] += abs(row['total'])
-        
-        # Sort categories by total amount and get top 5
-        sorted_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_5_categories = [cat[0] for cat in sorted_categories]
-        
-        # Rule 1: Check for Travel/Hotel/Taxi categories
-        travel_categories = ['Путешествия', 'Отели', 'Такси']
-        travel_count = sum(1 for cat in top_5_categories if cat in travel_categories)
-        
-        if travel_count >= 2:
-            recommendations.append('Карта для путешествий')
-        
-        # Rule 2: Check for Home Entertainment categories
-        home_categories = ['Едим дома', 'Смотрим дома', 'Играем дома']
-        home_count = sum(1 for cat in top_5_categories if cat in home_categories)
-        
-        if home_count >= 2:
-            recommendations.append('Кредитная карта')
-        
-        # Rule 3: Check loan_p_o
-        if loan_p_o == 1:
-            recommendations.append('Кредит наличными')
-        
-        # Rule 4-6: Check avg_monthly_balance_KZT
-        if 400000 < avg_monthly_balance <= 750000:
-            recommendations.append('Инвестиции')
-            recommendations.append('Депозит сберегательный')
-        elif 750000 < avg_monthly_balance <= 1200000:
-            recommendations.append('Инвестиции')
-            recommendations.append('Депозит накопительный')
-        elif avg_monthly_balance > 1200000:
-            recommendations.append('Золотые слитки')
-        
-        # Check for jewelry in categories (additional condition for gold bars)
-        jewelry_categories = ['Ювелирные украшения', 'Ювелирные']
-        has_jewelry = any(cat in category_totals for cat in jewelry_categories)
-        
-        if has_jewelry and 'Золотые слитки' not in recommendations:
-            recommendations.append('Золотые слитки')
-        
-        # Rule 7: Check have_fx
-        if have_fx == 1:
-            recommendations.append('Депозит Мультивалютный')
-            recommendations.append('Обмен валют')
-        
-        # Rule 8: Check currency_count
-        if currency_count > 1:
-            if 'Депозит Мультивалютный' not in recommendations:
-                recommendations.append('Депозит Мультивалютный')
-        
-        # Check if client qualifies for premium card based on balance or spending
-        total_spending = client_data['total'].abs().sum()
-        if avg_monthly_balance > 750000 or total_spending > 10000000:
-            if 'Премиальная карта' not in recommendations:
-                recommendations.append('Премиальная карта')
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_recommendations = []
-        for item in recommendations:
-            if item not in seen:
-                seen.add(item)
-                unique_recommendations.append(item)
-        
-        # Prepare the result
-        if unique_recommendations:
-            assumption_products = ', '.join(unique_recommendations)
-        else:
-            assumption_products = 'Стандартные продукты'
-        
-        # Get the primary product (most used)
-        product_counts = client_data['product'].value_counts()
-        primary_product = product_counts.index[0] if not product_counts.empty else ''
-        
-        results.append({
-            'client_code': client_code,
-            'name': client_name,
-            'product': primary_product,
-            'assumption_products': assumption_products
-        })
+    # Comma-separated list of every fired product, in PRODUCTS order
+    fired = scores > 0
+    listed = reduce(np.char.add, [np.where(fired[:, i], product + ', ', '') for i, product in enumerate(RANKED_PRODUCTS)])
+    assumption_products = np.char.rstrip(listed.astype(str), ', ')
+    
+    result_df = pd.DataFrame({
+        'client_code': features['client_code'],
+        'name': features['name'],
+        'product': features['product'],
+        'assumption_products': assumption_products,
+        # Nothing left to offer but the current product: fall back to a cash loan
+        'recommended_product': np.where(top_scores[:, 0] > 0, top_names[:, 0], FALLBACK_PRODUCT)
+    })
+    for i in range(top_names.shape[1]):
+        result_df[f'alternative_{i + 1}'] = top_names[:, i]
+        result_df[f'score_{i + 1}'] = top_scores[:, i]
     
-    # Create DataFrame from results
-    result_df = pd.DataFrame(results)
+    # Recent behaviour and cohort standing next to the recommendation, for review of the rule outcomes;
+    # fx_events_30d feeds the exchange rule and balance_percentile the premium card rule
+    for col in TIME_FEATURE_COLUMNS[1:] + COHORT_FEATURE_COLUMNS[1:]:
+        if col in features.columns:
+            result_df[col] = features[col].to_numpy()
     
     # Sort by client_code
     result_df = result_df.sort_values('client_code')
     
     # Save to CSV
-    result_df.to_csv(output_file, index=False, encoding='utf-8-sig')
-    
-    print(f"Analysis complete! Results saved to {output_file}")
-    print(f"Total clients analyzed: {len(results)}")
+    if output_file:
+        write_csv(result_df, output_file)
+        reporter.info(f"Analysis complete! Results saved to {output_file}")
+    reporter.info(f"Total clients analyzed: {len(result_df)}")
     
     # Display first few rows as preview
-    print("\nPreview of recommendations:")
-    print(result_df.head(10).to_string())
+    preview_columns = ['client_code', 'name', 'product', 'assumption_products', 'recommended_product']
+    reporter.detail(lambda: f"\nPreview of recommendations:\n{result_df[preview_columns].head(10).to_string()}")
     
     # Display statistics
-    print("\nRecommendation Statistics:")
-    all_recommendations = []
-    for r in results:
-        if r['assumption_products'] != 'Стандартные продукты':
-            all_recommendations.extend(r['assumption_products'].split(', '))
-    
-    from collections import Counter
-    rec_counts = Counter(all_recommendations)
-    
-    print("\nMost recommended products:")
-    for product, count in rec_counts.most_common():
-        print(f"  {product}: {count} clients")
+    reporter.info("\nRecommendation Statistics:")
+    rec_counts = pd.Series(fired[:, :len(PRODUCTS)].sum(axis=0), index=PRODUCTS)
+    rec_counts = rec_counts[rec_counts > 0].sort_values(ascending=False, kind='stable')
+    
+    reporter.info("\nMost recommended products:")
+    for product, count in rec_counts.items():
+        reporter.info(f"  {product}: {count} clients")
     
     return result_df
 
@@ -0,0 +1,295 @@
+"""
+Backfill recommendations over many rolling 3-month windows.
+
+The raw files are parsed once. Rows are sorted by (group, date) and turned
+into prefix sums; the totals of every group in every window are then the
+difference of two prefix sums found by binary search, for all windows at
+once. Each window's tables are written in the pipeline's file formats and
+run through the usual join, assumptions and finalres steps, one worker
+process per window.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import sys
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from schema import TRANSACTIONS_SCHEMA, TRANSFERS_SCHEMA, CLIENTS_SCHEMA
+from reader import read_table, write_csv
+from plan import Scan, Filter, Project, execute
+from time_features import event_keys, CLIENT_KEY_STRIDE
+from client_analyzer import DEFAULT_EXCLUDED_CATEGORIES, top_categories_table
+from transfer_analyzer import EXCHANGE_RATES, FX_TRANSACTION_THRESHOLD, LOAN_PAYMENT_THRESHOLD
+from cohorts import COHORT_CLIENT_COLUMNS, compute_cohort_features
+from joiner import join_client_features
+from assumptions import analyze_client_recommendations
+from finalres import process_assumptions
+
+# Length of every window, like the *_3m.csv snapshots
+WINDOW_MONTHS = 3
+
+def backfill_plan(transactions_folder, transfers_folder):
+    """Plan for the backfill: every dated transaction and transfer, once"""
+    return {
+        'transactions': Project(Filter(Scan(transactions_folder, TRANSACTIONS_SCHEMA), [('amount', 'notna', None)]),
+                                ['client_code', 'name', 'date', 'category', 'amount', 'currency']),
+        'transfers': Project(Scan(transfers_folder, TRANSFERS_SCHEMA),
+                             ['client_code', 'name', 'product', 'date', 'type', 'direction', 'amount', 'currency'])
+    }
+
+def window_bounds(end_dates, months=WINDOW_MONTHS):
+    """
+    Start (inclusive) and end (exclusive) of the window ending on each date.
+
+    A window ending on 2025-08-31 covers 2025-06-01 00:00 up to and
+    including the whole of 2025-08-31.
+    """
+
+    ends = pd.DatetimeIndex(pd.to_datetime(end_dates)).normalize() + pd.Timedelta(days=1)
+    starts = ends - pd.DateOffset(months=months)
+
+    return starts.to_numpy(dtype='datetime64[s]'), ends.to_numpy(dtype='datetime64[s]')
+
+def grouped_window_sums(df, keys, values, starts, ends):
+    """
+    Totals of value columns per group and window, from one prefix sum that
+    restarts at every group, so a group's totals do not depend on the rows
+    of the groups sorted before it.
+
+    Args:
+        df (pd.DataFrame): Rows with a 'date' column
+        keys (list): Grouping columns
+        values (dict): Output name -> numeric array aligned with df
+        starts (np.ndarray): Window starts (inclusive), datetime64[s]
+        ends (np.ndarray): Window ends (exclusive), datetime64[s]
+
+    Returns:
+        tuple: (groups DataFrame of the keys, dict name -> groups x windows
+               totals, groups x windows row counts)
+    """
+
+    grouped = df.groupby(keys, observed=True, sort=True)
+    group_index = grouped.ngroup().to_numpy()
+    groups = grouped.size().reset_index()[keys]
+
+    # One sort by (group, date), then per-group prefix sums of every value column
+    event_key = event_keys(group_index, df['date'])
+    order = np.argsort(event_key, kind='stable')
+    event_key = event_key[order]
+
+    matrix = pd.DataFrame({name: np.asarray(column, dtype=float)[order] for name, column in values.items()})
+    prefix = matrix.groupby(group_index[order], sort=False).cumsum().to_numpy()
+    if len(prefix) == 0:
+        prefix = np.zeros((1, len(values)))
+
+    # Every (group, window) pair is two binary searches
+    base = np.arange(len(groups), dtype=np.int64)[:, None] * CLIENT_KEY_STRIDE
+    lo = np.searchsorted(event_key, base + starts.astype(np.int64)[None, :], side='left')
+    hi = np.searchsorted(event_key, base + ends.astype(np.int64)[None, :], side='left')
+    group_start = np.searchsorted(event_key, base, side='left')
+
+    # Prefix up to the window's last row, minus the group's rows before the window
+    has_rows = (hi > lo)[:, :, None]
+    upto_end = np.where(has_rows, prefix[np.maximum(hi - 1, 0)], 0.0)
+    before_start = np.where(has_rows & (lo > group_start)[:, :, None], prefix[np.maximum(lo - 1, 0)], 0.0)
+    totals = upto_end - before_start
+
+    return groups, {name: totals[:, :, i] for i, name in enumerate(values)}, hi - lo
+
+def window_tables(transactions, transfers, starts, ends, excluded_categories):
+    """
+    Per-window inputs of the pipeline, for all windows together.
+
+    Returns:
+        list: One dict per window with the 'people', 'spending' and
+              'transfers' tables that client_analyzer and transfer_analyzer
+              would have built from that window's rows, and the
+              'cohort_spending' per client and category that cohorts.py
+              ranks (over every category, excluded ones included)
+    """
+
+    # Transactions: per person, per (person, currency) and per (person, category)
+    people, _, people_count = grouped_window_sums(transactions, ['client_code', 'name'],
+                                                  {'rows': np.ones(len(transactions))}, starts, ends)
+    currencies, _, currency_count = grouped_window_sums(transactions, ['client_code', 'name', 'currency'],
+                                                        {'rows': np.ones(len(transactions))}, starts, ends)
+    spending_rows = transactions[~transactions['category'].isin(excluded_categories)]
+    spending, spending_sums, spending_count = grouped_window_sums(spending_rows, ['client_code', 'name', 'category'],
+                                                                  {'amount': spending_rows['amount']}, starts, ends)
+    category_totals, category_sums, category_count = grouped_window_sums(transactions, ['client_code', 'category'],
+                                                                         {'amount': transactions['amount']}, starts, ends)
+
+    # Transfers in KZT, like transfer_analyzer
+    amount_kzt = transfers['amount'] * transfers['currency'].astype(str).map(EXCHANGE_RATES).fillna(1)
+    summary, transfer_sums, transfer_count = grouped_window_sums(transfers, ['client_code', 'name', 'product'], {
+        'in': amount_kzt.where(transfers['direction'] == 'in', 0),
+        'out': amount_kzt.where(transfers['direction'] == 'out', 0),
+        'fx': transfers['type'].isin(['fx_buy', 'fx_sell']),
+        'loan': transfers['type'] == 'loan_payment_out'
+    }, starts, ends)
+
+    tables = []
+    for w in range(len(starts)):
+        active = currency_count[:, w] > 0
+        window_currencies = currencies[active].astype({'currency': str})
+        per_person = window_currencies.groupby(['client_code', 'name'], sort=True)['currency']
+
+        window_people = people[people_count[:, w] > 0].copy()
+        window_people['transaction_count'] = people_count[people_count[:, w] > 0, w]
+        window_people = window_people.merge(per_person.size().rename('currency_count').reset_index(),
+                                            on=['client_code', 'name'], how='left')
+        window_people = window_people.merge(per_person.agg(lambda c: ', '.join(sorted(c))).rename('currencies').reset_index(),
+                                            on=['client_code', 'name'], how='left')
+
+        active = spending_count[:, w] > 0
+        window_spending = spending[active].copy()
+        window_spending['amount'] = spending_sums['amount'][active, w]
+        window_spending['transaction_count'] = spending_count[active, w]
+
+        active = transfer_count[:, w] > 0
+        window_summary = summary[active].astype({'product': str}).copy()
+        window_summary['in'] = np.round(transfer_sums['in'][active, w], 2)
+        window_summary['out'] = np.round(transfer_sums['out'][active, w], 2)
+        window_summary['total'] = np.round(transfer_sums['in'][active, w] - transfer_sums['out'][active, w], 2)
+        window_summary['have_fx'] = (np.round(transfer_sums['fx'][active, w]) >= FX_TRANSACTION_THRESHOLD).astype(int)
+        window_summary['loan_p_o'] = (np.round(transfer_sums['loan'][active, w]) >= LOAN_PAYMENT_THRESHOLD).astype(int)
+
+        active = category_count[:, w] > 0
+        window_category_totals = category_totals[active].copy()
+        window_category_totals['amount'] = category_sums['amount'][active, w]
+
+        tables.append({'people': window_people, 'spending': window_spending, 'transfers': window_summary,
+                       'cohort_spending': window_category_totals})
+
+    return tables
+
+def run_window(output_dir, tables, clients_path):
+    """
+    Write one window's intermediate tables and run the downstream steps on them.
+
+    Runs in a worker process; everything the steps print goes to run.log in
+    the window's folder.
+
+    Returns:
+        dict: Window folder and number of clients recommended for
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    categories_path = os.path.join(output_dir, 'top5_categories_analysis.csv')
+    transfers_path = os.path.join(output_dir, 'transfer_summary.csv')
+    cohorts_path = os.path.join(output_dir, 'cohort_features.csv')
+    final_path = os.path.join(output_dir, 'final_result.csv')
+    assumptions_path = os.path.join(output_dir, 'assumptions.csv')
+    recommendations_path = os.path.join(output_dir, 'recommendations.csv')
+
+    with open(os.path.join(output_dir, 'run.log'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        if tables['people'].empty or tables['transfers'].empty:
+            print("No transactions or transfers in this window")
+            return {'output_dir': output_dir, 'clients': 0}
+
+        # Same file formats as client_analyzer and transfer_analyzer
+        write_csv(top_categories_table(tables['people'], tables['spending']).sort_values(['client_code', 'name']),
+                  categories_path)
+        write_csv(tables['transfers'].sort_values('client_code'), transfers_path)
+
+        # Cohort ranks of this window's spend, so the cohort rule sees what a run on the window would
+        clients = read_table(clients_path, CLIENTS_SCHEMA, COHORT_CLIENT_COLUMNS)
+        cohort_features, _ = compute_cohort_features(clients, tables['cohort_spending'])
+        write_csv(cohort_features, cohorts_path)
+
+        if join_client_features(categories_path, transfers_path, clients_path, final_path,
+                                time_features_path=None, cohort_features_path=cohorts_path) is None:
+            return {'output_dir': output_dir, 'clients': 0}
+
+        analyze_client_recommendations(final_path, assumptions_path)
+        recommendations = process_assumptions(assumptions_path, recommendations_path)
+
+    return {'output_dir': output_dir, 'clients': len(recommendations)}
+
+def backfill(end_dates, output_root='backfill', transactions_folder='Transactions', transfers_folder='Transfers',
+             clients_path='clients.csv', excluded_categories=None, workers=None):
+    """
+    Recompute the recommendations for the 3-month windows ending on each date.
+
+    Args:
+        end_dates (list): Last day of every window
+        output_root (str): Folder that receives one sub-folder per window
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        clients_path (str): Path to the client attributes CSV
+        excluded_categories (list): Categories left out of the top 5
+        workers (int): Worker processes for the per-window steps
+
+    Returns:
+        pd.DataFrame: One row per window with its bounds, row and client counts
+    """
+
+    if excluded_categories is None:
+        excluded_categories = DEFAULT_EXCLUDED_CATEGORIES
+
+    # One window per day: a repeated end date would write the same folder from two workers
+    end_dates = sorted(set(pd.DatetimeIndex(pd.to_datetime(end_dates)).normalize()))
+    starts, ends = window_bounds(end_dates)
+    print(f"Backfilling {len(end_dates)} windows of {WINDOW_MONTHS} months")
+
+    # Parse every file once
+    outputs = execute(backfill_plan(transactions_folder, transfers_folder))
+    transactions = outputs['transactions'].dropna(subset=['date'])
+    transfers = outputs['transfers'].dropna(subset=['date', 'amount'])
+    print(f"Loaded {len(transactions)} transactions and {len(transfers)} transfers")
+
+    tables = window_tables(transactions, transfers, starts, ends, list(excluded_categories))
+
+    # Rows per window, from the sorted dates alone
+    transaction_dates = np.sort(transactions['date'].to_numpy(dtype='datetime64[s]'))
+    transfer_dates = np.sort(transfers['date'].to_numpy(dtype='datetime64[s]'))
+
+    def rows_in_windows(dates):
+        return np.searchsorted(dates, ends, side='left') - np.searchsorted(dates, starts, side='left')
+
+    output_dirs = [os.path.join(output_root, end.strftime('%Y-%m-%d')) for end in end_dates]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run_window, output_dirs, tables, [clients_path] * len(tables)))
+
+    summary_df = pd.DataFrame({
+        'window_end': [end.strftime('%Y-%m-%d') for end in end_dates],
+        'window_start': pd.DatetimeIndex(starts).strftime('%Y-%m-%d'),
+        'transactions': rows_in_windows(transaction_dates),
+        'transfers': rows_in_windows(transfer_dates),
+        'clients': [result['clients'] for result in results],
+        'output_dir': [result['output_dir'] for result in results]
+    })
+
+    os.makedirs(output_root, exist_ok=True)
+    write_csv(summary_df, os.path.join(output_root, 'windows.csv'))
+
+    print(f"\nWindows saved under: {output_root}")
+    print(summary_df.to_string(index=False))
+
+    return summary_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute recommendations for rolling 3-month windows")
+    parser.add_argument('end_dates', nargs='*', help="last day of each window, e.g. 2025-07-31 2025-08-31")
+    parser.add_argument('--monthly', nargs=2, metavar=('FIRST', 'LAST'),
+                        help="every month end from FIRST to LAST, e.g. --monthly 2024-09-30 2025-08-31")
+    parser.add_argument('--output', default='backfill', help="output folder (default: backfill)")
+    parser.add_argument('--workers', type=int, help="worker processes for the per-window steps")
+    args = parser.parse_args()
+
+    end_dates = list(args.end_dates)
+    if args.monthly:
+        end_dates += list(pd.date_range(args.monthly[0], args.monthly[1], freq='ME'))
+
+    if not end_dates:
+        parser.error("give at least one window end date or --monthly FIRST LAST")
+
+    try:
+        backfill(end_dates, args.output, workers=args.workers)
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
+        sys.exit(1)
@@ -1,230 +1,435 @@
 import pandas as pd
+import numpy as np
 import os
-import glob
-from collections import defaultdict
+import json
+import argparse
 
-def analyze_transaction_categories(folder_path, excluded_categories=None, output_file='top5_categories_analysis.csv'):
+from schema import TRANSACTIONS_SCHEMA
+from reader import find_files, read_tables, source_size, read_csv_file, write_csv
+from plan import Scan, Filter, Aggregate, execute, execute_partitioned, optimize, explain
+from spill import parse_memory_limit, format_bytes, record_stats
+from report import as_reporter
+
+# Everyday categories almost every client has; excluded so the top 5 says something
+DEFAULT_EXCLUDED_CATEGORIES = ['Продукты питания', 'Кафе и рестораны']
+
+# Coverage preview: clients drawn, file-size strata they are drawn from, and the file name
+# of the sample, kept next to the transactions folder (its strata go in a .json beside it)
+COVERAGE_SAMPLE_SIZE = 500
+COVERAGE_STRATA = 4
+COVERAGE_SAMPLE_FILE = 'category_sample.csv'
+
+# Normal quantile of the 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+def join_currencies(currencies):
+    """Comma-separated list of the distinct currencies, sorted"""
+    return ', '.join(sorted(currencies.unique()))
+
+def category_plan(folder_path, excluded_categories):
+    """
+    Plan for the top 5 analysis: per-person currencies over all transactions
+    and per-person category totals over the non-excluded ones.
+    """
+    
+    transactions = Filter(Scan(folder_path, TRANSACTIONS_SCHEMA), [('amount', 'notna', None)])
+    
+    return {
+        'people': Aggregate(transactions, ['client_code', 'name'], {
+            'transaction_count': ('amount', 'size'),
+            'currency_count': ('currency', 'nunique'),
+            'currencies': ('currency', join_currencies)
+        }),
+        'spending': Aggregate(
+            Filter(transactions, [('category', 'not in', list(excluded_categories))]),
+            ['client_code', 'name', 'category'],
+            {'amount': ('amount', 'sum'), 'transaction_count': ('amount', 'size')}
+        )
+    }
+
+def top_categories_table(people, spending):
+    """
+    Combine per-person currencies and category totals into the output rows.
+    
+    Args:
+        people (pd.DataFrame): client_code, name, currency_count, currencies
+        spending (pd.DataFrame): client_code, name, category, amount
+    
+    Returns:
+        pd.DataFrame: One row per person with category_1 ... category_5
+    """
+    
+    # Rank each person's categories by total amount (ties stay alphabetical)
+    spending = spending.sort_values(['client_code', 'name', 'amount'], ascending=[True, True, False], kind='stable')
+    spending['rank'] = spending.groupby(['client_code', 'name']).cumcount() + 1
+    top_spending = spending[spending['rank'] <= 5].astype({'category': str})
+    
+    # One row per person with the top 5 categories side by side
+    top_categories = top_spending.pivot(index=['client_code', 'name'], columns='rank', values='category')
+    top_categories = top_categories.reindex(columns=range(1, 6))
+    top_categories.columns = [f'category_{i}' for i in range(1, 6)]
+    
+    # People with only excluded categories get empty category columns
+    results_df = people.merge(top_categories.reset_index(), on=['client_code', 'name'], how='left')
+    category_columns = list(top_categories.columns)
+    results_df[category_columns] = results_df[category_columns].fillna('')
+    
+    return results_df[['client_code', 'name'] + category_columns + ['currency_count', 'currencies']]
+
+def analyze_transaction_categories(folder_path, excluded_categories=None, output_file='top5_categories_analysis.csv',
+                                   memory_limit=None, run_stats=None, reporter=None):
     """
     Analyze transaction data to find top 5 spending categories for each person.
     
     Args:
         folder_path (str): Path to folder containing CSV files
         excluded_categories (list): List of categories to exclude from analysis
-        output_file (str): Name of output CSV file
+        output_file (str): Name of output CSV file; None only returns the table
+        memory_limit (int): Memory budget in bytes; larger inputs are spilled
+                            to disk and processed by client_code partition
+        run_stats (dict): Optional dict that receives partition, spill and
+                          peak memory figures
+        reporter (Reporter): Where messages and progress go (default: console)
+    
+    Returns:
+        pd.DataFrame: Top 5 categories per client, or None when there is no data
     """
     
+    reporter = as_reporter(reporter)
+    
     if excluded_categories is None:
-        excluded_categories = ['Продукты питания', 'Кафе и рестораны']
+        excluded_categories = DEFAULT_EXCLUDED_CATEGORIES
     
-    # Find all CSV files in the folder
-    csv_files = glob.glob(os.path.join(folder_path, "*.csv"))
+    if run_stats is None:
+        run_stats = {}
     
-    if not csv_files:
-        print(f"No CSV files found in {folder_path}")
-        return
-    
-    print(f"Found {len(csv_files)} CSV files:")
-    for file in csv_files:
-        print(f"  - {os.path.basename(file)}")
-    
-    # Read and combine all CSV files
-    all_transactions = []
-    
-    for file in csv_files:
-        try:
-            # Read CSV with flexible encoding handling
-            try:
-                df = pd.read_csv(file, encoding='utf-8')
-            except UnicodeDecodeError:
-                df = pd.read_csv(file, encoding='cp1251')  # Common for Russian text
-            except:
-                df = pd.read_csv(file, encoding='latin-1')
-            
-            print(f"Loaded {len(df)} transactions from {os.path.basename(file)}")
-            all_transactions.append(df)
-            
-        except Exception as e:
-            print(f"Error reading {file}: {str(e)}")
-            continue
+    # Find all transaction files in the folder
+    csv_files = find_files(folder_path, TRANSACTIONS_SCHEMA)
     
-    if not all_transactions:
-        print("No valid transaction data found!")
+    if not csv_files:
+        reporter.info(f"No CSV files found in {folder_path}")
         return
     
-    # Combine all dataframes
-    combined_df = pd.concat(all_transactions, ignore_index=True)
-    
-    # Clean column names (remove extra spaces)
-    combined_df.columns = combined_df.columns.str.strip()
+    reporter.info(f"Found {len(csv_files)} CSV files")
+    reporter.detail(lambda: '\n'.join(f"  - {os.path.basename(file)}" for file in csv_files))
     
-    print(f"\nTotal transactions loaded: {len(combined_df)}")
-    print(f"Columns found: {list(combined_df.columns)}")
+    # Describe what is needed; the plan pushes the column selection and the
+    # category exclusion down into the file reader
+    plan = category_plan(folder_path, excluded_categories)
+    reporter.detail(lambda: f"\nOptimized plan:\n{explain(optimize(plan))}")
     
-    # Ensure required columns exist
-    required_columns = ['client_code', 'name', 'category', 'amount', 'currency']
-    missing_columns = [col for col in required_columns if col not in combined_df.columns]
+    # Under a memory limit the clients are processed one hash partition at a time
+    partial_results = []
+    total_transactions = 0
+    filtered_transactions = 0
     
-    if missing_columns:
-        print(f"Warning: Missing columns: {missing_columns}")
-        print("Available columns:", list(combined_df.columns))
+    try:
+        for partition, outputs in enumerate(execute_partitioned(plan, memory_limit, run_stats), 1):
+            people = outputs['people']
+            spending = outputs['spending']
+            reporter.progress('client_analyzer', partition, run_stats['partitions'])
+            
+            if people.empty:
+                continue
+            
+            total_transactions += people['transaction_count'].sum()
+            filtered_transactions += spending['transaction_count'].sum()
+            partial_results.append(top_categories_table(people, spending))
+    except Exception as e:
+        reporter.error(f"Error reading transactions: {str(e)}", e)
         return
     
-    # Clean and prepare data
-    combined_df['amount'] = pd.to_numeric(combined_df['amount'], errors='coerce')
-    combined_df = combined_df.dropna(subset=['amount'])
-    
-    # Remove excluded categories
-    print(f"\nExcluding categories: {excluded_categories}")
-    filtered_df = combined_df[~combined_df['category'].isin(excluded_categories)].copy()
+    reporter.skipped_files(run_stats)
     
-    print(f"Transactions after filtering: {len(filtered_df)}")
+    if not partial_results:
+        reporter.info("No valid transaction data found!")
+        return
     
-    # Group by person and analyze spending by category
-    results = []
-    people_with_no_categories = []
+    reporter.info(f"\nTotal transactions loaded: {total_transactions}")
+    reporter.info(f"\nExcluding categories: {excluded_categories}")
+    reporter.info(f"Transactions after filtering: {filtered_transactions}")
     
-    # Group by client_code and name (from original data to get currencies)
-    all_person_groups = combined_df.groupby(['client_code', 'name'])
+    if run_stats.get('partitions', 1) > 1:
+        reporter.info(f"Processed {run_stats['partitions']} partitions, spilled {format_bytes(run_stats['spilled_bytes'])} to disk")
     
-    for (client_code, name), person_data in all_person_groups:
-        # Get unique currencies for this person (from all transactions)
-        currencies = person_data['currency'].unique()
-        currency_count = len(currencies)
-        currencies_str = ', '.join(sorted(currencies))
-        
-        # Get filtered data for this person (excluding categories)
-        person_filtered = filtered_df[
-            (filtered_df['client_code'] == client_code) & 
-            (filtered_df['name'] == name)
-        ]
-        
-        if len(person_filtered) == 0:
-            # This person only has excluded categories
-            people_with_no_categories.append(name)
-            result = {
-                'client_code': client_code,
-                'name': name,
-                'category_1': '',
-                'category_2': '',
-                'category_3': '',
-                'category_4': '',
-                'category_5': '',
-                'currency_count': currency_count,
-                'currencies': currencies_str
-            }
-        else:
-            # Group by category and sum amounts
-            category_spending = person_filtered.groupby('category')['amount'].sum().sort_values(ascending=False)
-            
-            # Get top 5 categories
-            top_categories = category_spending.head(5)
-            
-            # Create result row
-            result = {
-                'client_code': client_code,
-                'name': name,
-                'category_1': top_categories.index[0] if len(top_categories) > 0 else '',
-                'category_2': top_categories.index[1] if len(top_categories) > 1 else '',
-                'category_3': top_categories.index[2] if len(top_categories) > 2 else '',
-                'category_4': top_categories.index[3] if len(top_categories) > 3 else '',
-                'category_5': top_categories.index[4] if len(top_categories) > 4 else '',
-                'currency_count': currency_count,
-                'currencies': currencies_str
-            }
-        
-        results.append(result)
-
-    # Create results dataframe
-    results_df = pd.DataFrame(results)
+    results_df = pd.concat(partial_results, ignore_index=True)
+    people_with_no_categories = results_df.loc[results_df['category_1'] == '', 'name'].tolist()
     
     # Sort by client_code and name for consistent output
     results_df = results_df.sort_values(['client_code', 'name'])
     
     # Save to CSV
-    results_df.to_csv(output_file, index=False, encoding='utf-8-sig')
+    if output_file:
+        write_csv(results_df, output_file)
     
-    print(f"\nAnalysis complete!")
-    print(f"Found {len(results_df)} unique people")
-    print(f"Results saved to: {output_file}")
-    print(f"Columns: client_code, name, category_1, category_2, category_3, category_4, category_5, currency_count, currencies")
+    reporter.info(f"\nAnalysis complete!")
+    reporter.info(f"Found {len(results_df)} unique people")
+    if output_file:
+        reporter.info(f"Results saved to: {output_file}")
+    reporter.info(f"Columns: client_code, name, category_1, category_2, category_3, category_4, category_5, currency_count, currencies")
     
     # Display summary
-    print(f"\nSummary:")
-    print(f"- Total people analyzed: {len(results_df)}")
-    print(f"- People with non-excluded categories: {len(results_df) - len(people_with_no_categories)}")
-    print(f"- People with only excluded categories: {len(people_with_no_categories)}")
-    print(f"- Categories excluded: {len(excluded_categories)}")
+    reporter.info(f"\nSummary:")
+    reporter.info(f"- Total people analyzed: {len(results_df)}")
+    reporter.info(f"- People with non-excluded categories: {len(results_df) - len(people_with_no_categories)}")
+    reporter.info(f"- People with only excluded categories: {len(people_with_no_categories)}")
+    reporter.info(f"- Categories excluded: {len(excluded_categories)}")
     
     if people_with_no_categories:
-        print(f"\nPeople with only excluded categories ({len(people_with_no_categories)}):")
-        for name in people_with_no_categories[:10]:  # Show first 10
-            print(f"  - {name}")
-        if len(people_with_no_categories) > 10:
-            print(f"  ... and {len(people_with_no_categories) - 10} more")
+        reporter.detail(lambda: '\n'.join(
+            [f"\nPeople with only excluded categories ({len(people_with_no_categories)}):"] +
+            [f"  - {name}" for name in people_with_no_categories[:10]] +  # Show first 10
+            ([f"  ... and {len(people_with_no_categories) - 10} more"] if len(people_with_no_categories) > 10 else [])
+        ))
     
     # Show sample of results
-    print(f"\nFirst 5 results with top 5 categories each:")
-    print(results_df.head().to_string(index=False))
+    reporter.detail(lambda: f"\nFirst 5 results with top 5 categories each:\n{results_df.head().to_string(index=False)}")
     
     return results_df
 
-def analyze_category_coverage(folder_path, excluded_categories=None):
+def coverage_sample_path(folder_path):
+    """Where the coverage sample of a transactions folder is kept: next to the folder, whatever the working directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(folder_path)), COVERAGE_SAMPLE_FILE)
+
+def sample_signature(folder_path, files):
+    """Input files (relative to the folder) and their sizes; a new sample is drawn when they change"""
+    return [[os.path.relpath(file, folder_path), source_size(file)] for file in files]
+
+def build_coverage_sample(folder_path, sample_file=None, sample_size=COVERAGE_SAMPLE_SIZE,
+                          strata=COVERAGE_STRATA, seed=0):
+    """
+    Draw a stratified sample of clients for the coverage preview and save it.
+
+    Files are per client, so clients are sampled by file. Files are split
+    into strata of similar size (a proxy for the number of transactions) and
+    each stratum is sampled in proportion to its share of the files. Only the
+    per-client category counts of the sample are kept: they are saved as a
+    CSV, and the strata and input signature in a JSON file beside it.
+
+    Args:
+        folder_path (str): Path to folder containing CSV files
+        sample_file (str): Where the sample is saved (default: next to the folder)
+        sample_size (int): Number of clients to draw
+        strata (int): Number of file-size strata
+        seed (int): Random seed, for a reproducible sample
+
+    Returns:
+        dict: The saved sample
+    """
+
+    if sample_file is None:
+        sample_file = coverage_sample_path(folder_path)
+
+    files = find_files(folder_path, TRANSACTIONS_SCHEMA)
+    signature = sample_signature(folder_path, files)
+    sizes = np.array([size for _, size in signature], dtype=np.int64)
+
+    # Equal-count strata over the files ordered by size
+    ranks = np.argsort(np.argsort(sizes, kind='stable'), kind='stable')
+    stratum = ranks * min(strata, len(files)) // max(len(files), 1)
+
+    rng = np.random.default_rng(seed)
+    population = np.bincount(stratum)
+    # Proportional allocation, at least 2 clients per stratum for a variance estimate
+    allocation = np.minimum(population, np.maximum(2, np.round(sample_size * population / len(files)).astype(int)))
+    chosen = np.sort(np.concatenate([
+        rng.choice(np.flatnonzero(stratum == h), size=allocation[h], replace=False) for h in range(len(population))
+    ]))
+
+    sampled_files = [files[i] for i in chosen]
+    counts = []
+    for position, (_, df) in enumerate(read_tables(sampled_files, TRANSACTIONS_SCHEMA, ['category'])):
+        file_counts = df['category'].astype(object).value_counts(dropna=False).rename_axis('category').reset_index()
+        file_counts.insert(0, 'sample', position)
+        counts.append(file_counts)
+
+    sample = {
+        'signature': signature,
+        'sample_size': sample_size,
+        'stratum': stratum[chosen],
+        'population': population,
+        'counts': pd.concat(counts, ignore_index=True) if counts else pd.DataFrame(columns=['sample', 'category', 'count'])
+    }
+
+    write_csv(sample['counts'], sample_file)
+    with open(os.path.splitext(sample_file)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'sample_size': sample_size, 'stratum': sample['stratum'].tolist(),
+                   'population': population.tolist()}, f, ensure_ascii=False)
+
+    return sample
+
+def load_coverage_sample(folder_path, sample_file=None, sample_size=COVERAGE_SAMPLE_SIZE, reporter=None):
+    """Load the saved coverage sample, drawing a new one when the input files or the size changed"""
+
+    reporter = as_reporter(reporter)
+
+    if sample_file is None:
+        sample_file = coverage_sample_path(folder_path)
+    strata_file = os.path.splitext(sample_file)[0] + '.json'
+
+    if os.path.exists(sample_file) and os.path.exists(strata_file):
+        with open(strata_file, encoding='utf-8') as f:
+            saved = json.load(f)
+        files = find_files(folder_path, TRANSACTIONS_SCHEMA)
+        if saved['sample_size'] == sample_size and saved['signature'] == sample_signature(folder_path, files):
+            return {
+                'signature': saved['signature'],
+                'sample_size': saved['sample_size'],
+                'stratum': np.array(saved['stratum'], dtype=int),
+                'population': np.array(saved['population'], dtype=int),
+                # Empty category cells are transactions without a category
+                'counts': read_csv_file(sample_file, keep_default_na=False, na_values=[''])
+            }
+
+    reporter.info(f"Drawing a new coverage sample into {sample_file}...")
+    return build_coverage_sample(folder_path, sample_file, sample_size)
+
+def stratified_total(values, stratum, population):
+    """
+    Estimate population totals from a stratified sample.
+
+    Args:
+        values (np.ndarray): Sampled clients x measures
+        stratum (np.ndarray): Stratum of every sampled client
+        population (np.ndarray): Number of clients in every stratum
+
+    Returns:
+        tuple: (estimated totals, standard errors) per measure
+    """
+
+    total = np.zeros(values.shape[1])
+    variance = np.zeros(values.shape[1])
+
+    for h, size in enumerate(population):
+        rows = values[stratum == h]
+        n = len(rows)
+        if n == 0:
+            continue
+
+        total += size * rows.mean(axis=0)
+        if n > 1:
+            # Finite population correction: a fully sampled stratum adds no error
+            variance += size ** 2 * (1 - n / size) * rows.var(axis=0, ddof=1) / n
+
+    return total, np.sqrt(variance)
+
+def preview_category_coverage(folder_path, excluded_categories, sample_file=None,
+                              sample_size=COVERAGE_SAMPLE_SIZE, reporter=None):
+    """
+    Coverage and category frequencies estimated from the saved sample.
+
+    Returns:
+        dict: Estimates with 95% confidence intervals
+    """
+
+    reporter = as_reporter(reporter)
+
+    sample = load_coverage_sample(folder_path, sample_file, sample_size, reporter)
+    stratum, population = sample['stratum'], sample['population']
+    total_people = int(population.sum())
+
+    if total_people == 0 or len(stratum) == 0:
+        return None
+
+    # Sampled clients x categories transaction counts
+    table = sample['counts'].pivot_table(index='sample', columns='category', values='count', aggfunc='sum',
+                                         fill_value=0, dropna=False).reindex(range(len(stratum)), fill_value=0)
+    counts = table.to_numpy(dtype=float)
+    categories = table.columns.to_numpy()
+
+    # Missing categories are not in the excluded list, so they count as covered
+    excluded = np.array([category in excluded_categories for category in categories], dtype=bool)
+    covered = (counts[:, ~excluded].sum(axis=1) > 0).astype(float)[:, None]
+
+    covered_total, covered_se = stratified_total(covered, stratum, population)
+    coverage = covered_total[0] / total_people * 100
+    margin = CONFIDENCE_Z * covered_se[0] / total_people * 100
+
+    named = pd.notna(categories)
+    frequency_total, frequency_se = stratified_total(counts[:, named], stratum, population)
+    frequency = pd.DataFrame({
+        'estimated_count': frequency_total.round(),
+        'ci_low': np.maximum(frequency_total - CONFIDENCE_Z * frequency_se, 0).round(),
+        'ci_high': (frequency_total + CONFIDENCE_Z * frequency_se).round()
+    }, index=pd.Index(categories[named], name='category')).astype(int)
+    frequency = frequency.sort_values('estimated_count', ascending=False, kind='stable')
+
+    reporter.info(f"\nCategory Coverage Analysis (preview from {len(stratum)} of {total_people} clients):")
+    reporter.info(f"Total people: {total_people}")
+    reporter.info(f"People with non-excluded categories: ~{covered_total[0]:.0f}")
+    reporter.info(f"People with only excluded categories: ~{total_people - covered_total[0]:.0f}")
+    reporter.info(f"Coverage: {coverage:.1f}% (95% CI {max(coverage - margin, 0):.1f}% - {min(coverage + margin, 100):.1f}%)")
+
+    reporter.detail(lambda: f"\nCategory frequency (all transactions, estimated with 95% CI):\n{frequency.head(10).to_string()}")
+
+    return {
+        'total_people': total_people,
+        'people_with_data': float(covered_total[0]),
+        'coverage_percent': coverage,
+        'coverage_ci': (float(max(coverage - margin, 0)), float(min(coverage + margin, 100))),
+        'sampled_people': len(stratum),
+        'category_frequency': frequency
+    }
+
+def analyze_category_coverage(folder_path, excluded_categories=None, exact=False,
+                              sample_file=None, sample_size=COVERAGE_SAMPLE_SIZE, reporter=None):
     """
     Analyze how many people would have empty results if we exclude certain categories.
     This helps you decide which categories to exclude.
+
+    By default the figures are estimated from a saved stratified sample of
+    clients, so trying another exclusion list is instant; exact=True loads
+    every transaction instead. Messages go to `reporter` (default: console).
     """
+    reporter = as_reporter(reporter)
+    
     if excluded_categories is None:
-        excluded_categories = ['Продукты питания', 'Кафе и рестораны']
+        excluded_categories = DEFAULT_EXCLUDED_CATEGORIES
     
-    csv_files = glob.glob(os.path.join(folder_path, "*.csv"))
+    csv_files = find_files(folder_path, TRANSACTIONS_SCHEMA)
     
     if not csv_files:
-        print(f"No CSV files found in {folder_path}")
+        reporter.info(f"No CSV files found in {folder_path}")
         return
     
-    all_transactions = []
-    
-    for file in csv_files:
-        try:
-            try:
-                df = pd.read_csv(file, encoding='utf-8')
-            except UnicodeDecodeError:
-                df = pd.read_csv(file, encoding='cp1251')
-            except:
-                df = pd.read_csv(file, encoding='latin-1')
-            
-            all_transactions.append(df)
-            
-        except Exception as e:
-            continue
+    if not exact:
+        return preview_category_coverage(folder_path, excluded_categories, sample_file, sample_size, reporter)
+    
+    transactions = Scan(folder_path, TRANSACTIONS_SCHEMA)
+    plan = {
+        'people': Aggregate(transactions, ['client_code', 'name'], {'transaction_count': ('category', 'size')}),
+        'covered': Aggregate(
+            Filter(transactions, [('category', 'not in', list(excluded_categories))]),
+            ['client_code', 'name'],
+            {'transaction_count': ('category', 'size')}
+        ),
+        'categories': Aggregate(transactions, ['category'], {'count': ('client_code', 'size')})
+    }
     
-    if not all_transactions:
+    scan_stats = {}
+    try:
+        outputs = execute(plan, scan_stats)
+    except Exception as e:
+        reporter.error(f"Error reading transactions: {str(e)}", e)
         return
     
-    combined_df = pd.concat(all_transactions, ignore_index=True)
-    combined_df.columns = combined_df.columns.str.strip()
-    
-    # Get all unique people
-    all_people = combined_df.groupby(['client_code', 'name']).size().reset_index(name='transaction_count')
-    total_people = len(all_people)
+    reporter.skipped_files(scan_stats)
     
-    # Filter out excluded categories
-    filtered_df = combined_df[~combined_df['category'].isin(excluded_categories)]
+    total_people = len(outputs['people'])
+    people_with_data = len(outputs['covered'])
     
-    # Get people who still have categories after filtering
-    people_with_categories = filtered_df.groupby(['client_code', 'name']).size().reset_index(name='transaction_count')
-    people_with_data = len(people_with_categories)
+    if total_people == 0:
+        return
     
-    print(f"\nCategory Coverage Analysis:")
-    print(f"Total people: {total_people}")
-    print(f"People with non-excluded categories: {people_with_data}")
-    print(f"People with only excluded categories: {total_people - people_with_data}")
-    print(f"Coverage: {(people_with_data/total_people)*100:.1f}%")
+    reporter.info(f"\nCategory Coverage Analysis:")
+    reporter.info(f"Total people: {total_people}")
+    reporter.info(f"People with non-excluded categories: {people_with_data}")
+    reporter.info(f"People with only excluded categories: {total_people - people_with_data}")
+    reporter.info(f"Coverage: {(people_with_data/total_people)*100:.1f}%")
     
     # Show category distribution
-    print(f"\nCategory frequency (all transactions):")
-    category_counts = combined_df['category'].value_counts()
-    print(category_counts.head(10).to_string())
+    category_counts = outputs['categories'].set_index('category')['count'].sort_values(ascending=False, kind='stable')
+    reporter.detail(lambda: f"\nCategory frequency (all transactions):\n{category_counts.head(10).to_string()}")
     
     return {
         'total_people': total_people,
@@ -234,26 +439,45 @@ def analyze_category_coverage(folder_path, excluded_categories=None):
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top 5 spending categories per client")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    parser.add_argument('--exclude', nargs='*', help="categories to exclude (default: %(default)s)",
+                        default=DEFAULT_EXCLUDED_CATEGORIES)
+    parser.add_argument('--coverage-only', action='store_true',
+                        help="only preview the coverage of the excluded categories from the saved sample")
+    parser.add_argument('--exact', action='store_true', help="with --coverage-only, use every transaction")
+    args = parser.parse_args()
+    
     # Set your folder path here
     folder_path = "Transactions"  # Change this to your actual folder path
     
     # You can customize excluded categories
-    excluded_categories = ['Продукты питания', 'Кафе и рестораны']
+    excluded_categories = list(args.exclude)
+    
+    if args.coverage_only:
+        analyze_category_coverage(folder_path, excluded_categories, exact=args.exact)
+        raise SystemExit(0)
     
-    # First, let's see what categories exist in your data
+    # First, let's see what categories exist in your data; the analysis below
+    # reads every transaction anyway, so the exact figures are used here
     print("=== Category Coverage Analysis ===")
-    analyze_category_coverage(folder_path, excluded_categories)
+    analyze_category_coverage(folder_path, excluded_categories, exact=True)
     
     print("\n" + "="*50)
     print("=== Running Top 5 Categories Analysis ===")
     
     # Run the analysis
+    run_stats = {}
     try:
         results = analyze_transaction_categories(
             folder_path=folder_path,
             excluded_categories=excluded_categories,
-            output_file='top5_categories_analysis.csv'
+            output_file='top5_categories_analysis.csv',
+            memory_limit=parse_memory_limit(args.memory_limit),
+            run_stats=run_stats
         )
+        record_stats(args.stats_file, 'client_analyzer', run_stats)
         
         if results is not None:
             print(f"\n✅ Analysis completed successfully!")
@@ -0,0 +1,216 @@
+"""
+Cohort-relative features: where a client stands among similar clients.
+
+Clients are grouped into cohorts by city, status and age band from
+clients.csv. Within its cohort every client gets the percentile rank of its
+average balance, its total spend and its spend in every category, so the
+rules can tell a large balance for the cohort from a large balance overall.
+
+All ranks come from one sort. Every (client, metric) value is keyed by its
+(cohort, metric) group and a single lexsort orders the values within their
+groups; group sizes and the ends of runs of equal values then follow from
+comparing neighbours. There are no loops over cohorts or metrics.
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+
+from schema import TRANSACTIONS_SCHEMA, CLIENTS_SCHEMA
+from plan import Scan, Filter, Aggregate, execute_partitioned, optimize, explain
+from reader import read_table, write_csv
+from spill import parse_memory_limit, format_bytes, record_stats
+from report import as_reporter
+
+# Lower edges of the age bands after the first one
+AGE_BANDS = (25, 35, 45, 55)
+
+# Cohorts with fewer clients get no ranks: a percentile among a handful of peers says little
+MIN_COHORT_SIZE = 10
+
+# Only these columns are read from the client attributes
+COHORT_CLIENT_COLUMNS = ['client_code', 'status', 'age', 'city', 'avg_monthly_balance_KZT']
+
+def age_band(age, bands=AGE_BANDS):
+    """Band label of every age, e.g. '25-34' (empty for missing ages)"""
+
+    labels = np.array([f'<{bands[0]}'] + [f'{low}-{high - 1}' for low, high in zip(bands, bands[1:])] +
+                      [f'{bands[-1]}+'], dtype=object)
+    age = np.asarray(age, dtype=float)
+    return np.where(np.isnan(age), '', labels[np.searchsorted(np.asarray(bands), np.nan_to_num(age), side='right')])
+
+def cohort_plan(transactions_folder):
+    """Plan for the spend figures: per-client category totals"""
+
+    transactions = Filter(Scan(transactions_folder, TRANSACTIONS_SCHEMA), [('amount', 'notna', None)])
+    return {'spending': Aggregate(transactions, ['client_code', 'category'], {'amount': ('amount', 'sum')})}
+
+def grouped_percentile_ranks(groups, values):
+    """
+    Percentile rank of every value within its group.
+
+    The rank is the share of the group's values that are less than or equal
+    to the value, in percent, so tied values share the higher rank and the
+    largest value of a group ranks 100. Missing values are not ranked and do
+    not count towards the group size.
+
+    Args:
+        groups (np.ndarray): Integer group id of every value
+        values (np.ndarray): Values to rank
+
+    Returns:
+        np.ndarray: Percentile ranks in (0, 100], NaN for missing values
+    """
+
+    ranks = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return ranks
+
+    # One sort: by group, then by value within the group
+    order = valid[np.lexsort((values[valid], groups[valid]))]
+    sorted_groups, sorted_values = groups[order], values[order]
+
+    # Start and size of every group
+    new_group = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    group_starts = np.flatnonzero(new_group)
+    group_sizes = np.diff(np.r_[group_starts, len(order)])
+    group_start = np.repeat(group_starts, group_sizes)
+    group_size = np.repeat(group_sizes, group_sizes)
+
+    # Last position of every run of equal values, which all of the run share
+    new_run = new_group | np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.r_[run_starts, len(order)])
+    run_last = np.repeat(run_starts + run_lengths - 1, run_lengths)
+
+    ranks[order] = (run_last - group_start + 1) / group_size * 100
+    return ranks
+
+def compute_cohort_features(clients, spending, min_cohort_size=MIN_COHORT_SIZE):
+    """
+    Percentile ranks of balance, total spend and category spend within cohorts.
+
+    Args:
+        clients (pd.DataFrame): client_code, status, age, city, avg_monthly_balance_KZT
+        spending (pd.DataFrame): client_code, category, amount (one row per pair)
+        min_cohort_size (int): Smaller cohorts get NaN ranks
+
+    Returns:
+        tuple: (per-client features, per-client and category spend with its rank)
+    """
+
+    clients = clients.drop_duplicates('client_code').sort_values('client_code').reset_index(drop=True)
+    client_codes = clients['client_code'].to_numpy()
+
+    cohort = (clients['city'].astype(str) + ' / ' + clients['status'].astype(str) + ' / ' +
+              pd.Series(age_band(clients['age']), index=clients.index))
+    cohort_id, _ = pd.factorize(cohort)
+    cohort_size = np.bincount(cohort_id)[cohort_id]
+
+    # Dense clients x categories spend matrix, categories in name order; no spend in a category is 0
+    spending = spending[np.isin(spending['client_code'].to_numpy(), client_codes)]
+    category_id, categories = pd.factorize(spending['category'].astype(str), sort=True)
+    spend = np.zeros((len(client_codes), len(categories)))
+    np.add.at(spend, (np.searchsorted(client_codes, spending['client_code'].to_numpy()), category_id),
+              spending['amount'].to_numpy(dtype=float))
+
+    # Metric columns: balance, total spend, then one per category
+    metrics = np.column_stack([clients['avg_monthly_balance_KZT'].to_numpy(dtype=float), spend.sum(axis=1), spend])
+    num_metrics = metrics.shape[1]
+
+    groups = cohort_id[:, None].astype(np.int64) * num_metrics + np.arange(num_metrics)[None, :]
+    ranks = grouped_percentile_ranks(groups.ravel(), metrics.ravel()).reshape(metrics.shape)
+    ranks[cohort_size < min_cohort_size] = np.nan
+    ranks = np.round(ranks, 1)
+
+    features = pd.DataFrame({
+        'client_code': client_codes,
+        'cohort': cohort.to_numpy(),
+        'cohort_size': cohort_size,
+        'balance_percentile': ranks[:, 0],
+        'spend_percentile': ranks[:, 1]
+    })
+
+    category_ranks = pd.DataFrame({
+        'client_code': np.repeat(client_codes, len(categories)),
+        'category': np.tile(np.asarray(categories, dtype=object), len(client_codes)),
+        'amount': np.round(spend.ravel(), 2),
+        'spend_percentile': ranks[:, 2:].ravel()
+    })
+
+    return features, category_ranks
+
+def build_cohort_features(transactions_folder='Transactions', clients_path='clients.csv',
+                          output_file='cohort_features.csv', categories_file='cohort_category_percentiles.csv',
+                          memory_limit=None, run_stats=None, reporter=None):
+    """
+    Compute the cohort-relative features and save them.
+
+    The category totals are aggregated by client partition under the memory
+    limit; the ranking itself needs whole cohorts and runs once over the
+    per-client totals.
+
+    Args:
+        transactions_folder (str): Folder with per-client transaction CSVs
+        clients_path (str): Path to the client attributes CSV
+        output_file (str): Per-client features CSV; None skips it
+        categories_file (str): Per-client category spend ranks CSV; None skips it
+        memory_limit (int): Memory budget in bytes; larger inputs are spilled
+                            to disk and processed by client_code partition
+        run_stats (dict): Optional dict that receives partition, spill and
+                          peak memory figures
+        reporter (Reporter): Where messages and progress go (default: console)
+
+    Returns:
+        tuple: (per-client features, per-client category spend ranks)
+    """
+
+    reporter = as_reporter(reporter)
+
+    if run_stats is None:
+        run_stats = {}
+
+    plan = cohort_plan(transactions_folder)
+    reporter.detail(lambda: f"Optimized plan:\n{explain(optimize(plan))}")
+
+    spending_parts = []
+    for partition, outputs in enumerate(execute_partitioned(plan, memory_limit, run_stats), 1):
+        reporter.progress('cohorts', partition, run_stats['partitions'])
+        spending_parts.append(outputs['spending'])
+
+    reporter.skipped_files(run_stats)
+
+    if run_stats.get('partitions', 1) > 1:
+        reporter.info(f"Processed {run_stats['partitions']} partitions, spilled {format_bytes(run_stats['spilled_bytes'])} to disk")
+
+    clients = read_table(clients_path, CLIENTS_SCHEMA, COHORT_CLIENT_COLUMNS)
+    features_df, categories_df = compute_cohort_features(clients, pd.concat(spending_parts, ignore_index=True))
+
+    if output_file:
+        write_csv(features_df, output_file)
+        reporter.info(f"Cohort features saved to: {output_file}")
+    if categories_file:
+        write_csv(categories_df, categories_file)
+        reporter.info(f"Category spend ranks saved to: {categories_file}")
+
+    ranked = features_df['balance_percentile'].notna()
+    reporter.info(f"Clients: {len(features_df)} in {features_df['cohort'].nunique()} cohorts")
+    reporter.info(f"Clients in cohorts of at least {MIN_COHORT_SIZE} (ranked): {ranked.sum()}")
+    reporter.detail(lambda: f"\nLargest cohorts:\n{features_df['cohort'].value_counts().head().to_string()}")
+
+    return features_df, categories_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Percentile ranks of balance and spend within (city, status, age band) cohorts")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    args = parser.parse_args()
+
+    run_stats = {}
+    try:
+        build_cohort_features(memory_limit=parse_memory_limit(args.memory_limit), run_stats=run_stats)
+        record_stats(args.stats_file, 'cohorts', run_stats)
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
@@ -0,0 +1,500 @@
+"""
+Ingestion-time deduplication of the raw transaction and transfer files.
+
+Every row is reduced to a 64-bit hash of its identifying fields. The hashes
+live in a persistent on-disk hash index with one open-addressing table per
+client partition, memory-mapped so a lookup only touches the slots it
+probes: checking a row is O(1) and no history is loaded.
+
+The index remembers which file content first delivered each row. Files are
+known by a digest of their bytes, not by their path, so a renamed file keeps
+its rows. A row is a duplicate when an earlier row of the same file, or a
+file content that is still among the inputs, has the same hash; the rows of
+a content that is no longer delivered go to the next file that has them.
+A file whose bytes repeat an earlier file is a duplicate as a whole.
+
+The input files are never changed. The positions of the duplicate rows of
+every file are saved next to the index, and the shared reader leaves them
+out whenever a stage reads the file (see reader.dropped_rows). A dry run
+only looks rows up and leaves the index and the saved positions as they
+were.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import json
+import shutil
+import hashlib
+import argparse
+
+from schema import TRANSACTIONS_SCHEMA, TRANSFERS_SCHEMA
+from reader import (DEDUP_INDEX_DIR, DROPPED_ROWS_FILE, find_files, read_table, open_source,
+                    source_version)
+from spill import partition_of, record_stats
+from report import as_reporter
+
+# Fields that identify a row; name, product, status and city repeat the client
+TRANSACTION_KEY_COLUMNS = ['client_code', 'date', 'category', 'amount', 'currency']
+TRANSFER_KEY_COLUMNS = ['client_code', 'date', 'type', 'direction', 'amount', 'currency']
+
+# Number of client partitions of the index, and slots per partition table to start with
+INDEX_PARTITIONS = 16
+INITIAL_CAPACITY = 1024
+
+# Tables are doubled once they are more than half full, which keeps probe runs short
+MAX_LOAD_FACTOR = 0.5
+
+# Slot value of an empty slot; a row hash of 0 is stored as 1 instead
+EMPTY = np.uint64(0)
+
+# Bytes read at a time when computing the digest of a file
+DIGEST_BLOCK = 1024 * 1024
+
+def row_hashes(df, key_columns):
+    """64-bit hash of the identifying fields of every row"""
+
+    hashes = pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy()
+    return np.where(hashes == EMPTY, np.uint64(1), hashes)
+
+class HashIndex:
+    """
+    Persistent set of row hashes, partitioned by client, with the id of the
+    file content that first delivered each hash.
+
+    Each partition is a pair of memory-mapped arrays (hashes and owner
+    content ids) forming a linear-probing hash table. A JSON manifest holds
+    the content ids, the digests of the files seen so far and the size of
+    every table.
+
+    Use as a context manager; the manifest is saved on exit. A read-only
+    index never writes to disk: rows it has not seen are kept in memory
+    until the index is closed.
+    """
+
+    def __init__(self, directory, read_only=False):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.read_only = read_only
+        self.tables = {}
+        # (name, partition) -> sorted hashes and owners seen by a read-only index
+        self.unsaved = {}
+        # Owner ids whose content is among this run's inputs
+        self.live = np.zeros(1, dtype=bool)
+
+    def __enter__(self):
+        if not self.read_only:
+            os.makedirs(self.directory, exist_ok=True)
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+        for section in ['contents', 'sources', 'partitions']:
+            self.manifest.setdefault(section, {})
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.read_only:
+            self.unsaved = {}
+            return
+
+        for keys, owners in self.tables.values():
+            keys.flush()
+            owners.flush()
+        self.tables = {}
+
+        partial = self.manifest_path + '.partial'
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(partial, self.manifest_path)
+
+    def digest(self, source):
+        """Digest of the bytes of a source, recomputed only when the file changed"""
+
+        key = os.path.normpath(source)
+        version = source_version(source)
+        known = self.manifest['sources'].get(key)
+        if known is not None and known['version'] == version:
+            return known['digest']
+
+        digest = hashlib.sha1()
+        with open_source(source) as stream:
+            for block in iter(lambda: stream.read(DIGEST_BLOCK), b''):
+                digest.update(block)
+
+        self.manifest['sources'][key] = {'version': version, 'digest': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def content_id(self, digest):
+        """Stable id of a file content, assigned on first sight"""
+
+        contents = self.manifest['contents']
+        if digest not in contents:
+            contents[digest] = len(contents) + 1
+        return contents[digest]
+
+    def set_live(self, digests):
+        """Mark the contents still delivered; rows owned by any other content can be claimed again"""
+
+        ids = [self.content_id(digest) for digest in digests]
+        self.live = np.zeros(len(self.manifest['contents']) + 1, dtype=bool)
+        self.live[ids] = True
+
+    def is_live(self, owners):
+        return self.live[np.minimum(owners, len(self.live) - 1)] & (owners < len(self.live))
+
+    def path(self, name, partition, kind):
+        return os.path.join(self.directory, f"{name}_{partition:03d}.{kind}")
+
+    def open_table(self, name, partition, capacity=None):
+        """Memory-map one partition table, creating it empty when needed"""
+
+        info = self.manifest['partitions'].setdefault(f"{name}_{partition:03d}",
+                                                      {'capacity': INITIAL_CAPACITY, 'size': 0})
+        if capacity is not None:
+            info['capacity'] = capacity
+
+        mode = 'r+' if os.path.exists(self.path(name, partition, 'keys')) and capacity is None else 'w+'
+        keys = np.memmap(self.path(name, partition, 'keys'), dtype=np.uint64, mode=mode, shape=(info['capacity'],))
+        owners = np.memmap(self.path(name, partition, 'owners'), dtype=np.int32, mode=mode, shape=(info['capacity'],))
+
+        self.tables[(name, partition)] = (keys, owners)
+        return info, keys, owners
+
+    def table(self, name, partition):
+        if (name, partition) in self.tables:
+            return (self.manifest['partitions'][f"{name}_{partition:03d}"],) + self.tables[(name, partition)]
+        return self.open_table(name, partition)
+
+    def grow(self, name, partition, needed):
+        """Rehash a partition table into one big enough for `needed` entries"""
+
+        info, keys, owners = self.table(name, partition)
+        capacity = info['capacity']
+        while needed > capacity * MAX_LOAD_FACTOR:
+            capacity *= 2
+
+        if capacity == info['capacity']:
+            return
+
+        used = keys != EMPTY
+        old_keys, old_owners = np.array(keys[used]), np.array(owners[used])
+        del self.tables[(name, partition)]
+        del keys, owners
+
+        info['size'] = 0
+        self.open_table(name, partition, capacity)
+        self.insert(name, partition, old_keys, old_owners)
+
+    def lookup_or_insert(self, name, partition, hashes, owner):
+        """
+        Look up distinct hashes of one partition, inserting the missing ones.
+
+        Hashes owned by a content that is not live are handed to `owner`.
+
+        Args:
+            name (str): Index name (one per input format)
+            partition (int): Client partition of all the hashes
+            hashes (np.ndarray): Distinct uint64 row hashes
+            owner (int): Content id recorded for new and reclaimed hashes
+
+        Returns:
+            np.ndarray: Owner content id of every hash (`owner` for new ones)
+        """
+
+        info, _, _ = self.table(name, partition)
+        self.grow(name, partition, info['size'] + len(hashes))
+
+        return self.insert(name, partition, hashes, np.full(len(hashes), owner, dtype=np.int32), reclaim=True)
+
+    def insert(self, name, partition, hashes, new_owners, reclaim=False):
+        """
+        Linear probing for a batch of distinct hashes, all rows advancing
+        together; with `reclaim` an indexed hash whose owner is not live gets
+        the new owner.
+        """
+
+        info, keys, owners = self.table(name, partition)
+        mask = np.uint64(info['capacity'] - 1)
+
+        found = np.empty(len(hashes), dtype=np.int32)
+        pending = np.arange(len(hashes))
+        slots = hashes & mask
+
+        while len(pending):
+            slot_keys = keys[slots]
+
+            # Already indexed: report the stored owner, or take over one no longer delivered
+            hit = slot_keys == hashes[pending]
+            if reclaim:
+                stale = np.flatnonzero(hit)[~self.is_live(owners[slots[hit]])]
+                owners[slots[stale]] = new_owners[pending[stale]]
+            found[pending[hit]] = owners[slots[hit]]
+
+            # Empty slot: the first pending hash aiming at it claims it
+            empty = np.flatnonzero(slot_keys == EMPTY)
+            _, first = np.unique(slots[empty], return_index=True)
+            claim = empty[first]
+            keys[slots[claim]] = hashes[pending[claim]]
+            owners[slots[claim]] = new_owners[pending[claim]]
+            found[pending[claim]] = new_owners[pending[claim]]
+            info['size'] += len(claim)
+
+            # Everything else moves on to the next slot
+            done = hit.copy()
+            done[claim] = True
+            pending = pending[~done]
+            slots = (slots[~done] + np.uint64(1)) & mask
+
+        return found
+
+    def lookup(self, name, partition, hashes, owner):
+        """
+        Look up distinct hashes of one partition without changing the index.
+
+        Hashes missing from the index, or owned by a content that is not
+        live, and not seen by an earlier lookup are remembered in memory for
+        `owner`, so a dry run still finds rows repeated across the files it
+        checks.
+
+        Args:
+            name (str): Index name (one per input format)
+            partition (int): Client partition of all the hashes
+            hashes (np.ndarray): Distinct uint64 row hashes
+            owner (int): Content id reported for hashes seen for the first time
+
+        Returns:
+            np.ndarray: Owner content id of every hash (`owner` for new ones)
+        """
+
+        found = np.zeros(len(hashes), dtype=np.int32)
+
+        info = self.manifest['partitions'].get(f"{name}_{partition:03d}")
+        if info is not None and os.path.exists(self.path(name, partition, 'keys')):
+            keys = np.memmap(self.path(name, partition, 'keys'), dtype=np.uint64, mode='r', shape=(info['capacity'],))
+            owners = np.memmap(self.path(name, partition, 'owners'), dtype=np.int32, mode='r', shape=(info['capacity'],))
+            mask = np.uint64(info['capacity'] - 1)
+
+            # Same probing as insert, stopping at the first empty slot
+            pending = np.arange(len(hashes))
+            slots = hashes & mask
+            while len(pending):
+                slot_keys = keys[slots]
+                hit = slot_keys == hashes[pending]
+                found[pending[hit]] = owners[slots[hit]]
+
+                done = hit | (slot_keys == EMPTY)
+                pending = pending[~done]
+                slots = (slots[~done] + np.uint64(1)) & mask
+
+            found[~self.is_live(found)] = 0
+
+        # Hashes an earlier lookup of this run saw first
+        seen_keys, seen_owners = self.unsaved.get((name, partition), (np.empty(0, dtype=np.uint64),
+                                                                      np.empty(0, dtype=np.int32)))
+        missing = np.flatnonzero(found == 0)
+        if len(seen_keys) and len(missing):
+            positions = np.minimum(np.searchsorted(seen_keys, hashes[missing]), len(seen_keys) - 1)
+            hit = seen_keys[positions] == hashes[missing]
+            found[missing[hit]] = seen_owners[positions[hit]]
+            missing = missing[~hit]
+
+        found[missing] = owner
+        keys = np.concatenate([seen_keys, hashes[missing]])
+        order = np.argsort(keys, kind='stable')
+        self.unsaved[(name, partition)] = (keys[order], np.concatenate([seen_owners, found[missing]])[order])
+
+        return found
+
+def deduplicate_file(index, name, file_path, schema, key_columns, owner, dry_run=False):
+    """
+    Find the duplicate rows of one input file.
+
+    Args:
+        index (HashIndex): Open hash index
+        name (str): Index name of the file's format
+        file_path (str): Input file, as listed by find_files
+        schema (dict): Schema of the file
+        key_columns (list): Identifying fields
+        owner (int): Content id of the file
+        dry_run (bool): Only look rows up; the index is not changed
+
+    Returns:
+        tuple: (rows, duplicates within the file, duplicates of other files,
+               positions of all duplicate rows)
+    """
+
+    # The file as it is, so the positions match what every stage parses
+    df = read_table(file_path, schema, key_columns, drop_duplicates=False)
+
+    hashes = row_hashes(df, key_columns)
+    partitions = partition_of(df, INDEX_PARTITIONS)
+
+    # Repeats inside the file: keep the first occurrence
+    in_file = pd.Series(hashes).duplicated().to_numpy()
+
+    # Rows another delivered file content has first
+    from_other = np.zeros(len(df), dtype=bool)
+    for partition in np.unique(partitions[~in_file]):
+        rows = np.flatnonzero((partitions == partition) & ~in_file)
+        if dry_run:
+            owners = index.lookup(name, int(partition), hashes[rows], owner)
+        else:
+            owners = index.lookup_or_insert(name, int(partition), hashes[rows], owner)
+        from_other[rows] = owners != owner
+
+    return len(df), int(in_file.sum()), int(from_other.sum()), np.flatnonzero(in_file | from_other)
+
+def save_dropped_rows(index_dir, dropped):
+    """
+    Replace the saved duplicate positions of every input.
+
+    Args:
+        index_dir (str): Directory of the hash index
+        dropped (dict): Source -> row positions to leave out, or 'all'
+    """
+
+    folder = os.path.join(index_dir, 'dropped')
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    entries = {}
+    for number, (source, rows) in enumerate(sorted(dropped.items())):
+        entry = {'version': source_version(source), 'rows': rows}
+        if not isinstance(rows, str):
+            entry['rows'] = os.path.join('dropped', f"{number:06d}.npy")
+            np.save(os.path.join(index_dir, entry['rows']), rows)
+        entries[os.path.normpath(source)] = entry
+
+    # Written aside first so a crash keeps the old positions
+    path = os.path.join(index_dir, DROPPED_ROWS_FILE)
+    with open(path + '.partial', 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.partial', path)
+
+def deduplicate_inputs(transactions_folder='Transactions', transfers_folder='Transfers',
+                       index_dir=DEDUP_INDEX_DIR, dry_run=False, run_stats=None, reporter=None):
+    """
+    Find the duplicate transaction and transfer rows against the hash index.
+
+    The inputs are not changed; the duplicate positions are saved for the
+    reader, which leaves them out (the stages read them from the default
+    index directory).
+
+    Args:
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        index_dir (str): Directory of the persistent hash index
+        dry_run (bool): Report duplicates without changing the index or the
+                        saved duplicate positions
+        run_stats (dict): Optional dict that receives the duplicate counts
+        reporter (Reporter): Where messages and progress go (default: console)
+
+    Returns:
+        pd.DataFrame: Per-format rows, duplicates and files with duplicates
+    """
+
+    reporter = as_reporter(reporter)
+
+    if run_stats is None:
+        run_stats = {}
+
+    inputs = [
+        ('transactions', transactions_folder, TRANSACTIONS_SCHEMA, TRANSACTION_KEY_COLUMNS),
+        ('transfers', transfers_folder, TRANSFERS_SCHEMA, TRANSFER_KEY_COLUMNS)
+    ]
+    rows = []
+    dropped = {}
+
+    with HashIndex(index_dir, read_only=dry_run) as index:
+        # Digests of every input first: a content is live if any input still has it
+        digests = {}
+        for name, folder, schema, key_columns in inputs:
+            for file in find_files(folder, schema):
+                try:
+                    digests[file] = index.digest(file)
+                except Exception as e:
+                    reporter.error(f"Error reading {file}: {e} (file skipped)")
+        index.set_live(digests.values())
+
+        # The first file with a content holds its rows; later copies repeat it as a whole
+        holders = {}
+        for file, digest in digests.items():
+            holders.setdefault(digest, file)
+
+        for name, folder, schema, key_columns in inputs:
+            summary = {'input': name, 'files': 0, 'rows': 0, 'within_file': 0, 'across_files': 0,
+                       'files_with_duplicates': 0}
+
+            files = [file for file in find_files(folder, schema) if file in digests]
+            for done, file in enumerate(files, 1):
+                reporter.progress(f'dedup {name}', done, len(files))
+                owner = index.content_id(digests[file])
+                holder = holders[digests[file]]
+
+                try:
+                    if holder == file:
+                        total, in_file, from_other, positions = deduplicate_file(index, name, file, schema,
+                                                                                 key_columns, owner, dry_run)
+                    else:
+                        total = len(read_table(file, schema, ['client_code'], drop_duplicates=False))
+                        in_file, from_other, positions = 0, total, 'all'
+                except Exception as e:
+                    reporter.error(f"Error reading {file}: {e} (file skipped)")
+                    continue
+
+                summary['files'] += 1
+                summary['rows'] += total
+                summary['within_file'] += in_file
+                summary['across_files'] += from_other
+                if in_file or from_other:
+                    dropped[file] = positions
+                    summary['files_with_duplicates'] += 1
+                    if holder == file:
+                        reporter.detail(lambda: f"  - {os.path.basename(file)}: {in_file + from_other} duplicate rows")
+                    else:
+                        reporter.detail(lambda: f"  - {os.path.basename(file)}: same content as {os.path.basename(holder)}")
+
+            rows.append(summary)
+
+    if not dry_run:
+        save_dropped_rows(index_dir, dropped)
+
+    summary_df = pd.DataFrame(rows)
+    summary_df['duplicates'] = summary_df['within_file'] + summary_df['across_files']
+    duplicates = int(summary_df['duplicates'].sum())
+
+    if dry_run:
+        run_stats['duplicates_found'] = duplicates
+        reporter.info("\nDeduplication summary (dry run):")
+        reporter.info(summary_df.to_string(index=False))
+        reporter.info(f"\nDuplicates found (nothing saved): {duplicates}")
+    else:
+        run_stats['duplicates_dropped'] = duplicates
+        reporter.info("\nDeduplication summary:")
+        reporter.info(summary_df.to_string(index=False))
+        reporter.info(f"\nDuplicates dropped (input files unchanged, rows left out on reading): {duplicates}")
+
+    return summary_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop duplicate transaction and transfer rows across files and runs")
+    parser.add_argument('--dry-run', action='store_true', help="only report duplicates, do not save anything")
+    parser.add_argument('--reset', action='store_true', help="delete the hash index and start from scratch")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    args = parser.parse_args()
+
+    if args.reset and os.path.isdir(DEDUP_INDEX_DIR):
+        shutil.rmtree(DEDUP_INDEX_DIR)
+
+    run_stats = {}
+    try:
+        deduplicate_inputs(dry_run=args.dry_run, run_stats=run_stats)
+        record_stats(args.stats_file, 'dedup', run_stats)
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
@@ -0,0 +1,157 @@
+"""
+Delta of the recommendations against the previous run.
+
+The previous run is kept as a small binary file: one record per client with
+its client_code and 64-bit hashes of assumption_products and
+assumption_message, sorted by client_code. The current run is reduced to the
+same records and both sorted lists are merged in one linear pass, which
+yields the inserted, changed and removed clients. Only those rows go to the
+delta file, so downstream notifications scale with the changes.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import argparse
+
+from reader import read_csv_file, write_csv
+from report import as_reporter
+
+# Sorted per-client state of the last run
+STATE_FILE = 'recommendations_state.npy'
+DELTA_FILE = 'recommendations_delta.csv'
+
+STATE_DTYPE = np.dtype([('client_code', np.int64), ('products_hash', np.uint64), ('message_hash', np.uint64)])
+
+def text_hashes(values):
+    """Deterministic 64-bit hash of every string (missing values hash as empty)"""
+    return pd.util.hash_array(pd.Series(values, dtype=object).fillna('').astype(str).to_numpy(dtype=object))
+
+def current_state(assumptions_file='assumptions.csv', recommendations_file='recommendations.csv'):
+    """
+    Per-client records of the current run.
+
+    Returns:
+        tuple: (state array sorted by client_code, DataFrame with the rows
+               to publish, in the same order)
+    """
+
+    assumptions = read_csv_file(assumptions_file, usecols=['client_code', 'assumption_products'])
+    recommendations = read_csv_file(recommendations_file, usecols=['client_code', 'name', 'assumption_message'])
+
+    rows = recommendations.merge(assumptions, on='client_code', how='left')
+    rows = rows.drop_duplicates('client_code').sort_values('client_code', kind='stable').reset_index(drop=True)
+
+    state = np.empty(len(rows), dtype=STATE_DTYPE)
+    state['client_code'] = rows['client_code'].to_numpy()
+    state['products_hash'] = text_hashes(rows['assumption_products'])
+    state['message_hash'] = text_hashes(rows['assumption_message'])
+
+    return state, rows
+
+def load_state(state_file=STATE_FILE):
+    """State of the previous run (empty when there was none)"""
+
+    if not os.path.exists(state_file):
+        return np.empty(0, dtype=STATE_DTYPE)
+    return np.load(state_file)
+
+def save_state(state, state_file=STATE_FILE):
+    """Replace the saved state; written aside first so a crash keeps the old one"""
+
+    partial = state_file + '.partial'
+    with open(partial, 'wb') as f:
+        np.save(f, state)
+    os.replace(partial, state_file)
+
+def sorted_diff(previous, current):
+    """
+    Compare two client_code-sorted state arrays.
+
+    The two arrays are merged with a stable sort, which finds the two sorted
+    runs and merges them in linear time; a client present in both ends up
+    in two adjacent positions, previous first.
+
+    Returns:
+        tuple: Positions in `current` of inserted and changed clients, and
+               positions in `previous` of removed clients
+    """
+
+    keys = np.concatenate([previous['client_code'], current['client_code']])
+    from_current = np.concatenate([np.zeros(len(previous), dtype=bool), np.ones(len(current), dtype=bool)])
+    position = np.concatenate([np.arange(len(previous)), np.arange(len(current))])
+
+    order = np.argsort(keys, kind='stable')
+    keys, from_current, position = keys[order], from_current[order], position[order]
+
+    # A previous entry directly followed by the same client from the current run
+    paired = np.zeros(len(keys), dtype=bool)
+    paired[:-1] = (keys[:-1] == keys[1:]) & ~from_current[:-1] & from_current[1:]
+    paired_next = np.roll(paired, 1)
+
+    inserted = position[from_current & ~paired_next]
+    removed = position[~from_current & ~paired]
+
+    previous_positions = position[paired]
+    current_positions = position[np.flatnonzero(paired) + 1]
+    differs = ((previous['products_hash'][previous_positions] != current['products_hash'][current_positions]) |
+               (previous['message_hash'][previous_positions] != current['message_hash'][current_positions]))
+    changed = current_positions[differs]
+
+    return inserted, changed, removed
+
+def write_delta(assumptions_file='assumptions.csv', recommendations_file='recommendations.csv',
+                output_file=DELTA_FILE, state_file=STATE_FILE, reporter=None):
+    """
+    Write the clients whose recommendation is new, changed or gone since the last run.
+
+    Args:
+        assumptions_file (str): Output of assumptions.py
+        recommendations_file (str): Output of finalres.py
+        output_file (str): Delta CSV with a `change` column (inserted / changed / removed)
+        state_file (str): Sorted binary state of the previous run, replaced by this run's
+        reporter (Reporter): Where messages go (default: console)
+
+    Returns:
+        pd.DataFrame: The delta rows
+    """
+
+    reporter = as_reporter(reporter)
+
+    current, rows = current_state(assumptions_file, recommendations_file)
+    previous = load_state(state_file)
+
+    inserted, changed, removed = sorted_diff(previous, current)
+
+    delta_df = pd.concat([
+        rows.iloc[inserted].assign(change='inserted'),
+        rows.iloc[changed].assign(change='changed'),
+        pd.DataFrame({'client_code': previous['client_code'][removed], 'change': 'removed'})
+    ], ignore_index=True)
+    delta_df = delta_df[['change', 'client_code', 'name', 'assumption_products', 'assumption_message']]
+    delta_df = delta_df.sort_values('client_code', kind='stable')
+
+    write_csv(delta_df, output_file)
+    save_state(current, state_file)
+
+    reporter.info(f"Clients in this run: {len(current)} (previous run: {len(previous)})")
+    reporter.info(f"Inserted: {len(inserted)}")
+    reporter.info(f"Changed: {len(changed)}")
+    reporter.info(f"Removed: {len(removed)}")
+    reporter.info(f"Unchanged (not sent): {len(current) - len(inserted) - len(changed)}")
+    reporter.info(f"Delta saved to: {output_file}")
+
+    return delta_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommendations that changed since the previous run")
+    parser.add_argument('--reset', action='store_true', help="forget the previous run, so every client is inserted")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(STATE_FILE):
+        os.remove(STATE_FILE)
+
+    try:
+        write_delta()
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
@@ -2,18 +2,17 @@ import pandas as pd
 import random
 from datetime import datetime
 
+from reader import read_csv_file, write_csv
+from report import as_reporter, PROGRESS_EVERY
+from assumptions import FALLBACK_PRODUCT
+
 def load_data(filename='assumptions.csv'):
-    """Load CSV file with proper encoding"""
-    try:
-        # Try UTF-8 first
-        df = pd.read_csv(filename, encoding='utf-8')
-    except:
-        try:
-            # Try Windows-1251 (common for Russian text)
-            df = pd.read_csv(filename, encoding='windows-1251')
-        except:
-            # Try Latin-1 as fallback
-            df = pd.read_csv(filename, encoding='latin-1')
+    """Load CSV file in its detected encoding"""
+    return clean_data(read_csv_file(filename))
+
+def clean_data(df):
+    """Strip whitespace from the column names and string values"""
+    df = df.copy()
     
     # Clean column names
     df.columns = df.columns.str.strip()
@@ -43,7 +42,7 @@ def get_alternative_product(current_product, assumption_products):
     
     # If no alternatives, offer "Кредит наличными"
     if not alternatives:
-        return "Кредит наличными"
+        return FALLBACK_PRODUCT
     
     # Return the first alternative (or random choice)
     return alternatives[0]
@@ -103,26 +102,44 @@ def generate_message(name, product_type):
     
     return default_message
 
-def process_assumptions(input_file='assumptions.csv', output_file='recommendations.csv'):
-    """Main function to process assumptions and generate recommendations"""
+def process_assumptions(input_file='assumptions.csv', output_file='recommendations.csv', df=None, reporter=None):
+    """
+    Main function to process assumptions and generate recommendations
+    
+    Args:
+        input_file (str): Output of assumptions.py
+        output_file (str): Output CSV; None only returns the messages
+        df (pd.DataFrame): The assumptions table itself, instead of input_file
+        reporter (Reporter): Where messages and progress go (default: console)
     
-    print("Loading data...")
-    df = load_data(input_file)
+    Returns:
+        pd.DataFrame: client_code, name and assumption_message per row
+    """
     
-    print(f"Loaded {len(df)} records")
-    print(f"Columns: {df.columns.tolist()}")
+    reporter = as_reporter(reporter)
+    
+    if df is None:
+        reporter.info("Loading data...")
+        df = load_data(input_file)
+    else:
+        df = clean_data(df)
+    
+    reporter.info(f"Loaded {len(df)} records")
+    reporter.detail(lambda: f"Columns: {df.columns.tolist()}")
     
     # Prepare output data
     results = []
+    has_ranking = 'recommended_product' in df.columns
     
-    for index, row in df.iterrows():
+    for done, (index, row) in enumerate(df.iterrows(), 1):
         client_code = row['client_code']
         name = row['name']
-        current_product = row['product']
-        assumption_products = row['assumption_products']
         
-        # Get alternative product
-        recommended_product = get_alternative_product(current_product, assumption_products)
+        # assumptions.py ranks the alternatives; older files only have the product list
+        if has_ranking:
+            recommended_product = row['recommended_product']
+        else:
+            recommended_product = get_alternative_product(row['product'], row['assumption_products'])
         
         # Generate message
         message = generate_message(name, recommended_product)
@@ -134,18 +151,19 @@ def process_assumptions(input_file='assumptions.csv', output_file='recommendatio
             'assumption_message': message
         })
         
-        print(f"Processed client {client_code}: {name} -> {recommended_product}")
+        if done % PROGRESS_EVERY == 0 or done == len(df):
+            reporter.progress('finalres', done, len(df))
     
     # Create output DataFrame
     output_df = pd.DataFrame(results)
     
     # Save to CSV
-    output_df.to_csv(output_file, index=False, encoding='utf-8-sig')
-    print(f"\nResults saved to {output_file}")
+    if output_file:
+        write_csv(output_df, output_file)
+        reporter.info(f"\nResults saved to {output_file}")
     
     # Display first few results
-    print("\nFirst 5 recommendations:")
-    print(output_df.head().to_string())
+    reporter.detail(lambda: f"\nFirst 5 recommendations:\n{output_df.head().to_string()}")
     
     return output_df
 
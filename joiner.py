@@ -0,0 +1,403 @@
+import pandas as pd
+import numpy as np
+import os
+import argparse
+
+from schema import CLIENTS_SCHEMA, TIME_FEATURE_COLUMNS, COHORT_FEATURE_COLUMNS
+from reader import read_table, read_table_chunks, read_csv_file, write_csv
+from spill import (SpillPartitioner, partition_count, parse_memory_limit, format_bytes,
+                   peak_memory_bytes, record_stats)
+from report import as_reporter
+
+# Only the balance is taken from the client attributes
+BALANCE_COLUMNS = ['client_code', 'avg_monthly_balance_KZT']
+
+# Rows per chunk when streaming inputs into spill partitions
+CHUNK_ROWS = 100000
+
+def merge_join_indices(left_keys, right_keys, how='inner'):
+    """
+    Compute row indices of a sorted merge join between two key arrays.
+
+    Both key arrays must be sorted ascending. Every left key is located in the
+    right array with a binary search, so duplicate keys on either side are
+    expanded the same way a regular join would expand them.
+
+    Args:
+        left_keys (np.ndarray): Sorted join keys of the left table
+        right_keys (np.ndarray): Sorted join keys of the right table
+        how (str): 'inner' or 'left'
+
+    Returns:
+        tuple: (left_idx, right_idx) positional indices; for a left join
+               unmatched left rows get -1 as their right index
+    """
+
+    lo = np.searchsorted(right_keys, left_keys, side='left')
+    hi = np.searchsorted(right_keys, left_keys, side='right')
+    counts = hi - lo
+
+    if how == 'left':
+        # Keep unmatched left rows once, with no right partner
+        out_counts = np.maximum(counts, 1)
+    else:
+        out_counts = counts
+
+    left_idx = np.repeat(np.arange(len(left_keys)), out_counts)
+
+    # Position of each output row inside its left row's run of matches
+    run_start = np.cumsum(out_counts) - out_counts
+    within_run = np.arange(out_counts.sum()) - np.repeat(run_start, out_counts)
+    right_idx = np.repeat(lo, out_counts) + within_run
+
+    if how == 'left':
+        right_idx[np.repeat(counts == 0, out_counts)] = -1
+
+    return left_idx, right_idx
+
+def key_coverage(left_df, right_df, key='client_code'):
+    """
+    Report how well two tables cover each other on a join key.
+
+    Args:
+        left_df (pd.DataFrame): Left side of the join
+        right_df (pd.DataFrame): Right side of the join
+        key (str): Join key column
+
+    Returns:
+        dict: Unmatched and duplicate key counts for each side
+    """
+
+    left_keys = left_df[key]
+    right_keys = right_df[key]
+
+    return {
+        'left_unmatched': int((~left_keys.isin(right_keys)).sum()),
+        'right_unmatched': int((~right_keys.isin(left_keys)).sum()),
+        'left_duplicate_keys': int(left_keys.duplicated().sum()),
+        'right_duplicate_keys': int(right_keys.duplicated().sum())
+    }
+
+def join_tables(left_df, right_df, on, how='inner', key='client_code'):
+    """
+    Join two tables, using a sorted merge join on the key column when both
+    inputs are already sorted by it and a hash join otherwise.
+
+    Args:
+        left_df (pd.DataFrame): Left table
+        right_df (pd.DataFrame): Right table
+        on (list): Columns that must be equal in matching rows
+        how (str): 'inner' or 'left'
+        key (str): Column the inputs may be sorted by (must be part of `on`)
+
+    Returns:
+        tuple: (joined DataFrame, name of the join strategy used)
+    """
+
+    other_keys = [col for col in on if col != key]
+    presorted = left_df[key].is_monotonic_increasing and right_df[key].is_monotonic_increasing
+
+    # Extra join columns are only checked after the fact, which is exact for inner joins only
+    if not presorted or (other_keys and how != 'inner'):
+        return pd.merge(left_df, right_df, on=on, how=how), 'hash'
+
+    left_idx, right_idx = merge_join_indices(left_df[key].to_numpy(), right_df[key].to_numpy(), how=how)
+
+    left_part = left_df.iloc[left_idx].reset_index(drop=True)
+    # reindex turns the -1 positions of unmatched left rows into NaN
+    right_part = right_df.reset_index(drop=True).reindex(right_idx).reset_index(drop=True)
+
+    # The key only narrows the candidates; the remaining join columns must match too
+    if other_keys:
+        matched = np.ones(len(left_part), dtype=bool)
+        for col in other_keys:
+            matched &= (left_part[col] == right_part[col]).to_numpy()
+
+        left_part = left_part[matched].reset_index(drop=True)
+        right_part = right_part[matched].reset_index(drop=True)
+
+    joined = pd.concat([left_part, right_part.drop(columns=on)], axis=1)
+
+    return joined, 'sorted merge'
+
+def multiway_join(left_df, tables, key='client_code'):
+    """
+    Join several tables to one left table in a single pass.
+
+    Every step only combines positional index arrays: the keys of the rows
+    built so far are located in the next table with merge_join_indices and
+    all index arrays are narrowed or expanded to match. The columns are
+    gathered once at the end, so no intermediate table is materialized.
+    Tables not sorted by the key are stably sorted first. A left table that
+    is not sorted, or extra join columns on a left join (only exact for
+    inner joins, see join_tables), fall back to a chain of pairwise joins.
+
+    Args:
+        left_df (pd.DataFrame): Left table
+        tables (list): (right DataFrame, on columns, 'inner' or 'left') per
+                       table, joined in this order; `key` must be in `on`
+        key (str): Column the tables are sorted by
+
+    Returns:
+        tuple: (joined DataFrame, name of the join strategy used)
+    """
+
+    extra_left_keys = any(how != 'inner' and [col for col in on if col != key] for _, on, how in tables)
+    if not left_df[key].is_monotonic_increasing or extra_left_keys:
+        joined = left_df
+        for right_df, on, how in tables:
+            joined, strategy = join_tables(joined, right_df, on=on, how=how, key=key)
+        return joined, strategy
+
+    rights = [right_df if right_df[key].is_monotonic_increasing else right_df.sort_values(key, kind='stable')
+              for right_df, _, _ in tables]
+
+    # Positions into the left table and into every right table, one entry per output row
+    left_keys = left_df[key].to_numpy()
+    left_idx = np.arange(len(left_df))
+    right_indices = []
+
+    for right_df, (_, on, how) in zip(rights, tables):
+        rows, right_idx = merge_join_indices(left_keys[left_idx], right_df[key].to_numpy(), how=how)
+        left_idx = left_idx[rows]
+        right_indices = [idx[rows] for idx in right_indices] + [right_idx]
+
+        # The key only narrows the candidates; the remaining join columns must match too
+        other_keys = [col for col in on if col != key]
+        if other_keys:
+            matched = np.ones(len(left_idx), dtype=bool)
+            for col in other_keys:
+                matched &= left_df[col].to_numpy()[left_idx] == right_df[col].to_numpy()[right_idx]
+            left_idx = left_idx[matched]
+            right_indices = [idx[matched] for idx in right_indices]
+
+    # reindex turns the -1 positions of unmatched left rows into NaN
+    parts = [left_df.iloc[left_idx].reset_index(drop=True)]
+    for right_df, (_, on, _), right_idx in zip(rights, tables, right_indices):
+        parts.append(right_df.reset_index(drop=True).reindex(right_idx).reset_index(drop=True).drop(columns=on))
+
+    return pd.concat(parts, axis=1), 'sorted merge'
+
+def join_feature_tables(categories_df, transfers_df, balance_df, time_df=None, cohort_df=None):
+    """
+    Join the feature inputs and measure their key coverage.
+
+    Transfers are inner-joined on client_code and name; the balance and,
+    when given, the time-window and cohort features are left-joined on
+    client_code. All of them are joined in one pass (see multiway_join).
+
+    Returns:
+        tuple: (joined DataFrame, coverage dict, join strategies used)
+    """
+
+    coverage = {
+        'transfer summary': key_coverage(categories_df, transfers_df),
+        'client attributes': key_coverage(categories_df, balance_df)
+    }
+
+    # Categories + transfers: inner join, only clients present in both;
+    # + client balance: left join, keep every client from the previous step
+    tables = [(transfers_df, ['client_code', 'name'], 'inner'), (balance_df, ['client_code'], 'left')]
+
+    # + time and cohort features: left joins as well
+    if time_df is not None:
+        coverage['time features'] = key_coverage(categories_df, time_df)
+        tables.append((time_df, ['client_code'], 'left'))
+
+    if cohort_df is not None:
+        coverage['cohort features'] = key_coverage(categories_df, cohort_df)
+        tables.append((cohort_df, ['client_code'], 'left'))
+
+    merged_df, strategy = multiway_join(categories_df, tables)
+
+    return merged_df, coverage, (strategy, strategy)
+
+def add_coverage(total, coverage):
+    """Sum per-partition coverage counts (every key lives in one partition)"""
+
+    for side, stats in coverage.items():
+        side_total = total.setdefault(side, dict.fromkeys(stats, 0))
+        for name, value in stats.items():
+            side_total[name] += value
+
+    return total
+
+def join_client_features(categories_path='top5_categories_analysis.csv',
+                         transfers_path='Transfers/transfer_summary.csv',
+                         clients_path='clients.csv',
+                         output_path='final_result.csv',
+                         time_features_path='time_features.csv',
+                         cohort_features_path='cohort_features.csv',
+                         memory_limit=None, run_stats=None, reporter=None):
+    """
+    Build the per-client feature table in one stage: top-5 categories are
+    inner-joined with the transfer features on client_code and name, and
+    avg_monthly_balance_KZT is left-joined from the client attributes, and
+    the time-window features from time_features.py and the cohort features
+    from cohorts.py when those files exist.
+
+    Args:
+        categories_path (str): Path to the top-5 categories CSV
+        transfers_path (str): Path to the transfer summary CSV
+        clients_path (str): Path to the client attributes CSV
+        output_path (str): Path for the output CSV file (default: 'final_result.csv')
+        time_features_path (str): Path to the time features CSV; skipped when
+                                  missing or None
+        cohort_features_path (str): Path to the cohort features CSV; skipped
+                                    when missing or None
+        memory_limit (int): Memory budget in bytes; when the inputs do not fit
+                            they are spilled to disk by client_code partition
+                            and joined one partition at a time
+        run_stats (dict): Optional dict that receives partition, spill and
+                          peak memory figures
+        reporter (Reporter): Where messages and progress go (default: console)
+
+    Returns:
+        pd.DataFrame: The joined feature table, or None on failure. When the
+                      join ran in partitions only the output file holds all
+                      rows, in client_code order like a single-pass join, and an
+                      empty frame with the output columns is returned.
+    """
+
+    reporter = as_reporter(reporter)
+
+    if run_stats is None:
+        run_stats = {}
+
+    try:
+        if time_features_path and not os.path.exists(time_features_path):
+            reporter.info(f"No time features at {time_features_path}, joining without them")
+            time_features_path = None
+
+        if cohort_features_path and not os.path.exists(cohort_features_path):
+            reporter.info(f"No cohort features at {cohort_features_path}, joining without them")
+            cohort_features_path = None
+
+        input_paths = [categories_path, transfers_path, clients_path] + [
+            path for path in (time_features_path, cohort_features_path) if path]
+        input_bytes = sum(os.path.getsize(path) for path in input_paths)
+        num_partitions = partition_count(input_bytes, memory_limit)
+        run_stats['partitions'] = num_partitions
+        run_stats['spilled_bytes'] = 0
+
+        if num_partitions == 1:
+            # Read all three inputs
+            categories_df = read_csv_file(categories_path)
+            transfers_df = read_csv_file(transfers_path)
+            balance_df = read_table(clients_path, CLIENTS_SCHEMA, BALANCE_COLUMNS)
+            time_df = read_csv_file(time_features_path) if time_features_path else None
+            cohort_df = read_csv_file(cohort_features_path) if cohort_features_path else None
+
+            loaded = [(categories_path, categories_df), (transfers_path, transfers_df), (clients_path, balance_df),
+                      (time_features_path, time_df), (cohort_features_path, cohort_df)]
+            reporter.detail(lambda: '\n'.join(f"Loaded {path}: {df.shape[0]} rows, {df.shape[1]} columns"
+                                               for path, df in loaded if df is not None))
+
+            merged_df, coverage, strategies = join_feature_tables(categories_df, transfers_df, balance_df,
+                                                                  time_df, cohort_df)
+
+            # Save the result
+            write_csv(merged_df, output_path)
+            total_rows = len(merged_df)
+            missing_balance = merged_df['avg_monthly_balance_KZT'].isna().sum()
+            result = merged_df
+        else:
+            reporter.info(f"Inputs exceed the memory limit, joining in {num_partitions} partitions")
+
+            coverage = {}
+            total_rows = 0
+            missing_balance = 0
+            result = None
+
+            with SpillPartitioner(num_partitions) as spill:
+                # Stream every input into its partition files
+                for chunk in read_csv_file(categories_path, chunksize=CHUNK_ROWS):
+                    spill.add('categories', chunk)
+                for chunk in read_csv_file(transfers_path, chunksize=CHUNK_ROWS):
+                    spill.add('transfers', chunk)
+                for chunk in read_table_chunks(clients_path, CLIENTS_SCHEMA, BALANCE_COLUMNS, CHUNK_ROWS):
+                    spill.add('clients', chunk)
+                if time_features_path:
+                    for chunk in read_csv_file(time_features_path, chunksize=CHUNK_ROWS):
+                        spill.add('time', chunk)
+                if cohort_features_path:
+                    for chunk in read_csv_file(cohort_features_path, chunksize=CHUNK_ROWS):
+                        spill.add('cohort', chunk)
+
+                # Partitions keep the input order, so sorted inputs stay sorted; each joined
+                # partition is spilled and the partitions are merged back in client_code order
+                for partition in range(num_partitions):
+                    reporter.progress('joiner', partition + 1, num_partitions)
+                    categories_df = spill.load('categories', partition)
+                    transfers_df = spill.load('transfers', partition)
+                    balance_df = spill.load('clients', partition, BALANCE_COLUMNS)
+                    time_df = spill.load('time', partition, TIME_FEATURE_COLUMNS) if time_features_path else None
+                    cohort_df = spill.load('cohort', partition, COHORT_FEATURE_COLUMNS) if cohort_features_path else None
+
+                    if categories_df.empty:
+                        continue
+
+                    merged_df, partition_coverage, strategies = join_feature_tables(categories_df, transfers_df,
+                                                                                    balance_df, time_df, cohort_df)
+                    add_coverage(coverage, partition_coverage)
+
+                    spill.add_sorted('joined', partition, merged_df.sort_values('client_code', kind='stable'), CHUNK_ROWS)
+                    if result is None:
+                        result = merged_df.iloc[0:0]
+
+                for chunk in spill.read_merged('joined'):
+                    write_csv(chunk, output_path, mode='w' if total_rows == 0 else 'a', header=total_rows == 0)
+                    total_rows += len(chunk)
+                    missing_balance += chunk['avg_monthly_balance_KZT'].isna().sum()
+                if result is not None and total_rows == 0:
+                    write_csv(result, output_path)
+
+                run_stats['spilled_bytes'] = spill.spilled_bytes
+
+            reporter.info(f"Spilled {format_bytes(run_stats['spilled_bytes'])} to disk")
+
+        run_stats['peak_memory_bytes'] = peak_memory_bytes()
+
+        # Report key coverage
+        for side, stats in coverage.items():
+            reporter.info(f"\nKey coverage against {side}:")
+            reporter.info(f"- Clients missing from {side}: {stats['left_unmatched']}")
+            reporter.info(f"- Rows in {side} without a matching client: {stats['right_unmatched']}")
+            reporter.info(f"- Duplicate keys (left / right): {stats['left_duplicate_keys']} / {stats['right_duplicate_keys']}")
+
+        if result is None:
+            reporter.info("No clients to join!")
+            return None
+
+        reporter.info(f"\nJoined transfers using {strategies[0]} join, client attributes using {strategies[1]} join")
+        reporter.info(f"Successfully saved joined data to {output_path}")
+        reporter.info(f"Final rows: {total_rows}")
+        reporter.info(f"Records missing avg_monthly_balance_KZT data: {missing_balance}")
+
+        return result
+
+    except FileNotFoundError as e:
+        reporter.error(f"Error: File not found - {e}", e)
+    except Exception as e:
+        reporter.error(f"Error: {e}", e)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join top-5 categories, transfer features, client balance, time and cohort features")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    args = parser.parse_args()
+
+    run_stats = {}
+    joined = join_client_features(
+        "top5_categories_analysis.csv",
+        "Transfers/transfer_summary.csv",
+        "clients.csv",
+        "final_result.csv",
+        memory_limit=parse_memory_limit(args.memory_limit),
+        run_stats=run_stats
+    )
+    record_stats(args.stats_file, 'joiner', run_stats)
+
+    if joined is not None:
+        print(f"\nColumn names in final_result.csv:")
+        print(list(joined.columns))
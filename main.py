@@ -7,14 +7,26 @@ import subprocess
 import sys
 import os
 import time
+import argparse
+import resource
+import tempfile
 from datetime import datetime
 
-def run_script(script_name):
+from spill import parse_memory_limit, format_bytes, read_stats
+
+# Stages that accept --memory-limit and --stats-file
+MEMORY_BUDGETED_SCRIPTS = ["client_analyzer", "transfer_analyzer", "time_features", "cohorts", "joiner"]
+
+# Stages that only report statistics
+STATS_SCRIPTS = ["dedup"]
+
+def run_script(script_name, script_args=None):
     """
     Run a Python script and handle errors
     
     Args:
         script_name (str): Name of the script to run (without .py extension)
+        script_args (list): Extra command line arguments for the script
     
     Returns:
         bool: True if successful, False if failed
@@ -35,7 +47,7 @@ def run_script(script_name):
         start_time = time.time()
         
         # Run the script
-        result = subprocess.run([sys.executable, script_path], 
+        result = subprocess.run([sys.executable, script_path] + (script_args or []), 
                               capture_output=True, 
                               text=True, 
                               check=True)
@@ -79,19 +91,40 @@ def main():
     Main function to run all scripts in sequence
     """
     
+    parser = argparse.ArgumentParser(description="Run the data processing pipeline")
+    parser.add_argument('--memory-limit',
+                        help="memory budget for the aggregation and join stages, e.g. 512MB or 2G; "
+                             "inputs that do not fit are spilled to disk by client_code partition")
+    args = parser.parse_args()
+    
+    # Validate early so a typo does not surface in the middle of the run
+    try:
+        parse_memory_limit(args.memory_limit)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    
+    # Budgeted stages append their partition/spill figures here
+    stats_file = tempfile.NamedTemporaryFile(prefix='pipeline_stats_', suffix='.jsonl', delete=False).name
+    
     # List of scripts to run in order
     scripts = [
+        "dedup",
         "client_analyzer",
         "transfer_analyzer", 
-        "combiner",
-        "adder",
+        "time_features",
+        "cohorts",
+        "joiner",
         "assumptions",
-        "finalres"
+        "finalres",
+        "delta"
     ]
     
     print("🚀 Starting Data Processing Pipeline")
     print("=" * 60)
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if args.memory_limit:
+        print(f"Memory limit: {args.memory_limit}")
     print("=" * 60)
     print()
     
@@ -107,7 +140,15 @@ def main():
     for i, script in enumerate(scripts, 1):
         print(f"🔄 Step {i}/{total_scripts}: {script}")
         
-        success = run_script(script)
+        script_args = []
+        if script in MEMORY_BUDGETED_SCRIPTS:
+            script_args = ['--stats-file', stats_file]
+            if args.memory_limit:
+                script_args += ['--memory-limit', args.memory_limit]
+        elif script in STATS_SCRIPTS:
+            script_args = ['--stats-file', stats_file]
+        
+        success = run_script(script, script_args)
         
         if success:
             successful_scripts += 1
@@ -139,6 +180,22 @@ def main():
     print(f"Failed: {len(failed_scripts)}")
     print(f"Total execution time: {total_execution_time:.2f} seconds")
     
+    # Peak memory of the largest stage and what the budgeted stages spilled
+    stage_stats = read_stats(stats_file)
+    os.remove(stats_file)
+    
+    peak_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_memory = peak_memory if sys.platform == 'darwin' else peak_memory * 1024
+    spilled = sum(stats.get('spilled_bytes', 0) for stats in stage_stats)
+    duplicates = sum(stats.get('duplicates_dropped', 0) for stats in stage_stats)
+    
+    print(f"Peak memory (largest stage): {format_bytes(peak_memory)}")
+    print(f"Duplicate input rows dropped: {duplicates}")
+    print(f"Spilled to disk: {format_bytes(spilled)}")
+    for stats in stage_stats:
+        if stats.get('partitions', 1) > 1:
+            print(f"  - {stats['stage']}: {stats['partitions']} partitions, {format_bytes(stats['spilled_bytes'])}")
+    
     if failed_scripts:
         print(f"Failed scripts: {', '.join(failed_scripts)}")
     
@@ -0,0 +1,158 @@
+"""
+The pipeline as a library call.
+
+main.py runs every stage as a separate script that reads the previous
+stage's CSV and prints its report. run_pipeline() runs the same stages in the
+calling process instead: the tables are handed from stage to stage in
+memory, nothing is printed unless asked for, and nothing is written unless
+an output directory is given. Messages go to a logging logger and progress
+to a callback, so a service can embed the pipeline without console output.
+
+Deduplication (dedup.py) and the delta (delta.py) keep state between runs,
+so both stay explicit steps; the duplicates dedup.py found are left out of
+every read here as well.
+"""
+
+import pandas as pd
+import os
+import argparse
+from dataclasses import dataclass, field
+
+from schema import CLIENTS_SCHEMA
+from reader import read_table, write_csv
+from spill import parse_memory_limit
+from report import Reporter
+from client_analyzer import analyze_transaction_categories
+from transfer_analyzer import process_transfers
+from time_features import build_time_features
+from cohorts import build_cohort_features
+from joiner import BALANCE_COLUMNS, join_feature_tables
+from assumptions import analyze_client_recommendations
+from finalres import process_assumptions
+
+# File names the tables are saved under, the same the scripts use
+OUTPUT_FILES = {
+    'categories': 'top5_categories_analysis.csv',
+    'transfers': os.path.join('Transfers', 'transfer_summary.csv'),
+    'time_features': 'time_features.csv',
+    'category_spend_by_period': 'category_spend_by_period.csv',
+    'cohort_features': 'cohort_features.csv',
+    'cohort_category_percentiles': 'cohort_category_percentiles.csv',
+    'features': 'final_result.csv',
+    'assumptions': 'assumptions.csv',
+    'recommendations': 'recommendations.csv'
+}
+
+@dataclass
+class PipelineResult:
+    """Tables of one pipeline run, one per stage output"""
+
+    categories: pd.DataFrame
+    transfers: pd.DataFrame
+    time_features: pd.DataFrame
+    category_spend_by_period: pd.DataFrame
+    cohort_features: pd.DataFrame
+    cohort_category_percentiles: pd.DataFrame
+    features: pd.DataFrame
+    assumptions: pd.DataFrame
+    recommendations: pd.DataFrame
+    # Key coverage of every join, as reported by joiner.py
+    coverage: dict = field(default_factory=dict)
+    # Stage -> partition, spill and peak memory figures
+    run_stats: dict = field(default_factory=dict)
+
+    def save(self, output_dir='.'):
+        """Write every table under the file name its script uses"""
+
+        for name, file_name in OUTPUT_FILES.items():
+            table = getattr(self, name)
+            if table is None:
+                continue
+            path = os.path.join(output_dir, file_name)
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            write_csv(table, path)
+
+def require(table, stage):
+    if table is None:
+        raise ValueError(f"{stage} produced no output; check the input folders")
+    return table
+
+def run_pipeline(transactions_folder='Transactions', transfers_folder='Transfers', clients_path='clients.csv',
+                 excluded_categories=None, memory_limit=None, output_dir=None,
+                 logger=None, progress=None, quiet=True):
+    """
+    Run the stages from the raw inputs to the recommendation messages.
+
+    Args:
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        clients_path (str): Path to the client attributes CSV
+        excluded_categories (list): Categories left out of the top 5
+                                    (default: client_analyzer's list)
+        memory_limit (int): Memory budget in bytes for the stages that scan
+                            the raw inputs
+        output_dir (str): Also save every table there; None writes nothing
+        logger (logging.Logger): Receives the stage reports; previews are
+                                 logged at debug level
+        progress (callable): Called as progress(stage, done, total)
+        quiet (bool): Without a logger, print nothing
+
+    Returns:
+        PipelineResult: The tables of every stage
+
+    Raises:
+        ValueError: When a stage finds no data to work on
+        Exception: Whatever a stage failed with, e.g. a malformed input file
+    """
+
+    reporter = Reporter(logger, progress, quiet, raise_errors=True)
+    run_stats = {stage: {} for stage in ['client_analyzer', 'transfer_analyzer', 'time_features', 'cohorts']}
+
+    categories = require(analyze_transaction_categories(
+        transactions_folder, excluded_categories, output_file=None, memory_limit=memory_limit,
+        run_stats=run_stats['client_analyzer'], reporter=reporter), 'client_analyzer')
+
+    transfers = require(process_transfers(
+        memory_limit=memory_limit, run_stats=run_stats['transfer_analyzer'], transfers_folder=transfers_folder,
+        output_file=None, reporter=reporter), 'transfer_analyzer')
+
+    time_df, periods_df = build_time_features(
+        transactions_folder, transfers_folder, output_file=None, periods_file=None,
+        memory_limit=memory_limit, run_stats=run_stats['time_features'], reporter=reporter)
+
+    cohort_df, cohort_categories_df = build_cohort_features(
+        transactions_folder, clients_path, output_file=None, categories_file=None,
+        memory_limit=memory_limit, run_stats=run_stats['cohorts'], reporter=reporter)
+
+    balance_df = read_table(clients_path, CLIENTS_SCHEMA, BALANCE_COLUMNS)
+    features, coverage, _ = join_feature_tables(categories, transfers, balance_df, time_df, cohort_df)
+    reporter.progress('joiner', 1, 1)
+
+    assumptions = analyze_client_recommendations(output_file=None, df=features, reporter=reporter)
+    recommendations = process_assumptions(output_file=None, df=assumptions, reporter=reporter)
+
+    result = PipelineResult(categories, transfers, time_df, periods_df, cohort_df, cohort_categories_df, features,
+                            assumptions, recommendations, coverage, run_stats)
+
+    if output_dir is not None:
+        result.save(output_dir)
+        reporter.info(f"Saved {len(OUTPUT_FILES)} tables to {output_dir}")
+
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every stage in one process")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--output-dir', default='.', help="where to save the tables (default: %(default)s)")
+    parser.add_argument('--quiet', action='store_true', help="print only the final counts")
+    args = parser.parse_args()
+
+    try:
+        result = run_pipeline(memory_limit=parse_memory_limit(args.memory_limit), output_dir=args.output_dir,
+                              quiet=args.quiet)
+        print(f"Clients: {result.categories['client_code'].nunique()}")
+        print(f"Recommendations: {len(result.recommendations)}")
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
+    except ValueError as e:
+        print(f"❌ Error: {e}")
@@ -0,0 +1,443 @@
+"""
+Lazy query plans for the pipeline stages.
+
+A stage describes what it needs as a tree of Scan / Filter / Project /
+Aggregate / Join nodes instead of loading everything up front. optimize()
+fuses adjacent filters and projections and pushes both down into the scans,
+so every file is parsed with only the columns that are used and rows are
+dropped right after parsing. execute() reads each source once even when
+several branches scan it.
+"""
+
+import pandas as pd
+
+from reader import find_files, read_tables, source_size, filter_mask, concat_tables
+from joiner import join_tables
+from spill import SpillPartitioner, partition_count, peak_memory_bytes
+
+class Scan:
+    """Read every file of one format in a folder"""
+
+    def __init__(self, folder_path, schema, columns=None, filters=None):
+        self.folder_path = folder_path
+        self.schema = schema
+        self.columns = list(columns) if columns is not None else list(schema['dtypes'])
+        self.filters = list(filters or [])
+
+class Filter:
+    """Keep the rows matching all predicates ((column, operator, value) tuples)"""
+
+    def __init__(self, child, predicates):
+        self.child = child
+        self.predicates = list(predicates)
+
+class Project:
+    """Keep only the listed columns"""
+
+    def __init__(self, child, columns):
+        self.child = child
+        self.columns = list(columns)
+
+class Aggregate:
+    """Group by keys; aggregations map output column -> (input column, function)"""
+
+    def __init__(self, child, keys, aggregations):
+        self.child = child
+        self.keys = list(keys)
+        self.aggregations = dict(aggregations)
+
+class Join:
+    """Join two inputs on columns (sorted merge or hash, see joiner.join_tables)"""
+
+    def __init__(self, left, right, on, how='inner'):
+        self.left = left
+        self.right = right
+        self.on = list(on)
+        self.how = how
+
+def output_columns(node):
+    """Columns a plan node produces"""
+
+    if isinstance(node, Scan):
+        return list(node.columns)
+    if isinstance(node, Filter):
+        return output_columns(node.child)
+    if isinstance(node, Project):
+        return list(node.columns)
+    if isinstance(node, Aggregate):
+        return node.keys + list(node.aggregations)
+    if isinstance(node, Join):
+        right_columns = [col for col in output_columns(node.right) if col not in node.on]
+        return output_columns(node.left) + right_columns
+
+    raise TypeError(f"Unknown plan node: {type(node).__name__}")
+
+def push_filters(node, pending=None):
+    """
+    Move filter predicates as far down as they stay correct.
+
+    Adjacent filters are fused on the way down. Predicates pass through
+    projections, through aggregations when they only touch group keys, and
+    into the side of a join that has all their columns; what reaches a scan
+    becomes one of its row filters.
+    """
+
+    pending = list(pending or [])
+
+    if isinstance(node, Scan):
+        return Scan(node.folder_path, node.schema, node.columns, node.filters + pending)
+
+    if isinstance(node, Filter):
+        return push_filters(node.child, pending + node.predicates)
+
+    if isinstance(node, Project):
+        return Project(push_filters(node.child, pending), node.columns)
+
+    if isinstance(node, Aggregate):
+        on_keys = [p for p in pending if p[0] in node.keys]
+        rest = [p for p in pending if p[0] not in node.keys]
+        pushed = Aggregate(push_filters(node.child, on_keys), node.keys, node.aggregations)
+        return Filter(pushed, rest) if rest else pushed
+
+    if isinstance(node, Join):
+        left_columns = output_columns(node.left)
+        right_columns = output_columns(node.right)
+
+        # Filtering the preserved side of a left join below the join is fine;
+        # filtering the optional side is not
+        to_left = [p for p in pending if p[0] in left_columns]
+        to_right = [p for p in pending if p[0] in right_columns and p[0] not in left_columns and node.how == 'inner']
+        rest = [p for p in pending if p not in to_left and p not in to_right]
+
+        pushed = Join(push_filters(node.left, to_left), push_filters(node.right, to_right), node.on, node.how)
+        return Filter(pushed, rest) if rest else pushed
+
+    raise TypeError(f"Unknown plan node: {type(node).__name__}")
+
+def push_projections(node, required=None):
+    """
+    Narrow every node to the columns its parents use.
+
+    Projections are absorbed into the node below them and scans end up
+    reading only the required columns.
+    """
+
+    if isinstance(node, Scan):
+        columns = node.columns if required is None else [col for col in node.columns if col in required]
+        return Scan(node.folder_path, node.schema, columns, node.filters)
+
+    if isinstance(node, Filter):
+        child_required = None if required is None else set(required) | {p[0] for p in node.predicates}
+        child = push_projections(node.child, child_required)
+        pushed = Filter(child, node.predicates)
+        if required is not None and set(output_columns(child)) != set(required):
+            return Project(pushed, [col for col in output_columns(child) if col in required])
+        return pushed
+
+    if isinstance(node, Project):
+        columns = node.columns if required is None else [col for col in node.columns if col in required]
+        child = push_projections(node.child, set(columns))
+        # Drop the projection when the child already produces exactly these columns
+        if output_columns(child) == columns:
+            return child
+        return Project(child, columns)
+
+    if isinstance(node, Aggregate):
+        aggregations = {out: spec for out, spec in node.aggregations.items() if required is None or out in required}
+        child_required = set(node.keys) | {col for col, _ in aggregations.values()}
+        return Aggregate(push_projections(node.child, child_required), node.keys, aggregations)
+
+    if isinstance(node, Join):
+        needed = None if required is None else set(required) | set(node.on)
+        left_required = None if needed is None else needed & set(output_columns(node.left))
+        right_required = None if needed is None else needed & set(output_columns(node.right))
+        return Join(push_projections(node.left, left_required),
+                    push_projections(node.right, right_required), node.on, node.how)
+
+    raise TypeError(f"Unknown plan node: {type(node).__name__}")
+
+def optimize(outputs):
+    """
+    Optimize a set of named plans.
+
+    Args:
+        outputs (dict): Output name -> plan node
+
+    Returns:
+        dict: Output name -> optimized plan node
+    """
+
+    return {name: push_projections(push_filters(node)) for name, node in outputs.items()}
+
+def format_filters(filters):
+    """Human-readable form of a predicate list"""
+
+    parts = []
+    for column, op, value in filters:
+        parts.append(f"{column} {op}" if op == 'notna' else f"{column} {op} {value!r}")
+
+    return ' and '.join(parts)
+
+def explain(outputs):
+    """
+    Render named plans as an indented tree.
+
+    Args:
+        outputs (dict): Output name -> plan node
+
+    Returns:
+        str: One line per node
+    """
+
+    lines = []
+
+    def walk(node, depth):
+        indent = '  ' * depth
+
+        if isinstance(node, Scan):
+            line = f"{indent}Scan {node.folder_path}/{node.schema['file_pattern']} columns={node.columns}"
+            if node.filters:
+                line += f" filters=[{format_filters(node.filters)}]"
+            lines.append(line)
+        elif isinstance(node, Filter):
+            lines.append(f"{indent}Filter [{format_filters(node.predicates)}]")
+            walk(node.child, depth + 1)
+        elif isinstance(node, Project):
+            lines.append(f"{indent}Project {node.columns}")
+            walk(node.child, depth + 1)
+        elif isinstance(node, Aggregate):
+            aggregations = ', '.join(
+                f"{out}={func if isinstance(func, str) else getattr(func, '__name__', 'custom')}({col})"
+                for out, (col, func) in node.aggregations.items()
+            )
+            lines.append(f"{indent}Aggregate by {node.keys}: {aggregations}")
+            walk(node.child, depth + 1)
+        elif isinstance(node, Join):
+            lines.append(f"{indent}Join {node.how} on {node.on}")
+            walk(node.left, depth + 1)
+            walk(node.right, depth + 1)
+
+    for name, node in outputs.items():
+        lines.append(f"{name}:")
+        walk(node, 1)
+
+    return '\n'.join(lines)
+
+def collect_scans(node, scans):
+    """Append every Scan below a node to `scans`"""
+
+    if isinstance(node, Scan):
+        scans.append(node)
+    elif isinstance(node, Join):
+        collect_scans(node.left, scans)
+        collect_scans(node.right, scans)
+    else:
+        collect_scans(node.child, scans)
+
+def skip_file(stats):
+    """on_error hook for read_tables: note the file in stats['skipped_files'] and go on"""
+
+    def skip(source, error):
+        stats.setdefault('skipped_files', []).append([source, str(error)])
+
+    return skip
+
+def execute_scans(scans, stats):
+    """
+    Load the data of all scans, parsing each file once per source.
+
+    Scans of the same source are served from one read of the union of their
+    columns; each scan then applies its own filters to every file before the
+    files are concatenated. A file that can not be read is skipped and
+    listed in stats['skipped_files'].
+    """
+
+    sources = {}
+    for scan in scans:
+        sources.setdefault((scan.folder_path, scan.schema['file_pattern']), []).append(scan)
+
+    results = {}
+
+    for (folder_path, pattern), source_scans in sources.items():
+        schema = source_scans[0].schema
+        files = find_files(folder_path, schema)
+        parts = {id(scan): [] for scan in source_scans}
+
+        if len(source_scans) == 1:
+            # A single consumer can have its filters applied inside the reader
+            scan = source_scans[0]
+            for _, df in read_tables(files, schema, scan.columns, scan.filters, skip_file(stats)):
+                parts[id(scan)].append(df)
+        else:
+            columns = []
+            for scan in source_scans:
+                columns += scan.columns + [column for column, _, _ in scan.filters]
+            columns = list(dict.fromkeys(columns))
+
+            for _, df in read_tables(files, schema, columns, on_error=skip_file(stats)):
+                for scan in source_scans:
+                    parts[id(scan)].append(df.loc[filter_mask(df, scan.filters), scan.columns])
+
+        for scan in source_scans:
+            df = concat_tables(parts[id(scan)]) if parts[id(scan)] else pd.DataFrame(columns=scan.columns)
+            results[id(scan)] = df
+
+        stats[f"{folder_path}/{pattern}"] = {
+            'files': len(files),
+            'scans': len(source_scans),
+            'rows_loaded': sum(len(results[id(scan)]) for scan in source_scans)
+        }
+
+    return results
+
+def execute_node(node, scan_results):
+    """Evaluate one plan node bottom-up"""
+
+    if isinstance(node, Scan):
+        return scan_results[id(node)]
+
+    if isinstance(node, Filter):
+        df = execute_node(node.child, scan_results)
+        return df[filter_mask(df, node.predicates)]
+
+    if isinstance(node, Project):
+        return execute_node(node.child, scan_results)[node.columns]
+
+    if isinstance(node, Aggregate):
+        df = execute_node(node.child, scan_results)
+        return df.groupby(node.keys, observed=True, sort=True).agg(**node.aggregations).reset_index()
+
+    if isinstance(node, Join):
+        left = execute_node(node.left, scan_results)
+        right = execute_node(node.right, scan_results)
+        joined, _ = join_tables(left, right, on=node.on, how=node.how)
+        return joined
+
+    raise TypeError(f"Unknown plan node: {type(node).__name__}")
+
+def execute(outputs, stats=None):
+    """
+    Optimize and run a set of named plans.
+
+    Args:
+        outputs (dict): Output name -> plan node
+        stats (dict): Optional dict that receives per-source file, scan and row
+                      counts and the 'skipped_files' that could not be read
+
+    Returns:
+        dict: Output name -> pd.DataFrame
+    """
+
+    if stats is None:
+        stats = {}
+
+    optimized = optimize(outputs)
+
+    scans = []
+    for node in optimized.values():
+        collect_scans(node, scans)
+
+    scan_results = execute_scans(scans, stats)
+
+    return {name: execute_node(node, scan_results) for name, node in optimized.items()}
+
+def execute_partitioned(outputs, memory_limit=None, stats=None):
+    """
+    Run a set of named plans under a memory budget, one client_code
+    partition at a time.
+
+    When the inputs fit the budget this yields a single result, exactly like
+    execute(). Otherwise every file is read, filtered and projected as usual
+    and its rows are spilled to temporary partition files by a hash of
+    client_code; the plans are then evaluated partition by partition. Every
+    aggregation and join must be keyed by client_code for the per-partition
+    results to be complete.
+
+    Args:
+        outputs (dict): Output name -> plan node
+        memory_limit (int): Budget in bytes, or None for no limit
+        stats (dict): Optional dict that receives partition, spill and peak
+                      memory figures; a partitioned run also records the
+                      overall 'date_range' of scanned date columns before
+                      the first partition is yielded, and the
+                      'skipped_files' that could not be read
+
+    Yields:
+        dict: Output name -> pd.DataFrame for one partition
+    """
+
+    if stats is None:
+        stats = {}
+
+    optimized = optimize(outputs)
+
+    scans = []
+    for node in optimized.values():
+        collect_scans(node, scans)
+
+    input_bytes = sum(
+        source_size(file)
+        for folder_path, schema in {(scan.folder_path, id(scan.schema)): (scan.folder_path, scan.schema) for scan in scans}.values()
+        for file in find_files(folder_path, schema)
+    )
+    num_partitions = partition_count(input_bytes, memory_limit)
+
+    stats['partitions'] = num_partitions
+    stats['spilled_bytes'] = 0
+
+    if num_partitions == 1:
+        scan_stats = {}
+        yield execute(outputs, scan_stats)
+        if 'skipped_files' in scan_stats:
+            stats['skipped_files'] = scan_stats['skipped_files']
+        stats['peak_memory_bytes'] = peak_memory_bytes()
+        return
+
+    sources = {}
+    for scan in scans:
+        sources.setdefault((scan.folder_path, scan.schema['file_pattern']), []).append(scan)
+
+    with SpillPartitioner(num_partitions) as spill:
+        # Pass 1: parse every file once and spill each scan's rows by partition
+        for (folder_path, pattern), source_scans in sources.items():
+            schema = source_scans[0].schema
+            columns = []
+            for scan in source_scans:
+                columns += scan.columns + [column for column, _, _ in scan.filters]
+            columns = list(dict.fromkeys(columns))
+
+            for _, df in read_tables(find_files(folder_path, schema), schema, columns, on_error=skip_file(stats)):
+                for scan in source_scans:
+                    part = df.loc[filter_mask(df, scan.filters), scan.columns]
+                    spill.add(str(id(scan)), part)
+
+                    # Partitions only see their own clients, so keep the overall
+                    # date range for consumers that need a common reference date
+                    for col in scan.columns:
+                        if col in schema['date_columns'] and part[col].notna().any():
+                            date_range = [part[col].min(), part[col].max()]
+                            if 'date_range' in stats:
+                                date_range = [min(date_range[0], pd.Timestamp(stats['date_range'][0])),
+                                              max(date_range[1], pd.Timestamp(stats['date_range'][1]))]
+                            stats['date_range'] = [str(date_range[0]), str(date_range[1])]
+
+        stats['spilled_bytes'] = spill.spilled_bytes
+
+        # Pass 2: evaluate the plans on one partition at a time
+        for partition in range(num_partitions):
+            scan_results = {id(scan): spill.load(str(id(scan)), partition, scan.columns) for scan in scans}
+            yield {name: execute_node(node, scan_results) for name, node in optimized.items()}
+
+    stats['peak_memory_bytes'] = peak_memory_bytes()
+
+if __name__ == "__main__":
+    # The stages build their nodes from the importable module, not from __main__
+    import plan
+    from client_analyzer import category_plan, DEFAULT_EXCLUDED_CATEGORIES
+    from transfer_analyzer import transfer_plan
+
+    print("=== Transactions stage ===")
+    print(plan.explain(plan.optimize(category_plan("Transactions", DEFAULT_EXCLUDED_CATEGORIES))))
+
+    print("\n=== Transfers stage ===")
+    print(plan.explain(plan.optimize(transfer_plan("Transfers"))))
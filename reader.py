@@ -0,0 +1,592 @@
+import pandas as pd
+import numpy as np
+import os
+import io
+import glob
+import json
+import gzip
+import codecs
+import fnmatch
+import operator
+import tarfile
+import zipfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from schema import DATE_FORMAT, OUTPUT_ENCODING
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    # The C parser is slower but understands the same options
+    CSV_ENGINE = 'c'
+
+try:
+    import zstandard
+except ImportError:
+    # .zst inputs are found but can not be read without it
+    zstandard = None
+
+# Separates a bundle from the name of a CSV inside it, e.g. 'daily.tar.gz::client_1_transactions_3m.csv'
+MEMBER_SEPARATOR = '::'
+
+# Compressed single files next to the plain CSVs
+COMPRESSED_SUFFIXES = ['.gz', '.zst']
+
+# Bundles of several CSVs
+TAR_SUFFIXES = ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar.zst']
+ZIP_SUFFIXES = ['.zip']
+
+# Files decompressed and parsed at the same time; zlib, zstd and the pyarrow
+# parser release the GIL, so threads are enough
+READ_WORKERS = min(8, os.cpu_count() or 1)
+
+# Assumed expansion of a compressed file whose uncompressed size is not recorded
+COMPRESSION_RATIO = 5
+
+# Bytes looked at to detect the encoding of a file
+SNIFF_BYTES = 64 * 1024
+
+# Byte order marks and the codecs that skip them (UTF-32 first: its LE mark starts like UTF-16's)
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+
+# Tried in order on files without a byte order mark; latin-1 accepts any bytes
+FALLBACK_ENCODINGS = ['utf-8', 'cp1251', 'latin-1']
+
+# Detected encodings by (source, modification time, size)
+_encoding_cache = {}
+
+# Member name -> uncompressed size of every bundle, by (path, modification time, size)
+_bundle_cache = {}
+
+# Where dedup.py keeps its hash index and the rows it found to be duplicates;
+# the inputs themselves are never changed, the duplicates are left out on reading
+DEDUP_INDEX_DIR = '.dedup_index'
+DROPPED_ROWS_FILE = 'dropped.json'
+
+# Contents of the dropped-rows file, by (modification time, size)
+_dropped_cache = {}
+
+# Comparison operators allowed in row filters
+COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+def zstd_reader(raw):
+    """Decompressing stream over a .zst file object"""
+
+    if zstandard is None:
+        raise ImportError("Reading .zst inputs needs the zstandard package (pip install zstandard)")
+    return zstandard.ZstdDecompressor().stream_reader(raw)
+
+def is_bundle(path, suffixes=TAR_SUFFIXES + ZIP_SUFFIXES):
+    return any(path.endswith(suffix) for suffix in suffixes)
+
+def open_tar_stream(bundle_path, stack):
+    """Open a tar bundle for one sequential pass over its members"""
+
+    if bundle_path.endswith('.tar.zst'):
+        raw = stack.enter_context(open(bundle_path, 'rb'))
+        return stack.enter_context(tarfile.open(fileobj=stack.enter_context(zstd_reader(raw)), mode='r|'))
+    return stack.enter_context(tarfile.open(bundle_path, mode='r|*'))
+
+def bundle_index(bundle_path):
+    """
+    Member name -> uncompressed size of every file in a bundle.
+
+    A tar bundle has no index and has to be streamed (and decompressed) in
+    full to list it, so the listing is kept for as long as the bundle file
+    is unchanged.
+    """
+
+    info = os.stat(bundle_path)
+    key = (os.path.abspath(bundle_path), info.st_mtime_ns, info.st_size)
+
+    if key not in _bundle_cache:
+        if is_bundle(bundle_path, ZIP_SUFFIXES):
+            with zipfile.ZipFile(bundle_path) as bundle:
+                index = {member.filename: member.file_size for member in bundle.infolist() if not member.is_dir()}
+        else:
+            with contextlib.ExitStack() as stack:
+                index = {member.name: member.size for member in open_tar_stream(bundle_path, stack) if member.isfile()}
+        _bundle_cache[key] = index
+
+    return _bundle_cache[key]
+
+def bundle_members(bundle_path, pattern):
+    """Names of the bundle members whose file name matches the pattern"""
+    return [name for name in bundle_index(bundle_path) if fnmatch.fnmatch(os.path.basename(name), pattern)]
+
+def find_files(folder_path, schema):
+    """
+    List the input files of one format in a folder, in a stable order.
+
+    Besides plain CSVs this finds gzip/zstd compressed ones (`.csv.gz`,
+    `.csv.zst`) and the matching CSVs inside tar and zip bundles, which are
+    listed as '<bundle>::<member>'.
+
+    Args:
+        folder_path (str): Folder to search
+        schema (dict): One of the schemas from schema.py
+
+    Returns:
+        list: Matching sources, usable with read_table
+    """
+
+    pattern = schema['file_pattern']
+    sources = []
+
+    for suffix in [''] + COMPRESSED_SUFFIXES:
+        sources += glob.glob(os.path.join(folder_path, pattern + suffix))
+
+    for bundle in glob.glob(os.path.join(folder_path, '*')):
+        if os.path.isfile(bundle) and is_bundle(bundle):
+            sources += [bundle + MEMBER_SEPARATOR + name for name in bundle_members(bundle, pattern)]
+
+    return sorted(sources)
+
+def split_source(source):
+    """(bundle path, member name) of a bundle member, (file path, None) otherwise"""
+
+    if MEMBER_SEPARATOR in source:
+        bundle, member = source.split(MEMBER_SEPARATOR, 1)
+        return bundle, member
+    return source, None
+
+def is_plain_file(source):
+    """Whether a source is an uncompressed file that pd.read_csv can open by path"""
+    return MEMBER_SEPARATOR not in source and not any(source.endswith(suffix) for suffix in COMPRESSED_SUFFIXES)
+
+def source_version(source):
+    """[modification time, size] of the file holding a source; changes whenever the source may have"""
+
+    info = os.stat(split_source(source)[0])
+    return [info.st_mtime_ns, info.st_size]
+
+def dropped_rows(source, index_dir=DEDUP_INDEX_DIR):
+    """
+    Rows of a source that dedup.py found to be duplicates.
+
+    Args:
+        source (str): Source from find_files
+        index_dir (str): Directory of the dedup index
+
+    Returns:
+        Row positions to leave out (np.ndarray), 'all' when the whole source
+        repeats another one, or None when nothing is dropped or the source
+        changed since dedup.py looked at it
+    """
+
+    path = os.path.join(index_dir, DROPPED_ROWS_FILE)
+    if not os.path.exists(path):
+        return None
+
+    info = os.stat(path)
+    key = (os.path.abspath(path), info.st_mtime_ns, info.st_size)
+    dropped = _dropped_cache.get(key)
+    if dropped is None:
+        with open(path, encoding='utf-8') as f:
+            dropped = json.load(f)
+        _dropped_cache.clear()
+        _dropped_cache[key] = dropped
+
+    entry = dropped.get(os.path.normpath(source))
+    if entry is None or entry['version'] != source_version(source):
+        return None
+
+    if entry['rows'] == 'all':
+        return 'all'
+    return np.load(os.path.join(index_dir, entry['rows']))
+
+def source_size(source):
+    """
+    Uncompressed size of a source in bytes, estimated where the archive does
+    not record it.
+    """
+
+    path, member = split_source(source)
+
+    if member is not None:
+        return bundle_index(path).get(member, 0)
+
+    if path.endswith('.gz'):
+        # The gzip trailer holds the uncompressed size modulo 2**32
+        with open(path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return int.from_bytes(f.read(4), 'little')
+
+    if path.endswith('.zst'):
+        return os.path.getsize(path) * COMPRESSION_RATIO
+
+    return os.path.getsize(path)
+
+@contextlib.contextmanager
+def open_source(source):
+    """
+    Open a source as a binary stream, decompressing on the fly.
+
+    Nothing is extracted to disk; bundle members are read straight out of
+    the archive.
+    """
+
+    path, member = split_source(source)
+
+    with contextlib.ExitStack() as stack:
+        if member is None:
+            if path.endswith('.gz'):
+                yield stack.enter_context(gzip.open(path, 'rb'))
+            elif path.endswith('.zst'):
+                yield stack.enter_context(zstd_reader(stack.enter_context(open(path, 'rb'))))
+            else:
+                yield stack.enter_context(open(path, 'rb'))
+        elif is_bundle(path, ZIP_SUFFIXES):
+            yield stack.enter_context(stack.enter_context(zipfile.ZipFile(path)).open(member))
+        else:
+            bundle = open_tar_stream(path, stack)
+            for info in bundle:
+                if info.name == member:
+                    yield bundle.extractfile(info)
+                    return
+            raise FileNotFoundError(f"{member} not found in {path}")
+
+def sniff_encoding(prefix):
+    """
+    Encoding of a file from the first bytes of it.
+
+    A byte order mark decides; otherwise the first fallback encoding that
+    decodes the whole sample wins. A multi-byte character cut off at the end
+    of the sample is not an error.
+    """
+
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if prefix.startswith(mark):
+            return encoding
+
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+
+    return FALLBACK_ENCODINGS[-1]
+
+def detect_encoding(source, stream=None):
+    """
+    Encoding of a source, detected once per version of the file.
+
+    Args:
+        source (str): File path or source from find_files
+        stream: Open binary stream of the source with peek(); its buffer is
+                sniffed without consuming anything, so the caller can parse
+                the same stream
+
+    Returns:
+        str: Codec name for pd.read_csv / open
+    """
+
+    path, _ = split_source(source)
+    info = os.stat(path)
+    key = (source, info.st_mtime_ns, info.st_size)
+
+    if key not in _encoding_cache:
+        if stream is not None:
+            prefix = stream.peek(SNIFF_BYTES)[:SNIFF_BYTES]
+        else:
+            with open_source(source) as sample:
+                prefix = sample.read(SNIFF_BYTES)
+        _encoding_cache[key] = sniff_encoding(prefix)
+
+    return _encoding_cache[key]
+
+def peekable(stream):
+    """The stream itself when it supports peek(), else a buffered wrapper"""
+    return stream if hasattr(stream, 'peek') else io.BufferedReader(stream, SNIFF_BYTES)
+
+def read_csv_file(file_path, **kwargs):
+    """
+    Read a CSV written by one of the stages (or any other CSV) in its detected encoding.
+
+    Args:
+        file_path (str): Path to the CSV file
+        **kwargs: Passed on to pd.read_csv
+
+    Returns:
+        pd.DataFrame or TextFileReader (with chunksize)
+    """
+
+    return pd.read_csv(file_path, encoding=detect_encoding(file_path), **kwargs)
+
+def write_csv(df, file_path, mode='w', header=True):
+    """
+    Write a CSV output with the pipeline's single output encoding.
+
+    Appending to a non-empty file skips the byte order mark, which belongs
+    at the start of the file only.
+    """
+
+    encoding = OUTPUT_ENCODING
+    if mode == 'a' and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        encoding = 'utf-8' if OUTPUT_ENCODING == 'utf-8-sig' else OUTPUT_ENCODING
+
+    df.to_csv(file_path, index=False, encoding=encoding, mode=mode, header=header)
+
+def filter_mask(df, filters):
+    """
+    Evaluate row filters on a table.
+
+    Args:
+        df (pd.DataFrame): Table to filter
+        filters (list): (column, operator, value) tuples, all of which must hold;
+                        operators are ==, !=, <, <=, >, >=, in, not in and notna
+
+    Returns:
+        np.ndarray: Boolean mask of the rows that pass
+    """
+
+    mask = np.ones(len(df), dtype=bool)
+
+    for column, op, value in filters:
+        values = df[column]
+
+        if op == 'in':
+            passed = values.isin(value)
+        elif op == 'not in':
+            passed = ~values.isin(value)
+        elif op == 'notna':
+            passed = values.notna()
+        elif op in COMPARISONS:
+            passed = COMPARISONS[op](values, value)
+        else:
+            raise ValueError(f"Unknown filter operator: {op}")
+
+        mask &= passed.to_numpy(dtype=bool)
+
+    return mask
+
+def parse_table(stream, schema, columns=None, filters=None, encoding='utf-8', skip_rows=None):
+    """
+    Parse one CSV (path or open binary stream) with the dtypes from its schema.
+
+    Args:
+        skip_rows: Row positions to leave out, or 'all' (see dropped_rows)
+
+    See read_table for the other arguments.
+    """
+
+    if columns is None:
+        columns = list(schema['dtypes'])
+
+    filters = filters or []
+    read_columns = list(dict.fromkeys(columns + [column for column, _, _ in filters]))
+
+    dtypes = {col: schema['dtypes'][col] for col in read_columns if col not in schema['date_columns']}
+    date_columns = [col for col in read_columns if col in schema['date_columns']]
+
+    df = pd.read_csv(
+        stream,
+        engine=CSV_ENGINE,
+        encoding=encoding,
+        usecols=read_columns,
+        dtype=dtypes,
+        parse_dates=date_columns or False,
+        date_format=DATE_FORMAT if date_columns else None
+    )
+
+    # Duplicates go before the filters, while positions still match the file's rows
+    if skip_rows is not None:
+        keep = np.zeros(len(df), dtype=bool)
+        if not isinstance(skip_rows, str):
+            keep[:] = True
+            keep[skip_rows] = False
+        df = df[keep]
+
+    if filters:
+        df = df[filter_mask(df, filters)]
+
+    return df[columns]
+
+def read_table(file_path, schema, columns=None, filters=None, drop_duplicates=True):
+    """
+    Read one input file with the dtypes from its schema.
+
+    Rows dedup.py found to be duplicates are left out.
+
+    Args:
+        file_path (str): Path to the CSV file, a compressed CSV or a bundle
+                         member from find_files
+        schema (dict): One of the schemas from schema.py
+        columns (list): Columns to load (default: all columns of the schema)
+        filters (list): Row filters applied right after parsing (see filter_mask);
+                        their columns are read even if not in `columns`
+        drop_duplicates (bool): Leave out the rows dedup.py marked as
+                                duplicates; False reads the file as it is
+
+    Returns:
+        pd.DataFrame: The loaded columns, in the requested order
+    """
+
+    skip_rows = dropped_rows(file_path) if drop_duplicates else None
+
+    if is_plain_file(file_path):
+        return parse_table(file_path, schema, columns, filters, detect_encoding(file_path), skip_rows)
+
+    with open_source(file_path) as stream:
+        stream = peekable(stream)
+        return parse_table(stream, schema, columns, filters, detect_encoding(file_path, stream), skip_rows)
+
+def read_group(sources, schema, columns, filters):
+    """
+    Read the sources of one read task: a single file, or all wanted members
+    of one tar bundle in a single pass over it.
+
+    Returns:
+        list: The table of every source, or the exception its read raised
+    """
+
+    path, member = split_source(sources[0])
+
+    if member is None or not is_bundle(path, TAR_SUFFIXES):
+        tables = []
+        for source in sources:
+            try:
+                tables.append(read_table(source, schema, columns, filters))
+            except Exception as e:
+                tables.append(e)
+        return tables
+
+    # Tar has no index, so members are parsed as the stream reaches them
+    wanted = {split_source(source)[1] for source in sources}
+    tables = {}
+    try:
+        with contextlib.ExitStack() as stack:
+            bundle = open_tar_stream(path, stack)
+            for info in bundle:
+                if info.name in wanted:
+                    source = path + MEMBER_SEPARATOR + info.name
+                    try:
+                        stream = peekable(bundle.extractfile(info))
+                        tables[info.name] = parse_table(stream, schema, columns, filters, detect_encoding(source, stream),
+                                                        dropped_rows(source))
+                    except Exception as e:
+                        tables[info.name] = e
+    except Exception as e:
+        # The bundle itself is unreadable: every member not read yet fails with it
+        for name in wanted:
+            tables.setdefault(name, e)
+
+    return [tables.get(split_source(source)[1], FileNotFoundError(source)) for source in sources]
+
+def read_tables(sources, schema, columns=None, filters=None, on_error=None):
+    """
+    Read many input files in parallel workers, decompressing as they parse.
+
+    Results come back in the order of `sources`; at most READ_WORKERS read
+    tasks are in flight, so memory stays bounded when the caller consumes
+    the tables one at a time.
+
+    Args:
+        sources (list): Sources from find_files
+        schema (dict): One of the schemas from schema.py
+        columns (list): Columns to load (see read_table)
+        filters (list): Row filters (see read_table)
+        on_error (callable): Called as on_error(source, exception) for a
+                             source that can not be read, which is then
+                             skipped; None raises the exception instead
+
+    Yields:
+        tuple: (source, pd.DataFrame)
+    """
+
+    def results(group, tables):
+        for source, table in zip(group, tables):
+            if isinstance(table, Exception):
+                if on_error is None:
+                    raise table
+                on_error(source, table)
+            else:
+                yield source, table
+
+    # Members of one tar bundle form one task; everything else is read on its own
+    groups = []
+    for source in sources:
+        path, member = split_source(source)
+        key = path if member is not None and is_bundle(path, TAR_SUFFIXES) else source
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(source)
+        else:
+            groups.append((key, [source]))
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        pending = []
+        for _, group in groups:
+            pending.append((group, pool.submit(read_group, group, schema, columns, filters)))
+
+            if len(pending) >= READ_WORKERS:
+                done_group, future = pending.pop(0)
+                yield from results(done_group, future.result())
+
+        for done_group, future in pending:
+            yield from results(done_group, future.result())
+
+def read_table_chunks(file_path, schema, columns, chunksize):
+    """
+    Read one input file in chunks of rows, with the dtypes from its schema.
+
+    Uses the C parser, which unlike pyarrow can stream a file.
+
+    Yields:
+        pd.DataFrame: Up to `chunksize` rows of the requested columns
+    """
+
+    dtypes = {col: schema['dtypes'][col] for col in columns if col not in schema['date_columns']}
+    date_columns = [col for col in columns if col in schema['date_columns']]
+
+    with open_source(file_path) as stream:
+        stream = peekable(stream)
+        chunks = pd.read_csv(
+            stream,
+            engine='c',
+            encoding=detect_encoding(file_path, stream),
+            usecols=columns,
+            dtype=dtypes,
+            parse_dates=date_columns or False,
+            date_format=DATE_FORMAT if date_columns else None,
+            chunksize=chunksize
+        )
+
+        for chunk in chunks:
+            yield chunk[columns]
+
+def concat_tables(frames):
+    """
+    Concatenate per-file tables, keeping categorical columns categorical.
+
+    pd.concat falls back to object dtype when the files saw different
+    category values, so the categories are unified first.
+    """
+
+    if not frames:
+        return pd.DataFrame()
+
+    # Empty files (e.g. fully deduplicated ones) have untyped categories that do not union
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([frame[col] for frame in frames]).categories
+            frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) for frame in frames]
+
+    return pd.concat(frames, ignore_index=True)
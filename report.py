@@ -0,0 +1,82 @@
+"""
+Where the stages send their messages and progress.
+
+Run as scripts, the stages print to the console as they always did. Called
+from another program they take a Reporter instead: messages go to a logging
+logger or nowhere (quiet; errors still reach stderr), and progress goes to a
+callback. Previews such as the first rows of a table are passed as
+callables, so they are only formatted when somebody reads them.
+"""
+
+import sys
+import logging
+
+# Rows between two progress calls of a per-row loop
+PROGRESS_EVERY = 1000
+
+class Reporter:
+    """
+    Message and progress sink of a stage.
+
+    Args:
+        logger (logging.Logger): Receives messages (info), previews (debug)
+                                 and errors; None prints to the console
+        progress (callable): Called as progress(stage, done, total) as a
+                             stage advances through partitions or rows
+        quiet (bool): Drop messages and previews that would go to the
+                      console; errors then go to stderr, and the logger and
+                      progress still work
+        raise_errors (bool): Re-raise the exception a stage reports as an
+                             error instead of letting the stage return None
+    """
+
+    def __init__(self, logger=None, progress=None, quiet=False, raise_errors=False):
+        self.logger = logger
+        self.progress_callback = progress
+        self.quiet = quiet
+        self.raise_errors = raise_errors
+
+    def info(self, message=''):
+        if self.logger is not None:
+            self.logger.info(message)
+        elif not self.quiet:
+            print(message)
+
+    def detail(self, render):
+        """A preview; `render` returns its text and is only called when it is shown"""
+
+        if self.logger is not None:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(render())
+        elif not self.quiet:
+            print(render())
+
+    def error(self, message, exception=None):
+        """Report a failure; with raise_errors the exception behind it is raised instead"""
+
+        if self.raise_errors and exception is not None:
+            raise exception
+
+        if self.logger is not None:
+            self.logger.error(message)
+        elif self.quiet:
+            print(message, file=sys.stderr)
+        else:
+            print(message)
+
+    def skipped_files(self, stats):
+        """Report the input files a plan run skipped because they could not be read"""
+
+        for source, error in stats.get('skipped_files', []):
+            self.error(f"Error reading {source}: {error} (file skipped)")
+
+    def progress(self, stage, done, total):
+        if self.progress_callback is not None:
+            self.progress_callback(stage, done, total)
+
+# Default of every stage: print everything, like the scripts always did
+CONSOLE = Reporter()
+
+def as_reporter(reporter):
+    """The given reporter, or the console one"""
+    return CONSOLE if reporter is None else reporter
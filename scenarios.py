@@ -0,0 +1,293 @@
+import pandas as pd
+import numpy as np
+import sys
+import json
+import itertools
+import time
+
+from schema import TRANSACTIONS_SCHEMA, TRANSFERS_SCHEMA, CLIENTS_SCHEMA
+from reader import find_files, read_table, read_tables, concat_tables, write_csv
+from client_analyzer import DEFAULT_EXCLUDED_CATEGORIES
+from transfer_analyzer import EXCHANGE_RATES, FX_TRANSACTION_THRESHOLD, LOAN_PAYMENT_THRESHOLD
+from assumptions import (TRAVEL_CATEGORIES, HOME_CATEGORIES, JEWELRY_CATEGORIES,
+                         BALANCE_BANDS, PREMIUM_SPENDING_CUTOFF, DEFAULT_PRODUCT, PRODUCTS, product_rules)
+from cohorts import COHORT_CLIENT_COLUMNS, compute_cohort_features
+from time_features import RECENT_WINDOW_DAYS
+
+def read_folder(folder_path, schema, columns):
+    """Read the given columns of every input file of one format in a folder"""
+
+    frames = [df for _, df in read_tables(find_files(folder_path, schema), schema, columns)]
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    return concat_tables(frames)
+
+def build_base_aggregates(transactions_folder='Transactions', transfers_folder='Transfers', clients_path='clients.csv'):
+    """
+    Load the raw data once and reduce it to the per-client aggregates every
+    scenario is evaluated from.
+
+    Args:
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        clients_path (str): Path to the client attributes CSV
+
+    Returns:
+        dict: Client codes, the clients x categories spend matrix and the
+              per-client transfer counters, balances and cohort balance ranks
+    """
+
+    transactions = read_folder(transactions_folder, TRANSACTIONS_SCHEMA,
+                               ['client_code', 'date', 'category', 'amount', 'currency'])
+    transfers = read_folder(transfers_folder, TRANSFERS_SCHEMA,
+                            ['client_code', 'date', 'type', 'direction', 'amount', 'currency'])
+
+    # End of the recent window, as in time_features.py: the last date in either input
+    as_of = max(transactions['date'].max(), transfers['date'].max())
+    clients = read_table(clients_path, CLIENTS_SCHEMA, COHORT_CLIENT_COLUMNS)
+
+    transactions = transactions.dropna(subset=['amount'])
+
+    # Cohort ranks over every client, like cohorts.py, before the client set is narrowed
+    cohort_spending = transactions.groupby(['client_code', 'category'], observed=True)['amount'].sum().reset_index()
+    cohort_features, _ = compute_cohort_features(clients, cohort_spending)
+
+    # Same client set as final_result.csv: clients with both transactions and transfers
+    client_codes = np.intersect1d(transactions['client_code'].unique(), transfers['client_code'].unique())
+    transactions = transactions[transactions['client_code'].isin(client_codes)]
+    transfers = transfers[transfers['client_code'].isin(client_codes)]
+
+    # Clients x categories spend matrix, plus which cells actually had transactions
+    category_codes, categories = pd.factorize(transactions['category'], sort=True)
+    rows = np.searchsorted(client_codes, transactions['client_code'].to_numpy())
+
+    spend = np.zeros((len(client_codes), len(categories)))
+    np.add.at(spend, (rows, category_codes), transactions['amount'].to_numpy())
+    present = np.zeros(spend.shape, dtype=bool)
+    present[rows, category_codes] = True
+
+    currency_count = transactions.groupby('client_code')['currency'].nunique().reindex(client_codes).to_numpy()
+
+    # Transfer counters, in KZT like transfer_analyzer
+    amount_kzt = transfers['amount'] * transfers['currency'].astype(str).map(EXCHANGE_RATES).fillna(1)
+    inflows = amount_kzt.where(transfers['direction'] == 'in', 0).groupby(transfers['client_code']).sum()
+    outflows = amount_kzt.where(transfers['direction'] == 'out', 0).groupby(transfers['client_code']).sum()
+    fx_count = transfers['type'].isin(['fx_buy', 'fx_sell']).groupby(transfers['client_code']).sum()
+    loan_count = (transfers['type'] == 'loan_payment_out').groupby(transfers['client_code']).sum()
+
+    # FX events of the last RECENT_WINDOW_DAYS days, time_features.py's fx_events_30d
+    recent = transfers['date'].between(as_of - pd.Timedelta(days=RECENT_WINDOW_DAYS), as_of)
+    fx_30d = (transfers['type'].isin(['fx_buy', 'fx_sell']) & recent).groupby(transfers['client_code']).sum()
+
+    total = (inflows - outflows).round(2).reindex(client_codes).to_numpy()
+
+    balance = (clients.drop_duplicates('client_code').set_index('client_code')['avg_monthly_balance_KZT']
+               .reindex(client_codes).to_numpy(dtype=float))
+
+    balance_percentile = (cohort_features.set_index('client_code')['balance_percentile']
+                          .reindex(client_codes).to_numpy(dtype=float))
+
+    return {
+        'client_codes': client_codes,
+        'categories': np.asarray(categories),
+        'spend': spend,
+        'present': present,
+        'currency_count': currency_count,
+        'fx_count': fx_count.reindex(client_codes).to_numpy(),
+        'loan_count': loan_count.reindex(client_codes).to_numpy(),
+        'fx_events_30d': fx_30d.reindex(client_codes).to_numpy(),
+        'spending': np.abs(total),
+        'balance': balance,
+        'balance_percentile': balance_percentile
+    }
+
+def expand_grid(grid):
+    """
+    Expand a grid of setting values into the list of all scenario configurations.
+
+    Args:
+        grid (dict): Setting name -> list of values to try; missing settings
+                     keep their current pipeline value
+
+    Returns:
+        list: One dict per scenario
+    """
+
+    defaults = {
+        'excluded_categories': [list(DEFAULT_EXCLUDED_CATEGORIES)],
+        'fx_threshold': [FX_TRANSACTION_THRESHOLD],
+        'loan_threshold': [LOAN_PAYMENT_THRESHOLD],
+        'balance_bands': [list(BALANCE_BANDS)],
+        'spending_cutoff': [PREMIUM_SPENDING_CUTOFF]
+    }
+
+    unknown = set(grid) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown scenario settings: {sorted(unknown)}")
+
+    values = {name: grid.get(name, default) for name, default in defaults.items()}
+
+    return [dict(zip(values, combo)) for combo in itertools.product(*values.values())]
+
+def top5_features(base, excluded_categories):
+    """
+    Category-driven rule inputs for one exclusion list, for all clients at once.
+
+    Returns:
+        dict: Per-client travel/home counts in the top 5, jewelry presence and
+              whether any non-excluded category is left
+    """
+
+    categories = base['categories']
+    excluded = np.isin(categories, excluded_categories)
+
+    # Excluded or never-used categories can not make it into the top 5
+    masked = np.where(base['present'] & ~excluded, base['spend'], -np.inf)
+    top = np.argsort(-masked, axis=1, kind='stable')[:, :5]
+    in_top = np.isfinite(np.take_along_axis(masked, top, axis=1))
+
+    def count_in_top(group):
+        return (np.isin(categories, group)[top] & in_top).sum(axis=1)
+
+    return {
+        'travel_count': count_in_top(TRAVEL_CATEGORIES),
+        'home_count': count_in_top(HOME_CATEGORIES),
+        'has_jewelry': count_in_top(JEWELRY_CATEGORIES) > 0,
+        'has_data': in_top[:, 0] if top.shape[1] else np.zeros(len(masked), dtype=bool)
+    }
+
+def evaluate_scenarios(base, scenarios):
+    """
+    Apply the recommendation rules for every scenario.
+
+    Scenarios sharing an exclusion list share one top-5 computation; the
+    threshold settings are broadcast as a scenarios x clients array.
+
+    Args:
+        base (dict): Output of build_base_aggregates
+        scenarios (list): Scenario configurations from expand_grid
+
+    Returns:
+        pd.DataFrame: One row per scenario with coverage and per-product counts
+    """
+
+    total_clients = len(base['client_codes'])
+    rows = [None] * len(scenarios)
+
+    # Group scenarios by exclusion list
+    groups = {}
+    for i, scenario in enumerate(scenarios):
+        groups.setdefault(tuple(sorted(scenario['excluded_categories'])), []).append(i)
+
+    for excluded, indices in groups.items():
+        features = top5_features(base, list(excluded))
+
+        # Settings as column vectors so every comparison yields scenarios x clients
+        fx_threshold = np.array([scenarios[i]['fx_threshold'] for i in indices])[:, None]
+        loan_threshold = np.array([scenarios[i]['loan_threshold'] for i in indices])[:, None]
+        bands = np.array([scenarios[i]['balance_bands'] for i in indices], dtype=float)
+        low_band, mid_band, high_band = bands[:, 0:1], bands[:, 1:2], bands[:, 2:3]
+        spending_cutoff = np.array([scenarios[i]['spending_cutoff'] for i in indices])[:, None]
+
+        # Same rules as assumptions.py, broadcast to scenarios x clients
+        recommended = product_rules(
+            features['travel_count'][None, :],
+            features['home_count'][None, :],
+            features['has_jewelry'][None, :],
+            base['loan_count'][None, :] >= loan_threshold,
+            base['fx_count'][None, :] >= fx_threshold,
+            base['currency_count'][None, :],
+            base['balance'][None, :],
+            base['spending'][None, :],
+            balance_bands=(low_band, mid_band, high_band),
+            spending_cutoff=spending_cutoff,
+            balance_percentile=base['balance_percentile'][None, :],
+            fx_events_30d=base['fx_events_30d'][None, :]
+        )
+        shape = (len(indices), total_clients)
+        recommended = {product: np.broadcast_to(mask, shape) for product, mask in recommended.items()}
+
+        any_product = np.zeros(shape, dtype=bool)
+        for mask in recommended.values():
+            any_product |= mask
+
+        category_coverage = features['has_data'].sum() / total_clients * 100
+
+        for position, i in enumerate(indices):
+            scenario = scenarios[i]
+            row = {
+                'scenario': i + 1,
+                'excluded_categories': '; '.join(scenario['excluded_categories']),
+                'fx_threshold': scenario['fx_threshold'],
+                'loan_threshold': scenario['loan_threshold'],
+                'balance_bands': '/'.join(str(edge) for edge in scenario['balance_bands']),
+                'spending_cutoff': scenario['spending_cutoff'],
+                'category_coverage_percent': round(category_coverage, 1),
+                'recommendation_coverage_percent': round(any_product[position].sum() / total_clients * 100, 1)
+            }
+            for product in PRODUCTS:
+                row[product] = int(recommended[product][position].sum())
+            row[DEFAULT_PRODUCT] = int((~any_product[position]).sum())
+
+            rows[i] = row
+
+    return pd.DataFrame(rows)
+
+def run_sweep(grid, output_file='scenario_comparison.csv', transactions_folder='Transactions',
+              transfers_folder='Transfers', clients_path='clients.csv'):
+    """
+    Evaluate a grid of pipeline settings and save the comparison table.
+
+    Args:
+        grid (dict): Setting name -> list of values (see expand_grid)
+        output_file (str): Name of output CSV file
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        clients_path (str): Path to the client attributes CSV
+
+    Returns:
+        pd.DataFrame: The comparison table
+    """
+
+    scenarios = expand_grid(grid)
+    print(f"Evaluating {len(scenarios)} scenarios...")
+
+    start_time = time.time()
+    base = build_base_aggregates(transactions_folder, transfers_folder, clients_path)
+    print(f"Built base aggregates for {len(base['client_codes'])} clients in {time.time() - start_time:.2f} seconds")
+
+    start_time = time.time()
+    comparison_df = evaluate_scenarios(base, scenarios)
+    print(f"Evaluated scenarios in {time.time() - start_time:.2f} seconds")
+
+    write_csv(comparison_df, output_file)
+    print(f"\nComparison saved to: {output_file}")
+
+    return comparison_df
+
+if __name__ == "__main__":
+    # Optional JSON grid, e.g. {"fx_threshold": [3, 5, 7], "spending_cutoff": [5000000, 10000000]}
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            grid = json.load(f)
+    else:
+        grid = {
+            'excluded_categories': [list(DEFAULT_EXCLUDED_CATEGORIES), []],
+            'fx_threshold': [3, 5, 7],
+            'loan_threshold': [5, 10],
+            'balance_bands': [list(BALANCE_BANDS)],
+            'spending_cutoff': [5000000, PREMIUM_SPENDING_CUTOFF]
+        }
+
+    try:
+        results = run_sweep(grid)
+
+        print(f"\nFirst 5 scenarios:")
+        print(results.head().to_string(index=False))
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
+    except ValueError as e:
+        print(f"❌ Error: {e}")
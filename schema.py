@@ -0,0 +1,72 @@
+"""
+Column layouts of the raw input files.
+
+Every reader takes its dtypes from here instead of letting pandas infer them
+file by file.
+"""
+
+# Encoding of every CSV the stages write: UTF-8 with a byte order mark, so
+# spreadsheet tools show the Cyrillic text correctly. Inputs are read in
+# whatever encoding reader.detect_encoding finds.
+OUTPUT_ENCODING = 'utf-8-sig'
+
+# Format of the `date` column in transactions and transfers
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Transactions/client_<N>_transactions_3m.csv
+TRANSACTIONS_SCHEMA = {
+    'file_pattern': '*_transactions_*.csv',
+    'dtypes': {
+        'client_code': 'int64',
+        'name': 'str',
+        'product': 'category',
+        'status': 'category',
+        'city': 'category',
+        'date': 'datetime64[s]',
+        'category': 'category',
+        'amount': 'float64',
+        'currency': 'category'
+    },
+    'date_columns': ['date']
+}
+
+# Transfers/client_<N>_transfers_3m.csv
+TRANSFERS_SCHEMA = {
+    'file_pattern': '*_transfers_*.csv',
+    'dtypes': {
+        'client_code': 'int64',
+        'name': 'str',
+        'product': 'category',
+        'status': 'category',
+        'city': 'category',
+        'date': 'datetime64[s]',
+        'type': 'category',
+        'direction': 'category',
+        'amount': 'float64',
+        'currency': 'category'
+    },
+    'date_columns': ['date']
+}
+
+# clients.csv
+CLIENTS_SCHEMA = {
+    'file_pattern': 'clients.csv',
+    'dtypes': {
+        'client_code': 'int64',
+        'name': 'str',
+        'status': 'category',
+        # Nullable: a client without an age or balance is read with <NA> there
+        'age': 'Int64',
+        'city': 'category',
+        'avg_monthly_balance_KZT': 'Int64'
+    },
+    'date_columns': []
+}
+
+# time_features.csv (written by time_features.py, joined into final_result.csv)
+TIME_FEATURE_COLUMNS = ['client_code', 'avg_monthly_spend', 'avg_weekly_spend', 'spend_30d', 'spend_trend_slope',
+                        'inflow_velocity', 'outflow_velocity', 'net_flow_trend_slope', 'fx_events_30d',
+                        'loan_payments_30d', 'days_since_fx', 'days_since_loan_payment']
+
+# cohort_features.csv (written by cohorts.py, joined into final_result.csv)
+COHORT_FEATURE_COLUMNS = ['client_code', 'cohort', 'cohort_size', 'balance_percentile', 'spend_percentile']
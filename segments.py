@@ -0,0 +1,315 @@
+"""
+Segment queries over the client features, answered from bitmap indexes.
+
+Every (field, value) pair gets a bitmap with one bit per client, packed 8
+clients to a byte. A query such as
+
+    city=Алматы and have_fx=1 and balance_band=400000-750000 and category=Путешествия
+
+is evaluated with bitwise and/or/not over those bitmaps, so it touches a few
+bytes per client instead of the feature tables. The index is saved next to
+its inputs and rebuilt when they change.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import re
+import argparse
+
+from schema import CLIENTS_SCHEMA
+from reader import read_table, read_csv_file
+from assumptions import BALANCE_BANDS
+
+# Fields taken as they are from final_result.csv and from clients.csv
+FEATURE_FIELDS = ['product', 'have_fx', 'loan_p_o']
+CLIENT_FIELDS = ['city', 'status']
+
+# Top-5 category columns, indexed together as the 'category' field
+CATEGORY_COLUMNS = [f'category_{i}' for i in range(1, 6)]
+
+INDEX_FILE = 'segment_index.npz'
+
+# Separates field and value in the saved bitmap names
+KEY_SEPARATOR = '\x1f'
+
+def balance_band_labels(bands=BALANCE_BANDS):
+    """Labels of the balance bands between the rule band edges"""
+
+    edges = [str(edge) for edge in bands]
+    return [f'<{edges[0]}'] + [f'{low}-{high}' for low, high in zip(edges, edges[1:])] + [f'{edges[-1]}+']
+
+def balance_band(balance, bands=BALANCE_BANDS):
+    """Band label of every balance (empty for missing balances); bands are (low, high] like the rules"""
+
+    labels = np.array(balance_band_labels(bands), dtype=object)
+    band = np.searchsorted(np.asarray(bands), balance, side='left')
+    return np.where(np.isnan(balance), '', labels[np.minimum(band, len(labels) - 1)])
+
+class SegmentIndex:
+    """
+    Packed bitmaps per (field, value) over a fixed, sorted list of clients.
+
+    Build with SegmentIndex.build() or SegmentIndex.load(); query with
+    query(), which understands `field=value`, `field!=value`,
+    `field in (a, b)`, and/or/not and parentheses. Values with spaces are
+    quoted.
+    """
+
+    def __init__(self, client_codes, names, bitmaps):
+        self.client_codes = client_codes
+        self.names = names
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def build(cls, features_path='final_result.csv', clients_path='clients.csv'):
+        """
+        Index the features of every client in final_result.csv.
+
+        A client with several rows (one per product) matches a value when any
+        of its rows has it.
+        """
+
+        features = read_csv_file(features_path)
+        clients = read_table(clients_path, CLIENTS_SCHEMA, ['client_code', 'status', 'city', 'avg_monthly_balance_KZT'])
+
+        client_codes, rows = np.unique(features['client_code'].to_numpy(), return_inverse=True)
+        names = features.drop_duplicates('client_code').set_index('client_code')['name'].reindex(client_codes).to_numpy()
+
+        attributes = clients.drop_duplicates('client_code').set_index('client_code').reindex(client_codes)
+        balance = attributes['avg_monthly_balance_KZT'].to_numpy(dtype=float)
+
+        # (row client position, value) pairs of every field
+        values = {field: (rows, features[field]) for field in FEATURE_FIELDS}
+        for field in CLIENT_FIELDS:
+            values[field] = (np.arange(len(client_codes)), attributes[field])
+        values['balance_band'] = (np.arange(len(client_codes)), pd.Series(balance_band(balance)))
+
+        categories = features[CATEGORY_COLUMNS].melt(ignore_index=False)['value']
+        values['category'] = (rows[categories.index], categories)
+
+        bitmaps = {}
+        for field, (positions, column) in values.items():
+            column = pd.Series(column).astype(str).to_numpy()
+            present = (column != '') & (column != 'nan')
+            codes, uniques = pd.factorize(column[present])
+
+            # One bool row per value, set in a single scatter, then packed
+            bits = np.zeros((len(uniques), len(client_codes)), dtype=bool)
+            bits[codes, positions[present]] = True
+            packed = np.packbits(bits, axis=1)
+
+            bitmaps[field] = {value: packed[i] for i, value in enumerate(uniques)}
+
+        # Every balance band is a valid value, also when no client falls in it
+        empty = np.zeros((len(client_codes) + 7) // 8, dtype=np.uint8)
+        for label in balance_band_labels():
+            bitmaps['balance_band'].setdefault(label, empty)
+
+        return cls(client_codes, names, bitmaps)
+
+    def save(self, path=INDEX_FILE):
+        arrays = {f'{field}{KEY_SEPARATOR}{value}': bitmap
+                  for field, values in self.bitmaps.items() for value, bitmap in values.items()}
+        np.savez_compressed(path, client_codes=self.client_codes, names=self.names.astype(str), **arrays)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        bitmaps = {}
+        with np.load(path) as data:
+            client_codes = data['client_codes']
+            names = data['names'].astype(object)
+            for key in data.files:
+                if KEY_SEPARATOR in key:
+                    field, value = key.split(KEY_SEPARATOR, 1)
+                    bitmaps.setdefault(field, {})[value] = data[key]
+
+        return cls(client_codes, names, bitmaps)
+
+    @property
+    def size(self):
+        return len(self.client_codes)
+
+    def fields(self):
+        """Field -> sorted list of indexed values"""
+        return {field: sorted(values) for field, values in self.bitmaps.items()}
+
+    def bitmap(self, field, value):
+        """Bitmap of the clients with field == value"""
+
+        if field not in self.bitmaps:
+            raise ValueError(f"Unknown segment field: {field} (known: {', '.join(sorted(self.bitmaps))})")
+        if str(value) not in self.bitmaps[field]:
+            raise ValueError(f"Unknown value for segment field {field}: {value} (known: {', '.join(sorted(self.bitmaps[field]))})")
+        return self.bitmaps[field][str(value)]
+
+    def query(self, expression):
+        """
+        Evaluate a segment query.
+
+        Args:
+            expression (str): e.g. 'city=Алматы and (have_fx=1 or loan_p_o=1)'
+
+        Returns:
+            dict: count, share of all clients, and the matching client_codes and names
+        """
+
+        bitmap = QueryParser(self, expression).parse()
+        matches = np.flatnonzero(np.unpackbits(bitmap, count=self.size))
+
+        return {
+            'count': len(matches),
+            'share_percent': round(len(matches) / self.size * 100, 1) if self.size else 0.0,
+            'client_codes': self.client_codes[matches].tolist(),
+            'names': self.names[matches].tolist()
+        }
+
+class QueryParser:
+    """Recursive-descent evaluation of a segment query over a SegmentIndex"""
+
+    TOKEN = re.compile(r'\s*(\(|\)|,|!=|=|"[^"]*"|\'[^\']*\'|[^\s()=!,]+)')
+
+    def __init__(self, index, expression):
+        self.index = index
+        self.tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = self.TOKEN.match(expression, position)
+            if not match:
+                raise ValueError(f"Can not parse segment query at: {expression[position:]}")
+            self.tokens.append(match.group(1))
+            position = match.end()
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def keyword(self, word):
+        token = self.peek()
+        if token is not None and token.lower() == word:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, token):
+        if self.peek() != token:
+            raise ValueError(f"Expected '{token}' in segment query, got {repr(self.peek()) if self.peek() else 'the end'}")
+        self.position += 1
+
+    def value(self):
+        token = self.peek()
+        if token is None or token in ('(', ')', ',', '=', '!='):
+            raise ValueError(f"Expected a value in segment query, got {repr(token) if token else 'the end'}")
+        self.position += 1
+        return token[1:-1] if token[0] in '"\'' else token
+
+    def parse(self):
+        bitmap = self.expression()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected '{self.peek()}' in segment query")
+        return bitmap
+
+    def expression(self):
+        bitmap = self.term()
+        while self.keyword('or'):
+            bitmap = bitmap | self.term()
+        return bitmap
+
+    def term(self):
+        bitmap = self.factor()
+        while self.keyword('and'):
+            bitmap = bitmap & self.factor()
+        return bitmap
+
+    def factor(self):
+        if self.keyword('not'):
+            # Padding bits past the last client are ignored when unpacking
+            return ~self.factor()
+
+        if self.peek() == '(':
+            self.expect('(')
+            bitmap = self.expression()
+            self.expect(')')
+            return bitmap
+
+        field = self.value()
+
+        if self.keyword('in'):
+            self.expect('(')
+            bitmap = self.index.bitmap(field, self.value())
+            while self.peek() == ',':
+                self.expect(',')
+                bitmap = bitmap | self.index.bitmap(field, self.value())
+            self.expect(')')
+            return bitmap
+
+        operator = self.peek()
+        if operator not in ('=', '!='):
+            raise ValueError(f"Expected '=', '!=' or 'in' after '{field}' in segment query")
+        self.position += 1
+
+        bitmap = self.index.bitmap(field, self.value())
+        return ~bitmap if operator == '!=' else bitmap
+
+def load_index(features_path='final_result.csv', clients_path='clients.csv', index_path=INDEX_FILE, rebuild=False):
+    """
+    Load the saved segment index, rebuilding it when an input is newer.
+
+    Returns:
+        SegmentIndex: The index over the current inputs
+    """
+
+    inputs_changed = rebuild or not os.path.exists(index_path) or (
+        max(os.path.getmtime(features_path), os.path.getmtime(clients_path)) > os.path.getmtime(index_path))
+
+    if not inputs_changed:
+        return SegmentIndex.load(index_path)
+
+    index = SegmentIndex.build(features_path, clients_path)
+    index.save(index_path)
+    return index
+
+def query_segment(expression, features_path='final_result.csv', clients_path='clients.csv', index_path=INDEX_FILE):
+    """
+    Answer one segment query.
+
+    Args:
+        expression (str): Segment query (see SegmentIndex.query)
+        features_path (str): Path to final_result.csv
+        clients_path (str): Path to the client attributes CSV
+        index_path (str): Where the index is saved
+
+    Returns:
+        dict: count, share_percent, client_codes and names of the segment
+    """
+
+    return load_index(features_path, clients_path, index_path).query(expression)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count and list the clients of a segment")
+    parser.add_argument('query', nargs='?', help="e.g. \"city=Алматы and have_fx=1 and category=Путешествия\"")
+    parser.add_argument('--fields', action='store_true', help="list the indexed fields and their values")
+    parser.add_argument('--limit', type=int, default=20, help="number of clients to list (default: 20)")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the index even if the inputs did not change")
+    args = parser.parse_args()
+
+    try:
+        index = load_index(rebuild=args.rebuild)
+
+        if args.fields or not args.query:
+            for field, values in index.fields().items():
+                print(f"{field}: {', '.join(values)}")
+
+        if args.query:
+            result = index.query(args.query)
+            print(f"\nClients in segment: {result['count']} of {index.size} ({result['share_percent']}%)")
+            for client_code, name in list(zip(result['client_codes'], result['names']))[:args.limit]:
+                print(f"  {client_code}: {name}")
+            if result['count'] > args.limit:
+                print(f"  ... and {result['count'] - args.limit} more")
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
+    except ValueError as e:
+        print(f"❌ Error: {e}")
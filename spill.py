@@ -0,0 +1,231 @@
+"""
+Helpers for running stages under a memory budget.
+
+Large inputs are split into partitions by a hash of client_code and the
+partitions are spilled to temporary files, so a stage only ever holds one
+partition in memory. Every client lands in exactly one partition, which keeps
+per-client aggregations and client_code joins exact.
+"""
+
+import pandas as pd
+import os
+import sys
+import json
+import math
+import pickle
+import resource
+import tempfile
+
+from reader import concat_tables
+
+# In-memory size of a parsed table relative to its CSV size (strings, index, copies)
+MEMORY_EXPANSION = 4
+
+UNITS = {
+    'B': 1,
+    'K': 1024, 'KB': 1024,
+    'M': 1024 ** 2, 'MB': 1024 ** 2,
+    'G': 1024 ** 3, 'GB': 1024 ** 3
+}
+
+def parse_memory_limit(text):
+    """
+    Parse a memory limit such as '512MB', '2G' or '1048576'.
+
+    Returns:
+        int: Limit in bytes, or None when text is empty
+    """
+
+    if text is None or str(text).strip() == '':
+        return None
+
+    text = str(text).strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):] or 'B'
+
+    if unit not in UNITS or not number:
+        raise ValueError(f"Invalid memory limit: {text}")
+
+    return int(float(number) * UNITS[unit])
+
+def format_bytes(size):
+    """Human-readable byte count"""
+
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} GB"
+
+def peak_memory_bytes():
+    """Peak resident memory of this process so far"""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def partition_count(input_bytes, memory_limit):
+    """
+    Number of partitions needed so one partition fits the memory limit.
+
+    Args:
+        input_bytes (int): Size of the input files on disk
+        memory_limit (int): Budget in bytes, or None for no limit
+
+    Returns:
+        int: 1 when everything fits in memory
+    """
+
+    if not memory_limit:
+        return 1
+
+    return max(1, math.ceil(input_bytes * MEMORY_EXPANSION / memory_limit))
+
+def partition_of(df, num_partitions, key='client_code'):
+    """Partition number of every row, from a hash of the key column"""
+
+    hashes = pd.util.hash_pandas_object(df[key], index=False).to_numpy()
+    return hashes % num_partitions
+
+class SpillPartitioner:
+    """
+    Hash-partition tables into temporary files and read them back one
+    partition at a time.
+
+    Use as a context manager; the temporary directory is removed on exit.
+    """
+
+    def __init__(self, num_partitions, key='client_code'):
+        self.num_partitions = num_partitions
+        self.key = key
+        self.spilled_bytes = 0
+        self.directory = None
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='spill_')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.directory.cleanup()
+
+    def path(self, name, partition):
+        return os.path.join(self.directory.name, f"{name}_{partition}.pkl")
+
+    def add(self, name, df):
+        """Append the rows of df to the partition files of table `name`"""
+
+        if df.empty:
+            return
+
+        partitions = partition_of(df, self.num_partitions, self.key)
+
+        for partition in range(self.num_partitions):
+            part = df[partitions == partition]
+            if part.empty:
+                continue
+
+            # Several chunks are appended to the same file and read back in order
+            with open(self.path(name, partition), 'ab') as f:
+                start = f.tell()
+                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.spilled_bytes += f.tell() - start
+
+    def load(self, name, partition, columns=None):
+        """
+        Read one partition of table `name` back and delete its file.
+
+        Args:
+            name (str): Table name used with add()
+            partition (int): Partition number
+            columns (list): Columns of an empty result when nothing was spilled
+
+        Returns:
+            pd.DataFrame: All rows of the partition
+        """
+
+        path = self.path(name, partition)
+
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=columns)
+
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    chunks.append(pickle.load(f))
+                except EOFError:
+                    break
+
+        os.remove(path)
+
+        return concat_tables(chunks)
+
+    def add_sorted(self, name, partition, df, chunk_rows):
+        """Spill one partition's result, already sorted by the key, in chunks of chunk_rows rows"""
+
+        with open(self.path(name, partition), 'ab') as f:
+            for start in range(0, len(df), chunk_rows):
+                position = f.tell()
+                pickle.dump(df.iloc[start:start + chunk_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.spilled_bytes += f.tell() - position
+
+    def read_merged(self, name):
+        """
+        Read the sorted partitions of table `name` back as one key-sorted stream.
+
+        Holds one chunk per partition at a time. Every round emits the rows up
+        to the smallest last key of the chunks held, which no chunk still to be
+        read can undercut; the files are deleted afterwards.
+
+        Yields:
+            pd.DataFrame: Consecutive chunks of the merged table
+        """
+
+        files = [open(self.path(name, partition), 'rb') for partition in range(self.num_partitions)
+                 if os.path.exists(self.path(name, partition))]
+
+        def next_chunk(f):
+            try:
+                return pickle.load(f)
+            except EOFError:
+                return None
+
+        try:
+            held = [next_chunk(f) for f in files]
+
+            while any(chunk is not None for chunk in held):
+                bound = min(chunk[self.key].iloc[-1] for chunk in held if chunk is not None)
+
+                emitted = []
+                for i, chunk in enumerate(held):
+                    if chunk is None:
+                        continue
+                    upto = int(chunk[self.key].searchsorted(bound, side='right'))
+                    emitted.append(chunk.iloc[:upto])
+                    held[i] = chunk.iloc[upto:] if upto < len(chunk) else next_chunk(files[i])
+
+                yield concat_tables(emitted).sort_values(self.key, kind='stable')
+        finally:
+            for f in files:
+                f.close()
+                os.remove(f.name)
+
+def record_stats(stats_file, stage, stats):
+    """Append one stage's run statistics as a JSON line (no-op without a file)"""
+
+    if not stats_file:
+        return
+
+    with open(stats_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'stage': stage, **stats}) + '\n')
+
+def read_stats(stats_file):
+    """Read the statistics recorded with record_stats"""
+
+    if not stats_file or not os.path.exists(stats_file):
+        return []
+
+    with open(stats_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
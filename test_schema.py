@@ -0,0 +1,46 @@
+import pandas as pd
+import numpy as np
+
+from schema import CLIENTS_SCHEMA
+from reader import read_table
+from joiner import BALANCE_COLUMNS, join_feature_tables
+from cohorts import COHORT_CLIENT_COLUMNS, compute_cohort_features
+
+CLIENTS_CSV = """client_code,name,status,age,city,avg_monthly_balance_KZT
+1,Айгерим,Зарплатный клиент,29,Алматы,92643
+2,Данияр,Премиальный клиент,,Астана,
+"""
+
+def write_clients(tmp_path):
+    path = tmp_path / 'clients.csv'
+    path.write_text(CLIENTS_CSV, encoding='utf-8')
+    return str(path)
+
+def test_client_without_age_or_balance_is_read(tmp_path):
+    clients = read_table(write_clients(tmp_path), CLIENTS_SCHEMA)
+
+    assert len(clients) == 2
+    assert clients['age'].isna().tolist() == [False, True]
+    assert clients['avg_monthly_balance_KZT'].isna().tolist() == [False, True]
+    assert clients.loc[0, 'avg_monthly_balance_KZT'] == 92643
+
+def test_missing_balance_survives_the_join(tmp_path):
+    balance = read_table(write_clients(tmp_path), CLIENTS_SCHEMA, BALANCE_COLUMNS)
+    categories = pd.DataFrame({'client_code': [1, 2], 'name': ['Айгерим', 'Данияр'], 'cat1': ['Такси', 'АЗС']})
+    transfers = pd.DataFrame({'client_code': [1, 2], 'name': ['Айгерим', 'Данияр'], 'total': [10.0, 20.0]})
+
+    joined, coverage, _ = join_feature_tables(categories, transfers, balance)
+
+    assert joined['client_code'].tolist() == [1, 2]
+    assert joined['avg_monthly_balance_KZT'].isna().tolist() == [False, True]
+    assert coverage['client attributes']['left_unmatched'] == 0
+
+def test_missing_age_and_balance_get_no_cohort_rank(tmp_path):
+    clients = read_table(write_clients(tmp_path), CLIENTS_SCHEMA, COHORT_CLIENT_COLUMNS)
+    spending = pd.DataFrame({'client_code': [1, 2], 'category': ['Такси', 'АЗС'], 'amount': [100.0, 200.0]})
+
+    features, _ = compute_cohort_features(clients, spending, min_cohort_size=1)
+
+    assert features['cohort'].tolist() == ['Алматы / Зарплатный клиент / 25-34', 'Астана / Премиальный клиент / ']
+    assert features.loc[0, 'balance_percentile'] == 100
+    assert np.isnan(features.loc[1, 'balance_percentile'])
@@ -0,0 +1,294 @@
+import pandas as pd
+import numpy as np
+import argparse
+
+from schema import TRANSACTIONS_SCHEMA, TRANSFERS_SCHEMA
+from plan import Scan, Project, execute_partitioned, optimize, explain
+from reader import write_csv
+from spill import parse_memory_limit, format_bytes, record_stats
+from report import as_reporter
+from transfer_analyzer import EXCHANGE_RATES
+
+# Length of the recent-activity window, ending at the last date in the data
+RECENT_WINDOW_DAYS = 30
+
+# Spacing of client blocks in the combined (client, time) sort key; larger than
+# any timestamp in seconds, so one client's events never overlap the next one's
+CLIENT_KEY_STRIDE = 10 ** 11
+
+def time_plan(transactions_folder, transfers_folder):
+    """Plan for the time features: dated transactions and transfers"""
+    return {
+        'transactions': Project(Scan(transactions_folder, TRANSACTIONS_SCHEMA),
+                                ['client_code', 'date', 'category', 'amount']),
+        'transfers': Project(Scan(transfers_folder, TRANSFERS_SCHEMA),
+                             ['client_code', 'date', 'type', 'direction', 'amount', 'currency'])
+    }
+
+def event_keys(client_index, dates):
+    """Sortable int64 key of (client, timestamp in seconds)"""
+    seconds = dates.to_numpy(dtype='datetime64[s]').astype(np.int64)
+    return client_index.astype(np.int64) * CLIENT_KEY_STRIDE + seconds
+
+def window_sums(keys, values, client_index, start, end):
+    """
+    Sum of values per client over [start, end], using a cumulative sum that
+    restarts at every client and two binary searches on the sorted
+    (client, time) keys. Restarting keeps each client's sums independent of
+    the other clients' values, so a partitioned run gives the same figures.
+
+    Args:
+        keys (np.ndarray): Sorted event keys from event_keys
+        values (np.ndarray): Value of every event, in key order
+        client_index (np.ndarray): Clients to evaluate
+        start (np.datetime64): Window start (inclusive)
+        end (np.datetime64): Window end (inclusive)
+
+    Returns:
+        tuple: (sums, counts) per client
+    """
+
+    base = client_index.astype(np.int64) * CLIENT_KEY_STRIDE
+
+    lo = np.searchsorted(keys, base + start.astype('datetime64[s]').astype(np.int64), side='left')
+    hi = np.searchsorted(keys, base + end.astype('datetime64[s]').astype(np.int64), side='right')
+
+    if len(keys) == 0:
+        return np.zeros(len(client_index)), hi - lo
+
+    # Running total within each client; events before the window but of the same client are subtracted
+    cumulative = pd.Series(values).groupby(keys // CLIENT_KEY_STRIDE, sort=False).cumsum().to_numpy()
+    client_start = np.searchsorted(keys, base, side='left')
+
+    upto_end = np.where(hi > lo, cumulative[np.maximum(hi - 1, 0)], 0.0)
+    before_start = np.where((hi > lo) & (lo > client_start), cumulative[np.maximum(lo - 1, 0)], 0.0)
+
+    return upto_end - before_start, hi - lo
+
+def days_since_last(keys, client_index, as_of):
+    """
+    Days from each client's last event up to as_of (NaN when there is none).
+
+    Args:
+        keys (np.ndarray): Sorted event keys of one event type
+        client_index (np.ndarray): Clients to evaluate
+        as_of (np.datetime64): Reference date
+    """
+
+    base = client_index.astype(np.int64) * CLIENT_KEY_STRIDE
+    as_of_seconds = as_of.astype('datetime64[s]').astype(np.int64)
+
+    last = np.searchsorted(keys, base + as_of_seconds, side='right') - 1
+    safe_last = np.clip(last, 0, max(len(keys) - 1, 0))
+    has_event = (last >= 0) & (len(keys) > 0)
+    if len(keys):
+        has_event &= keys[safe_last] >= base
+
+    last_seconds = keys[safe_last] - base if len(keys) else np.zeros(len(client_index), dtype=np.int64)
+    return np.where(has_event, (as_of_seconds - last_seconds) / 86400, np.nan)
+
+def monthly_slope(client_index, months, values, num_clients, num_months):
+    """
+    Least-squares slope of monthly totals per client (per month), with months
+    without activity counted as zero.
+    """
+
+    totals = np.zeros((num_clients, num_months))
+    np.add.at(totals, (client_index, months), values)
+
+    if num_months < 2:
+        return np.zeros(num_clients)
+
+    x = np.arange(num_months) - (num_months - 1) / 2
+    return (totals - totals.mean(axis=1, keepdims=True)) @ x / (x ** 2).sum()
+
+def category_spend_by_period(transactions):
+    """
+    Spend per client, category and calendar month / week.
+
+    Returns:
+        pd.DataFrame: client_code, category, period, period_start, amount
+    """
+
+    tables = []
+
+    for period, freq in [('month', 'M'), ('week', 'W')]:
+        period_start = transactions['date'].dt.to_period(freq).dt.start_time
+        table = (transactions.groupby(['client_code', 'category', period_start.rename('period_start')], observed=True)
+                 ['amount'].sum().reset_index())
+        table.insert(2, 'period', period)
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index=True)
+
+def compute_time_features(transactions, transfers, as_of=None, first_date=None):
+    """
+    Behavioural features from dated transactions and transfers.
+
+    Both inputs are sorted once by (client_code, date); window sums, counts
+    and recency then come from cumulative sums and binary searches over
+    those sorted arrays instead of per-client resampling.
+
+    Args:
+        transactions (pd.DataFrame): client_code, date, category, amount
+        transfers (pd.DataFrame): client_code, date, type, direction, amount, currency
+        as_of (pd.Timestamp): End of the recent window (default: last date in the data)
+        first_date (pd.Timestamp): Start of the monthly trend (default: first date in the data)
+
+    Returns:
+        tuple: (per-client features, per-period category spend)
+    """
+
+    transactions = transactions.dropna(subset=['date', 'amount']).sort_values(['client_code', 'date'], kind='stable')
+    transfers = transfers.dropna(subset=['date', 'amount']).sort_values(['client_code', 'date'], kind='stable')
+
+    client_codes = np.union1d(transactions['client_code'].unique(), transfers['client_code'].unique())
+    clients = np.arange(len(client_codes))
+
+    if as_of is None:
+        as_of = max(transactions['date'].max(), transfers['date'].max())
+    if first_date is None:
+        first_date = min(transactions['date'].min(), transfers['date'].min())
+    as_of = np.datetime64(pd.Timestamp(as_of), 's')
+    window_start = as_of - np.timedelta64(RECENT_WINDOW_DAYS, 'D')
+
+    first_month = pd.Timestamp(first_date).year * 12 + pd.Timestamp(first_date).month
+    num_months = pd.Timestamp(as_of).year * 12 + pd.Timestamp(as_of).month - first_month + 1
+
+    def month_index(dates):
+        return (dates.dt.year * 12 + dates.dt.month - first_month).to_numpy()
+
+    # Spending
+    tx_client = np.searchsorted(client_codes, transactions['client_code'].to_numpy())
+    tx_keys = event_keys(tx_client, transactions['date'])
+    tx_amount = transactions['amount'].to_numpy()
+    tx_month = month_index(transactions['date'])
+    tx_weeks = transactions['date'].dt.to_period('W').groupby(tx_client).nunique().reindex(clients, fill_value=0).to_numpy()
+
+    total_spend = np.bincount(tx_client, weights=tx_amount, minlength=len(clients))
+    spend_30d, _ = window_sums(tx_keys, tx_amount, clients, window_start, as_of)
+
+    # Transfers, in KZT like transfer_analyzer
+    tr_client = np.searchsorted(client_codes, transfers['client_code'].to_numpy())
+    tr_keys = event_keys(tr_client, transfers['date'])
+    tr_amount = (transfers['amount'] * transfers['currency'].astype(str).map(EXCHANGE_RATES).fillna(1)).to_numpy()
+    tr_month = month_index(transfers['date'])
+    inflow = np.where(transfers['direction'] == 'in', tr_amount, 0.0)
+    outflow = np.where(transfers['direction'] == 'out', tr_amount, 0.0)
+
+    inflow_30d, _ = window_sums(tr_keys, inflow, clients, window_start, as_of)
+    outflow_30d, _ = window_sums(tr_keys, outflow, clients, window_start, as_of)
+
+    # FX and loan-payment events: same search on the subset of keys
+    is_fx = transfers['type'].isin(['fx_buy', 'fx_sell']).to_numpy()
+    is_loan = (transfers['type'] == 'loan_payment_out').to_numpy()
+    _, fx_30d = window_sums(tr_keys[is_fx], np.ones(is_fx.sum()), clients, window_start, as_of)
+    _, loan_30d = window_sums(tr_keys[is_loan], np.ones(is_loan.sum()), clients, window_start, as_of)
+
+    active_months = np.zeros((len(clients), num_months), dtype=bool)
+    active_months[tx_client, tx_month] = True
+
+    features = pd.DataFrame({
+        'client_code': client_codes,
+        'avg_monthly_spend': np.round(total_spend / np.maximum(active_months.sum(axis=1), 1), 2),
+        'avg_weekly_spend': np.round(total_spend / np.maximum(tx_weeks, 1), 2),
+        'spend_30d': np.round(spend_30d, 2),
+        'spend_trend_slope': np.round(monthly_slope(tx_client, tx_month, tx_amount, len(clients), num_months), 2),
+        'inflow_velocity': np.round(inflow_30d / RECENT_WINDOW_DAYS, 2),
+        'outflow_velocity': np.round(outflow_30d / RECENT_WINDOW_DAYS, 2),
+        'net_flow_trend_slope': np.round(monthly_slope(tr_client, tr_month, inflow - outflow, len(clients), num_months), 2),
+        'fx_events_30d': fx_30d,
+        'loan_payments_30d': loan_30d,
+        'days_since_fx': np.round(days_since_last(tr_keys[is_fx], clients, as_of), 1),
+        'days_since_loan_payment': np.round(days_since_last(tr_keys[is_loan], clients, as_of), 1)
+    })
+
+    return features, category_spend_by_period(transactions)
+
+def build_time_features(transactions_folder='Transactions', transfers_folder='Transfers',
+                        output_file='time_features.csv', periods_file='category_spend_by_period.csv',
+                        memory_limit=None, run_stats=None, reporter=None):
+    """
+    Compute the time-window features and save them.
+
+    Args:
+        transactions_folder (str): Folder with per-client transaction CSVs
+        transfers_folder (str): Folder with per-client transfer CSVs
+        output_file (str): Per-client features CSV; None skips it
+        periods_file (str): Monthly/weekly spend per category CSV; None skips it
+        memory_limit (int): Memory budget in bytes; larger inputs are spilled
+                            to disk and processed by client_code partition
+        run_stats (dict): Optional dict that receives partition, spill and
+                          peak memory figures
+        reporter (Reporter): Where messages and progress go (default: console)
+
+    Returns:
+        tuple: (per-client features, spend per category and period), or
+               (None, None) when there is no dated data
+    """
+
+    reporter = as_reporter(reporter)
+
+    if run_stats is None:
+        run_stats = {}
+
+    plan = time_plan(transactions_folder, transfers_folder)
+    reporter.detail(lambda: f"Optimized plan:\n{explain(optimize(plan))}")
+
+    feature_parts = []
+    period_parts = []
+
+    for partition, outputs in enumerate(execute_partitioned(plan, memory_limit, run_stats), 1):
+        reporter.progress('time_features', partition, run_stats['partitions'])
+        if outputs['transactions'].empty and outputs['transfers'].empty:
+            continue
+        # A partitioned run reports the overall date range, so all partitions share one as_of
+        first_date, as_of = run_stats.get('date_range', [None, None])
+        features, periods = compute_time_features(outputs['transactions'], outputs['transfers'], as_of, first_date)
+        feature_parts.append(features)
+        period_parts.append(periods)
+
+    reporter.skipped_files(run_stats)
+
+    if not feature_parts:
+        reporter.info("No dated transactions or transfers found!")
+        return None, None
+
+    if run_stats.get('partitions', 1) > 1:
+        reporter.info(f"Processed {run_stats['partitions']} partitions, spilled {format_bytes(run_stats['spilled_bytes'])} to disk")
+
+    # Sort by key, with categories as text, so partitioned runs give the same rows in the same order
+    features_df = pd.concat(feature_parts, ignore_index=True).sort_values('client_code', kind='stable').reset_index(drop=True)
+    periods_df = pd.concat(period_parts, ignore_index=True).astype({'category': str})
+    periods_df = periods_df.sort_values(['client_code', 'period', 'period_start', 'category'], kind='stable').reset_index(drop=True)
+
+    if output_file:
+        write_csv(features_df, output_file)
+        reporter.info(f"\nTime features saved to: {output_file}")
+    if periods_file:
+        write_csv(periods_df, periods_file)
+        reporter.info(f"Spend per category and period saved to: {periods_file}")
+
+    reporter.info(f"Clients: {len(features_df)}")
+    reporter.info(f"Clients with FX activity in the last {RECENT_WINDOW_DAYS} days: {(features_df['fx_events_30d'] > 0).sum()}")
+    reporter.info(f"Clients with growing monthly spend: {(features_df['spend_trend_slope'] > 0).sum()}")
+
+    return features_df, periods_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-window behavioural features per client")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    args = parser.parse_args()
+
+    run_stats = {}
+    try:
+        features, _ = build_time_features(memory_limit=parse_memory_limit(args.memory_limit), run_stats=run_stats)
+        record_stats(args.stats_file, 'time_features', run_stats)
+
+        if features is not None:
+            print(f"\nFirst 5 clients:")
+            print(features.head().to_string(index=False))
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found - {e}")
@@ -1,62 +1,46 @@
 import pandas as pd
 import os
-import glob
+import argparse
 from pathlib import Path
 
+from schema import TRANSFERS_SCHEMA
+from reader import find_files, write_csv
+from plan import Scan, Project, execute_partitioned, optimize, explain
+from spill import parse_memory_limit, format_bytes, record_stats
+from report import as_reporter
+
+# Only these columns are read from the transfer files
+TRANSFER_COLUMNS = ['client_code', 'name', 'product', 'type', 'direction', 'amount', 'currency']
+
+# Exchange rates used to bring every transfer to KZT
+EXCHANGE_RATES = {
+    'EUR': 633,
+    'USD': 540,
+    'KZT': 1
+}
+
+# Minimum number of transfers for a client to count as FX / loan-paying
+FX_TRANSACTION_THRESHOLD = 5
+LOAN_PAYMENT_THRESHOLD = 10
+
 def convert_to_kzt(amount, currency):
     """Convert amount to KZT based on exchange rates"""
-    exchange_rates = {
-        'EUR': 633,
-        'USD': 540,
-        'KZT': 1
-    }
-    return amount * exchange_rates.get(currency, 1)
+    return amount * EXCHANGE_RATES.get(currency, 1)
 
-def process_transfers():
-    # Define the folder path
-    transfers_folder = 'Transfers'
-    
-    # Check if Transfers folder exists
-    if not os.path.exists(transfers_folder):
-        print(f"Error: {transfers_folder} folder not found!")
-        return
-    
-    # Get all CSV files in the Transfers folder
-    csv_files = glob.glob(os.path.join(transfers_folder, '*.csv'))
-    
-    if not csv_files:
-        print(f"No CSV files found in {transfers_folder} folder!")
-        return
+def transfer_plan(transfers_folder):
+    """Plan for the transfer summary: every transfer, reduced to the used columns"""
+    return {'transfers': Project(Scan(transfers_folder, TRANSFERS_SCHEMA), TRANSFER_COLUMNS)}
+
+def summarize_transfers(combined_df):
+    """
+    Per (client, product) inflows, outflows and activity flags.
     
-    print(f"Found {len(csv_files)} CSV files to process...")
-    
-    # List to store all dataframes
-    all_data = []
-    
-    # Process each CSV file
-    for file_path in csv_files:
-        try:
-            print(f"Processing: {os.path.basename(file_path)}")
-            
-            # Read CSV file
-            df = pd.read_csv(file_path)
-            
-            # Clean column names (remove extra spaces)
-            df.columns = df.columns.str.strip()
-            
-            # Add to combined data
-            all_data.append(df)
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {str(e)}")
-            continue
-    
-    if not all_data:
-        print("No valid data found to process!")
-        return
+    Args:
+        combined_df (pd.DataFrame): Transfers of a set of clients
     
-    # Combine all dataframes
-    combined_df = pd.concat(all_data, ignore_index=True)
+    Returns:
+        list: One summary dict per group
+    """
     
     # Convert amounts to KZT
     combined_df['amount_kzt'] = combined_df.apply(
@@ -66,7 +50,7 @@ def process_transfers():
     # Group by client and calculate aggregations
     summary_data = []
     
-    for (client_code, name, product), group in combined_df.groupby(['client_code', 'name', 'product']):
+    for (client_code, name, product), group in combined_df.groupby(['client_code', 'name', 'product'], observed=True):
         # Calculate inflows and outflows
         inflows = group[group['direction'] == 'in']['amount_kzt'].sum()
         outflows = group[group['direction'] == 'out']['amount_kzt'].sum()
@@ -74,11 +58,11 @@ def process_transfers():
         
         # Count FX transactions
         fx_transactions = group[group['type'].isin(['fx_buy', 'fx_sell'])].shape[0]
-        have_fx = 1 if fx_transactions >= 5 else 0
+        have_fx = 1 if fx_transactions >= FX_TRANSACTION_THRESHOLD else 0
         
         # Count loan payment out transactions
         loan_payment_transactions = group[group['type'] == 'loan_payment_out'].shape[0]
-        loan_p_o = 1 if loan_payment_transactions >= 10 else 0
+        loan_p_o = 1 if loan_payment_transactions >= LOAN_PAYMENT_THRESHOLD else 0
         
         summary_data.append({
             'client_code': int(client_code),
@@ -91,31 +75,103 @@ def process_transfers():
             'loan_p_o': loan_p_o
         })
     
+    return summary_data
+
+def process_transfers(memory_limit=None, run_stats=None, transfers_folder='Transfers',
+                      output_file='Transfers/transfer_summary.csv', reporter=None):
+    """
+    Summarize all transfers into Transfers/transfer_summary.csv.
+    
+    Args:
+        memory_limit (int): Memory budget in bytes; larger inputs are spilled
+                            to disk and processed by client_code partition
+        run_stats (dict): Optional dict that receives partition, spill and
+                          peak memory figures
+        transfers_folder (str): Folder with per-client transfer CSVs
+        output_file (str): Summary CSV; None only returns the summary
+        reporter (Reporter): Where messages and progress go (default: console)
+    
+    Returns:
+        pd.DataFrame: Per (client, product) summary, or None on failure
+    """
+    
+    reporter = as_reporter(reporter)
+    
+    # Check if Transfers folder exists
+    if not os.path.exists(transfers_folder):
+        reporter.error(f"Error: {transfers_folder} folder not found!", FileNotFoundError(transfers_folder))
+        return
+    
+    # Get all transfer files in the Transfers folder (skips transfer_summary.csv)
+    csv_files = find_files(transfers_folder, TRANSFERS_SCHEMA)
+    
+    if not csv_files:
+        reporter.info(f"No CSV files found in {transfers_folder} folder!")
+        return
+    
+    reporter.info(f"Found {len(csv_files)} CSV files to process...")
+    
+    # Load through the plan so only the used columns are parsed
+    plan = transfer_plan(transfers_folder)
+    reporter.detail(lambda: f"\nOptimized plan:\n{explain(optimize(plan))}")
+    
+    if run_stats is None:
+        run_stats = {}
+    
+    # Under a memory limit the clients are processed one hash partition at a time
+    summary_data = []
+    
+    try:
+        for partition, outputs in enumerate(execute_partitioned(plan, memory_limit, run_stats), 1):
+            combined_df = outputs['transfers']
+            if not combined_df.empty:
+                summary_data.extend(summarize_transfers(combined_df))
+            reporter.progress('transfer_analyzer', partition, run_stats['partitions'])
+    except Exception as e:
+        reporter.error(f"Error processing {transfers_folder}: {str(e)}", e)
+        return
+    
+    reporter.skipped_files(run_stats)
+    
+    if not summary_data:
+        reporter.info("No valid data found to process!")
+        return
+    
+    if run_stats.get('partitions', 1) > 1:
+        reporter.info(f"Processed {run_stats['partitions']} partitions, spilled {format_bytes(run_stats['spilled_bytes'])} to disk")
+    
     # Create summary dataframe
     summary_df = pd.DataFrame(summary_data)
     
     # Sort by client_code for better organization
     summary_df = summary_df.sort_values('client_code')
     
-    # Create output filename
-    output_file = os.path.join(transfers_folder, 'transfer_summary.csv')
-    
     # Save to CSV
-    summary_df.to_csv(output_file, index=False)
-    
-    print(f"\nProcessing completed successfully!")
-    print(f"Summary saved to: {output_file}")
-    print(f"\nSummary statistics:")
-    print(f"Total clients processed: {len(summary_df)}")
-    print(f"Total inflows: {summary_df['in'].sum():,.2f} KZT")
-    print(f"Total outflows: {summary_df['out'].sum():,.2f} KZT")
-    print(f"Net total: {summary_df['total'].sum():,.2f} KZT")
-    print(f"Clients with FX activity (≥5 transactions): {summary_df['have_fx'].sum()}")
-    print(f"Clients with loan payment activity (≥5 transactions): {summary_df['loan_p_o'].sum()}")
+    if output_file:
+        write_csv(summary_df, output_file)
+    
+    reporter.info(f"\nProcessing completed successfully!")
+    if output_file:
+        reporter.info(f"Summary saved to: {output_file}")
+    reporter.info(f"\nSummary statistics:")
+    reporter.info(f"Total clients processed: {len(summary_df)}")
+    reporter.info(f"Total inflows: {summary_df['in'].sum():,.2f} KZT")
+    reporter.info(f"Total outflows: {summary_df['out'].sum():,.2f} KZT")
+    reporter.info(f"Net total: {summary_df['total'].sum():,.2f} KZT")
+    reporter.info(f"Clients with FX activity (≥{FX_TRANSACTION_THRESHOLD} transactions): {summary_df['have_fx'].sum()}")
+    reporter.info(f"Clients with loan payment activity (≥{LOAN_PAYMENT_THRESHOLD} transactions): {summary_df['loan_p_o'].sum()}")
     
     # Display first few rows
-    print(f"\nFirst 5 rows of summary:")
-    print(summary_df.head().to_string(index=False))
+    reporter.detail(lambda: f"\nFirst 5 rows of summary:\n{summary_df.head().to_string(index=False)}")
+    
+    return summary_df
 
 if __name__ == "__main__":
-    process_transfers()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Summarize transfers per client")
+    parser.add_argument('--memory-limit', help="memory budget, e.g. 512MB; larger inputs are spilled to disk")
+    parser.add_argument('--stats-file', help="append run statistics to this JSON lines file")
+    args = parser.parse_args()
+    
+    run_stats = {}
+    process_transfers(memory_limit=parse_memory_limit(args.memory_limit), run_stats=run_stats)
+    record_stats(args.stats_file, 'transfer_analyzer', run_stats)
\ No newline at end of file